@@ -0,0 +1,29 @@
+"""
+Indexes the storage GC needs to collect released blobs (StorageGC.collect_released)
+and recounts blob_refs, which now also counts the region crops of source
+documents. Run from the backend directory:
+
+    python add_blob_ref_indexes.py
+"""
+from sqlalchemy import text
+from app.database import SessionLocal, engine
+from app.services.blob_refs import rebuild_blob_refs
+
+statements = [
+    "CREATE INDEX IF NOT EXISTS ix_blob_refs_refcount_updated_at ON blob_refs (refcount, updated_at)",
+    "CREATE INDEX IF NOT EXISTS ix_solution_attempts_image_path ON solution_attempts (image_path)",
+    "CREATE INDEX IF NOT EXISTS ix_source_documents_file_path ON source_documents (file_path)",
+]
+
+if __name__ == "__main__":
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        for i, stmt in enumerate(statements, 1):
+            print(f"Executing step {i}...")
+            conn.execute(text(stmt))
+    db = SessionLocal()
+    try:
+        print(f"Recounted {rebuild_blob_refs(db)} blobs.")
+    finally:
+        db.close()
+    print("Migration complete.")
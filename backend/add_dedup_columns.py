@@ -0,0 +1,50 @@
+from sqlalchemy import create_engine, text
+import os
+from dotenv import load_dotenv
+
+def add_dedup_columns():
+    if os.path.exists("backend/.env"):
+        load_dotenv("backend/.env")
+    else:
+        load_dotenv()
+
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        print("DATABASE_URL not found in .env")
+        return
+
+    print(f"Connecting to database...")
+    engine = create_engine(db_url)
+
+    statements = [
+        "ALTER TABLE problems ADD COLUMN IF NOT EXISTS image_hash VARCHAR(16)",
+        "ALTER TABLE problems ADD COLUMN IF NOT EXISTS latex_simhash VARCHAR(16)",
+        "ALTER TABLE problems ADD COLUMN IF NOT EXISTS duplicate_of_id INTEGER REFERENCES problems(id)",
+        """
+        CREATE TABLE IF NOT EXISTS problem_fingerprints (
+            id SERIAL PRIMARY KEY,
+            problem_id INTEGER NOT NULL REFERENCES problems(id) ON DELETE CASCADE,
+            kind VARCHAR(10) NOT NULL,
+            band_key VARCHAR(8) NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS ix_problem_fingerprints_id ON problem_fingerprints (id)",
+        "CREATE INDEX IF NOT EXISTS ix_problem_fingerprints_problem_id ON problem_fingerprints (problem_id)",
+        "CREATE INDEX IF NOT EXISTS ix_problem_fingerprints_kind_band ON problem_fingerprints (kind, band_key)",
+        "CREATE INDEX IF NOT EXISTS ix_problems_image_path ON problems (image_path)",
+    ]
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        for i, stmt in enumerate(statements, 1):
+            try:
+                print(f"Executing step {i}...")
+                conn.execute(text(stmt))
+            except Exception as e:
+                print(f"Error in step {i}: {e}")
+                return
+
+    print("Migration complete. Run backfill_fingerprints.py to index existing problems.")
+
+if __name__ == "__main__":
+    add_dedup_columns()
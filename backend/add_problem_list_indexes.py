@@ -0,0 +1,39 @@
+from sqlalchemy import create_engine, text
+import os
+from dotenv import load_dotenv
+
+def add_problem_list_indexes():
+    if os.path.exists("backend/.env"):
+        load_dotenv("backend/.env")
+    else:
+        load_dotenv()
+
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        print("DATABASE_URL not found in .env")
+        return
+
+    print(f"Connecting to database...")
+    engine = create_engine(db_url)
+
+    # CONCURRENTLY so the migration can run against a live database
+    indexes = [
+        ("ix_problems_user_created_id",
+         "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_problems_user_created_id ON problems (user_id, created_at, id)"),
+        ("ix_learning_records_user_problem",
+         "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_learning_records_user_problem ON learning_records (user_id, problem_id)"),
+    ]
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        for name, sql in indexes:
+            try:
+                print(f"Creating index {name}...")
+                conn.execute(text(sql))
+            except Exception as e:
+                print(f"Error creating {name}: {e}")
+
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    add_problem_list_indexes()
@@ -0,0 +1,126 @@
+from sqlalchemy import create_engine, text
+import os
+from dotenv import load_dotenv
+
+# Normalization mirrors app/services/search_service.normalize_search_text():
+# LaTeX commands -> words, punctuation dropped, CJK runs -> overlapping bigrams.
+NORMALIZE_FUNCTION_SQL = r"""
+CREATE OR REPLACE FUNCTION mathrob_search_normalize(input text) RETURNS text AS $$
+DECLARE
+    txt text;
+    run text;
+    grams text := '';
+    i int;
+BEGIN
+    IF input IS NULL THEN
+        RETURN '';
+    END IF;
+    txt := lower(input);
+    txt := regexp_replace(txt, '\\([a-z]+)', ' \1 ', 'g');
+    txt := regexp_replace(txt, '[^0-9a-z\u4e00-\u9fff]+', ' ', 'g');
+    FOR run IN SELECT (regexp_matches(txt, '[\u4e00-\u9fff]+', 'g'))[1] LOOP
+        IF char_length(run) = 1 THEN
+            grams := grams || ' ' || run;
+        ELSE
+            FOR i IN 1 .. char_length(run) - 1 LOOP
+                grams := grams || ' ' || substr(run, i, 2);
+            END LOOP;
+        END IF;
+    END LOOP;
+    txt := regexp_replace(txt, '[\u4e00-\u9fff]+', ' ', 'g');
+    RETURN btrim(regexp_replace(txt || ' ' || grams, '\s+', ' ', 'g'));
+END
+$$ LANGUAGE plpgsql IMMUTABLE;
+"""
+
+TRIGGER_FUNCTION_SQL = r"""
+CREATE OR REPLACE FUNCTION mathrob_problems_search_update() RETURNS trigger AS $$
+DECLARE
+    latex_doc text := mathrob_search_normalize(NEW.latex_content);
+    kp_text text := '';
+    kp_doc text;
+    solution_doc text := mathrob_search_normalize(NEW.ai_analysis->>'solution');
+BEGIN
+    IF json_typeof(NEW.ai_analysis->'knowledge_points') = 'array' THEN
+        SELECT coalesce(string_agg(value, ' '), '') INTO kp_text
+        FROM json_array_elements_text(NEW.ai_analysis->'knowledge_points');
+    END IF;
+    kp_doc := mathrob_search_normalize(kp_text || ' ' || coalesce(NEW.knowledge_path, ''));
+    NEW.search_document := btrim(latex_doc || ' ' || kp_doc || ' ' || solution_doc);
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', latex_doc), 'A') ||
+        setweight(to_tsvector('simple', kp_doc), 'B') ||
+        setweight(to_tsvector('simple', solution_doc), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+"""
+
+def add_problem_search_index():
+    if os.path.exists("backend/.env"):
+        load_dotenv("backend/.env")
+    else:
+        load_dotenv()
+
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        print("DATABASE_URL not found in .env")
+        return
+
+    print(f"Connecting to database...")
+    engine = create_engine(db_url)
+
+    steps = [
+        ("Enable pg_trgm", "CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+        ("Add search columns",
+         "ALTER TABLE problems ADD COLUMN IF NOT EXISTS search_document TEXT, ADD COLUMN IF NOT EXISTS search_vector TSVECTOR"),
+        ("Create normalize function", NORMALIZE_FUNCTION_SQL),
+        ("Create trigger function", TRIGGER_FUNCTION_SQL),
+        ("Drop old trigger", "DROP TRIGGER IF EXISTS problems_search_update ON problems"),
+        ("Create trigger",
+         "CREATE TRIGGER problems_search_update BEFORE INSERT OR UPDATE OF latex_content, ai_analysis, knowledge_path "
+         "ON problems FOR EACH ROW EXECUTE FUNCTION mathrob_problems_search_update()"),
+    ]
+
+    indexes = [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_problems_search_vector ON problems USING GIN (search_vector)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_problems_search_document_trgm ON problems USING GIN (search_document gin_trgm_ops)",
+    ]
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        for i, (label, sql) in enumerate(steps, 1):
+            try:
+                print(f"Step {i}: {label}...")
+                conn.execute(text(sql))
+            except Exception as e:
+                print(f"Error in step {i}: {e}")
+                return
+
+        # Backfill in batches; touching latex_content fires the trigger
+        print("Backfilling search documents...")
+        batch_size = 1000
+        last_id = 0
+        while True:
+            result = conn.execute(text(
+                "UPDATE problems SET latex_content = latex_content "
+                "WHERE id IN (SELECT id FROM problems WHERE id > :last_id ORDER BY id LIMIT :batch) "
+                "RETURNING id"
+            ), {"last_id": last_id, "batch": batch_size})
+            ids = [row[0] for row in result]
+            if not ids:
+                break
+            last_id = max(ids)
+            print(f"  ...up to id {last_id}")
+
+        for sql in indexes:
+            try:
+                print(f"Executing: {sql}")
+                conn.execute(text(sql))
+            except Exception as e:
+                print(f"Error creating index: {e}")
+
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    add_problem_search_index()
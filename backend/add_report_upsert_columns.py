@@ -0,0 +1,54 @@
+from sqlalchemy import create_engine, text
+import os
+from dotenv import load_dotenv
+
+def add_report_upsert_columns():
+    if os.path.exists("backend/.env"):
+        load_dotenv("backend/.env")
+    else:
+        load_dotenv()
+
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        print("DATABASE_URL not found in .env")
+        return
+
+    print(f"Connecting to database...")
+    engine = create_engine(db_url)
+
+    statements = [
+        ("Add stats_hash column", "ALTER TABLE weekly_reports ADD COLUMN IF NOT EXISTS stats_hash VARCHAR(64)"),
+        # Repeated "generate" clicks used to insert a new row each time; keep the newest per (user, week)
+        ("Remove duplicate reports", """
+            DELETE FROM weekly_reports w
+            USING weekly_reports newer
+            WHERE w.user_id = newer.user_id
+              AND w.week_start = newer.week_start
+              AND w.id < newer.id
+        """),
+        ("Add unique (user_id, week_start)", """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_weekly_reports_user_week') THEN
+                    ALTER TABLE weekly_reports ADD CONSTRAINT uq_weekly_reports_user_week UNIQUE (user_id, week_start);
+                END IF;
+            END $$;
+        """),
+    ]
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        for label, sql in statements:
+            try:
+                print(f"{label}...")
+                result = conn.execute(text(sql))
+                if result.rowcount and result.rowcount > 0:
+                    print(f"  {result.rowcount} rows affected")
+            except Exception as e:
+                print(f"Error in '{label}': {e}")
+                return
+
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    add_report_upsert_columns()
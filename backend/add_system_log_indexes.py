@@ -0,0 +1,45 @@
+from sqlalchemy import create_engine, text
+import os
+from dotenv import load_dotenv
+
+def add_system_log_indexes():
+    if os.path.exists("backend/.env"):
+        load_dotenv("backend/.env")
+    else:
+        load_dotenv()
+
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        print("DATABASE_URL not found in .env")
+        return
+
+    print(f"Connecting to database...")
+    engine = create_engine(db_url)
+
+    # CONCURRENTLY so the migration can run against a live database
+    steps = [
+        ("model column",
+         "ALTER TABLE system_logs ADD COLUMN IF NOT EXISTS model VARCHAR(100)"),
+        # Older rows only name the models in details; the last model tried is the one that failed
+        ("model backfill",
+         "UPDATE system_logs SET model = COALESCE(details->>'fallback', details->>'primary') "
+         "WHERE model IS NULL AND details IS NOT NULL AND COALESCE(details->>'fallback', details->>'primary') IS NOT NULL"),
+        ("ix_system_logs_created_id",
+         "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_system_logs_created_id ON system_logs (created_at DESC, id DESC)"),
+        ("ix_system_logs_category_created",
+         "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_system_logs_category_created ON system_logs (category, created_at)"),
+    ]
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        for name, sql in steps:
+            try:
+                print(f"Applying {name}...")
+                conn.execute(text(sql))
+            except Exception as e:
+                print(f"Error applying {name}: {e}")
+
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    add_system_log_indexes()
@@ -0,0 +1,37 @@
+from sqlalchemy import create_engine, text
+import os
+from dotenv import load_dotenv
+
+def add_user_class_column():
+    if os.path.exists("backend/.env"):
+        load_dotenv("backend/.env")
+    else:
+        load_dotenv()
+
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        print("DATABASE_URL not found in .env")
+        return
+
+    print(f"Connecting to database...")
+    engine = create_engine(db_url)
+
+    statements = [
+        ("Add class_name column", "ALTER TABLE users ADD COLUMN IF NOT EXISTS class_name VARCHAR"),
+        ("Add class_name index", "CREATE INDEX IF NOT EXISTS ix_users_class_name ON users (class_name)"),
+    ]
+
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level="AUTOCOMMIT")
+        for label, sql in statements:
+            try:
+                print(f"{label}...")
+                conn.execute(text(sql))
+            except Exception as e:
+                print(f"Error in '{label}': {e}")
+                return
+
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    add_user_class_column()
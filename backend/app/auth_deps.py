@@ -1,7 +1,7 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from .database import get_db
+from .database import get_db, SessionLocal
 from .models import User
 from .services.auth_service import auth_service
 
@@ -30,3 +30,14 @@ async def get_current_active_admin(current_user: User = Depends(get_current_user
             detail="The user doesn't have enough privileges"
         )
     return current_user
+
+def is_admin_token(token: str) -> bool:
+    """Token check for code outside the dependency system (e.g. middleware)."""
+    username = auth_service.decode_token(token)
+    if username is None:
+        return False
+    db = SessionLocal()
+    try:
+        return bool(db.query(User.is_admin).filter(User.username == username).scalar())
+    finally:
+        db.close()
@@ -1,42 +1,135 @@
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import threading
+import asyncio
 import os
+from typing import Optional
 from .database import engine, Base
 from .services.file_watcher import FileWatcher
-from .services.ai_service import AIService
+from .services.knowledge_registry import knowledge_registry
+from .services.scheduler import scheduler
+from .services.report_jobs import report_jobs
+from .services.artifact_store import artifact_store
+from .services.ai_usage import ai_usage
+from .services.log_sink import configure_logging, get_logger, system_log_handler, purge_system_logs
+from .services.metrics import MetricsMiddleware, registry as metrics_registry, WATCHER_QUEUE_DEPTH, IS_LEADER
+from .services.tracing import TracingMiddleware, instrument_sqlalchemy
+from .services.profiler import ProfileMiddleware
+from .services.upload_ingest import UploadLimitMiddleware
+from .services.resumable_uploads import resumable_uploads
+from .services.document_ingest import document_rasterizer
+from .services.blob_refs import track_blob_references
+from .services.storage_gc import storage_gc
+from .services.leader import leader
+from .auth_deps import is_admin_token
 
-# Initialize AI Service
-ai_service = AIService()
+configure_logging()
+logger = get_logger("app")
+instrument_sqlalchemy(engine)
+track_blob_references()
 
-# Ensure uploads dir exists
-UPLOAD_DIR = os.path.join(os.getcwd(), "backend/uploads")
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Scanner drop directory (SCAN_DIR, default scan_data/ next to backend/)
+SCAN_DIR = os.getenv("SCAN_DIR") or os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "scan_data")
+main_loop: Optional[asyncio.AbstractEventLoop] = None
 
-# Callback for new files
+# Callback for new files, on the watcher's thread
 def on_new_scan(file_path):
-    print(f"Processing new file: {file_path}")
-    # In a real app, this would trigger an async task to call AI service and save to DB
-    # asyncio.run(process_scan(file_path)) 
+    from .routers.upload import ingest_watched_file
+    if main_loop is None:
+        return
+    logger.info(f"Processing new file: {file_path}")
+    asyncio.run_coroutine_threadsafe(ingest_watched_file(file_path), main_loop)
 
 # Initialize File Watcher
-watcher = FileWatcher(UPLOAD_DIR, on_new_scan)
+watcher = FileWatcher(SCAN_DIR, on_new_scan)
+metrics_registry.register_collector(lambda: WATCHER_QUEUE_DEPTH.set(watcher.queue_depth()))
+metrics_registry.register_collector(lambda: IS_LEADER.set(1 if leader.is_leader() else 0))
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    watcher_thread = threading.Thread(target=watcher.start)
-    watcher_thread.daemon = True
-    watcher_thread.start()
+    global main_loop
+    main_loop = asyncio.get_running_loop()
+    system_log_handler.start()
+    ai_usage.start()
+    try:
+        count = knowledge_registry.load()
+        logger.info(f"Loaded {count} knowledge nodes")
+    except Exception as e:
+        logger.error(f"Failed to load knowledge nodes: {e}")
+
+    # Whatever must happen once per deployment runs in the elected worker only:
+    # the scan watcher here, leader_only scheduled jobs through the scheduler
+    leader.on_change(watcher.start, watcher.stop)
+    leader.on_change(demoted=storage_gc.stop)
+
+    # Monday morning: last week's report for every user
+    scheduler.add_weekly_job(
+        "weekly_reports",
+        lambda: report_jobs.submit_all_users(),
+        weekday=0,
+        hour=int(os.getenv("REPORT_SCHEDULE_HOUR", "6"))
+    )
+    scheduler.add_daily_job(
+        "system_log_retention",
+        purge_system_logs,
+        hour=int(os.getenv("SYSTEM_LOG_RETENTION_HOUR", "3"))
+    )
+    # Partial uploads are node-local: every node cleans its own
+    scheduler.add_daily_job(
+        "resumable_upload_cleanup",
+        resumable_uploads.purge_expired,
+        hour=int(os.getenv("RESUMABLE_UPLOAD_CLEANUP_HOUR", "4")),
+        leader_only=False
+    )
+    if storage_gc.mode != "off":
+        # Weekly mark and sweep; on the other days only blobs whose count dropped to 0
+        scheduler.add_weekly_job(
+            "storage_gc",
+            storage_gc.run_in_background,
+            weekday=int(os.getenv("STORAGE_GC_FULL_WEEKDAY", "6")),
+            hour=int(os.getenv("STORAGE_GC_HOUR", "5"))
+        )
+        scheduler.add_daily_job(
+            "storage_gc_released",
+            lambda: storage_gc.run_in_background(full=False),
+            hour=int(os.getenv("STORAGE_GC_HOUR", "5"))
+        )
+    # Report thumbnails are a node-local cache: every node expires its own
+    scheduler.add_daily_job(
+        "report_thumbnail_expiry",
+        lambda: threading.Thread(target=storage_gc.expire_thumbnails, name="thumbnail-expiry", daemon=True).start(),
+        hour=int(os.getenv("STORAGE_GC_HOUR", "5")),
+        leader_only=False
+    )
+    if artifact_store.backend.remote:
+        scheduler.add_daily_job(
+            "storage_working_copies",
+            lambda: threading.Thread(target=storage_gc.evict_working_copies, name="storage-evict", daemon=True).start(),
+            hour=int(os.getenv("STORAGE_GC_HOUR", "5")),
+            leader_only=False
+        )
+    scheduler.start()
+    leader.start()
     yield
     # Shutdown
-    watcher.stop()
+    scheduler.stop()
+    leader.stop() # stops the watcher and hands leadership to another worker
+    storage_gc.stop()
+    report_jobs.shutdown()
+    document_rasterizer.shutdown()
+    ai_usage.stop() # flushes pending usage
+    system_log_handler.stop() # flushes buffered log entries
 
 app = FastAPI(title="MathRob API", version="0.1.0", lifespan=lifespan)
 
+# Refuses oversized multipart bodies before they are spooled; inside CORS so browsers can read the 413
+app.add_middleware(UploadLimitMiddleware)
+
+# Inside CORS, so CORS headers are added to profiles too
+app.add_middleware(ProfileMiddleware, is_allowed=is_admin_token)
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -44,19 +137,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Trace-Id", "X-Profile-Samples", "X-Profile-Duration-Ms", "X-Profile-Status",
+                    "Location", "Upload-Offset", "Upload-Length", "Upload-Expires"],
 )
+app.add_middleware(TracingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
-# Mount static files
-app.mount("/static", StaticFiles(directory=UPLOAD_DIR), name="static")
+# Uploaded files are served by the files router (/static/...) with ETag and range support
 
 
-from .routers import api, upload, auth, users, settings, logs
+from .routers import api, upload, auth, users, settings, logs, search, files, metrics, usage
 app.include_router(auth.router, prefix="/api")
 app.include_router(users.router, prefix="/api")
 app.include_router(api.router, prefix="/api")
 app.include_router(upload.router, prefix="/api") # or just /upload if preferred, keeping consistency
 app.include_router(settings.router, prefix="/api")
 app.include_router(logs.router, prefix="/api")
+app.include_router(search.router, prefix="/api")
+app.include_router(usage.router, prefix="/api")
+app.include_router(files.router)
+app.include_router(metrics.router)
 
 @app.get("/")
 def read_root():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, ForeignKey, Enum as SAEnum, Float, Date, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, JSON, ForeignKey, Enum as SAEnum, Float, Date, Boolean, Index, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -22,6 +22,8 @@ class User(Base):
     hashed_password = Column(String)
     name = Column(String, index=True, nullable=True)
     is_admin = Column(Boolean, default=False)
+    class_name = Column(String, index=True, nullable=True) # Class/cohort for group reports
+    ai_daily_token_quota = Column(Integer, nullable=True) # None: AI_DAILY_TOKEN_QUOTA default, 0: unlimited
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class KnowledgeNode(Base):
@@ -31,6 +33,46 @@ class KnowledgeNode(Base):
     name = Column(String(255), nullable=False)
     path = Column(String, nullable=False, index=True) # ltree is stored as string in SQLAlchemy usually unless using geoalchemy/specific extensions
 
+class BlobRef(Base):
+    """How many rows reference a stored blob (services/blob_refs keeps it up to date)."""
+    __tablename__ = "blob_refs"
+
+    name = Column(String, primary_key=True) # store-relative, e.g. blobs/ab/cd/<sha256>.jpg
+    refcount = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow) # last change; when it dropped to 0 for unreferenced blobs
+
+    __table_args__ = (
+        # Storage GC: blobs released longer ago than the grace period
+        Index("ix_blob_refs_refcount_updated_at", "refcount", "updated_at"),
+    )
+
+class SourceDocument(Base):
+    """
+    A scanned PDF or worksheet photo that was split into problems. `regions`
+    lists every problem region found: [{page, region, box, image_path,
+    problem_id, error}], so a re-ingest only retries the regions that failed.
+    """
+    __tablename__ = "source_documents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    content_hash = Column(String(64), nullable=False) # sha256 of the file, as in its stored name
+    file_path = Column(String, nullable=False)
+    filename = Column(String(255), nullable=True)
+    page_count = Column(Integer, nullable=False, default=0)
+    status = Column(String(20), nullable=False, default="processing") # processing, complete, partial
+    regions = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    user = relationship("User", backref="source_documents")
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "content_hash", name="uq_source_documents_user_hash"),
+        Index("ix_source_documents_content_hash", "content_hash"),
+        Index("ix_source_documents_file_path", "file_path"),
+    )
+
 class Problem(Base):
     __tablename__ = "problems"
 
@@ -43,6 +85,11 @@ class Problem(Base):
     knowledge_path = Column(String, nullable=True, index=True) 
     ai_model = Column(String, nullable=True) # Successfully used AI model name
     source_problem_id = Column(Integer, ForeignKey("problems.id"), nullable=True) # For generated variations
+    image_hash = Column(String(16), nullable=True) # 64-bit perceptual (difference) hash, hex
+    latex_simhash = Column(String(16), nullable=True) # 64-bit SimHash of normalized latex_content, hex
+    duplicate_of_id = Column(Integer, ForeignKey("problems.id"), nullable=True) # Canonical problem this one duplicates
+    source_document_id = Column(Integer, ForeignKey("source_documents.id"), nullable=True, index=True) # Cut from this document
+    source_page = Column(Integer, nullable=True) # 1-based page within the source document
     created_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User", backref="problems")
@@ -50,6 +97,30 @@ class Problem(Base):
     solution_attempts = relationship("SolutionAttempt", back_populates="problem")
     practice_problems = relationship("PracticeProblem", back_populates="source_problem")
 
+    __table_args__ = (
+        # Keyset pagination of a user's problem list: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        Index("ix_problems_user_created_id", "user_id", "created_at", "id"),
+        # Byte-identical uploads share a blob name: the exact-duplicate lookup
+        Index("ix_problems_image_path", "image_path"),
+    )
+
+class ProblemFingerprint(Base):
+    """
+    LSH bands of a problem's image hash / latex SimHash. Each 64-bit hash is split
+    into 8 one-byte bands; two hashes within Hamming distance 7 share at least one
+    band, so near-duplicate candidates are found with a single indexed lookup.
+    """
+    __tablename__ = "problem_fingerprints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    problem_id = Column(Integer, ForeignKey("problems.id", ondelete="CASCADE"), nullable=False, index=True)
+    kind = Column(String(10), nullable=False) # image, latex
+    band_key = Column(String(8), nullable=False) # "<band>:<hex byte>", e.g. "3:af"
+
+    __table_args__ = (
+        Index("ix_problem_fingerprints_kind_band", "kind", "band_key"),
+    )
+
 class PracticeProblem(Base):
     __tablename__ = "practice_problems"
 
@@ -66,6 +137,24 @@ class PracticeProblem(Base):
     user = relationship("User", backref="practice_problems")
     source_problem = relationship("Problem", back_populates="practice_problems")
 
+class ProblemEmbedding(Base):
+    """Text embedding of a Problem / PracticeProblem, stored as little-endian float16 bytes."""
+    __tablename__ = "problem_embeddings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_type = Column(String(10), nullable=False) # problem, practice
+    source_id = Column(Integer, nullable=False)
+    knowledge_path = Column(String, nullable=True)
+    model = Column(String, nullable=False)
+    dim = Column(Integer, nullable=False)
+    vector = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("source_type", "source_id", name="uq_problem_embeddings_source"),
+        Index("ix_problem_embeddings_path_id", "knowledge_path", "id"),
+    )
+
 class KnowledgePoint(Base):
     __tablename__ = "knowledge_points"
 
@@ -95,6 +184,10 @@ class LearningRecord(Base):
     user = relationship("User", backref="learning_records")
     problem = relationship("Problem", back_populates="learning_records")
 
+    __table_args__ = (
+        Index("ix_learning_records_user_problem", "user_id", "problem_id"),
+    )
+
 class SolutionAttempt(Base):
     __tablename__ = "solution_attempts"
 
@@ -108,6 +201,10 @@ class SolutionAttempt(Base):
     user = relationship("User", backref="solution_attempts")
     problem = relationship("Problem", back_populates="solution_attempts")
 
+    __table_args__ = (
+        Index("ix_solution_attempts_image_path", "image_path"),
+    )
+
 class WeeklyReport(Base):
     __tablename__ = "weekly_reports"
 
@@ -116,17 +213,93 @@ class WeeklyReport(Base):
     week_start = Column(Date, nullable=False) # The Monday of the week
     pdf_path = Column(String, nullable=False)
     summary_json = Column(JSON, nullable=True) # Snapshot of stats
-    created_at = Column(DateTime, default=datetime.utcnow)
+    stats_hash = Column(String(64), nullable=True) # sha256 of the stats the PDF was built from
+    created_at = Column(DateTime, default=datetime.utcnow) # Last (re)build time
     
     user = relationship("User", backref="weekly_reports")
 
+    __table_args__ = (
+        UniqueConstraint("user_id", "week_start", name="uq_weekly_reports_user_week"),
+    )
+
+class ReportJobRecord(Base):
+    """
+    Progress of a background report job (services/report_jobs), so a status poll
+    can be answered by any worker process, not just the one running the job.
+    """
+    __tablename__ = "report_jobs"
+
+    id = Column(String(32), primary_key=True) # uuid4 hex
+    kind = Column(String(20), nullable=False) # user, all_users, cohort
+    user_id = Column(Integer, nullable=True) # single-user jobs: whose report
+    class_name = Column(String, nullable=True) # cohort jobs
+    week_start = Column(Date, nullable=False)
+    status = Column(String(20), nullable=False, default="pending") # pending, running, completed, failed
+    total = Column(Integer, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    report_ids = Column(JSON, nullable=True)
+    summary_path = Column(String, nullable=True)
+    errors = Column(JSON, nullable=True) # the most recent ones
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow) # last progress write; a stale running job was interrupted
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # "Is this user's report for this week already being generated?"
+        Index("ix_report_jobs_user_week", "user_id", "week_start"),
+        Index("ix_report_jobs_updated_at", "updated_at"),
+    )
+
+class ScheduledJobRun(Base):
+    """
+    Last scheduled run of each leader-only job (services/scheduler), so a newly
+    elected leader neither skips a run the old one missed nor repeats one it made.
+    """
+    __tablename__ = "scheduled_job_runs"
+
+    name = Column(String(64), primary_key=True)
+    last_run = Column(DateTime, nullable=False) # the scheduled time (UTC), not when it finished
+    claimed_by = Column(String, nullable=True) # host:pid
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
 class SystemLog(Base):
     __tablename__ = "system_logs"
 
     id = Column(Integer, primary_key=True, index=True)
     level = Column(String(20), default="ERROR")
     category = Column(String(50), nullable=True) # e.g. vision, teaching, utility
+    model = Column(String(100), nullable=True) # AI model involved, for per-model error rates
     message = Column(Text, nullable=True)
     details = Column(JSON, nullable=True)  # Store robust error tracebacks or input states
     created_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        # Newest-first keyset pagination and time-range scans (retention, aggregates)
+        Index("ix_system_logs_created_id", created_at.desc(), id.desc()),
+        Index("ix_system_logs_category_created", "category", "created_at"),
+    )
+
+
+class AIUsageHourly(Base):
+    """Model usage aggregated per UTC hour, user, category and model."""
+    __tablename__ = "ai_usage_hourly"
+
+    id = Column(Integer, primary_key=True, index=True)
+    hour = Column(DateTime, nullable=False) # UTC, truncated to the hour
+    user_id = Column(Integer, nullable=False, default=0) # 0: calls made outside a user request
+    category = Column(String(20), nullable=False) # vision, teaching, utility
+    model = Column(String(100), nullable=False)
+    calls = Column(Integer, nullable=False, default=0)
+    failures = Column(Integer, nullable=False, default=0)
+    images = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    candidate_tokens = Column(BigInteger, nullable=False, default=0)
+    latency_ms = Column(BigInteger, nullable=False, default=0) # total; divide by calls for the mean
+
+    __table_args__ = (
+        UniqueConstraint("hour", "user_id", "category", "model", name="uq_ai_usage_hourly_bucket"),
+        # Quota checks: one user's usage since midnight
+        Index("ix_ai_usage_hourly_user_hour", "user_id", "hour"),
+    )
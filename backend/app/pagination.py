@@ -0,0 +1,33 @@
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException
+
+def encode_cursor(*values) -> str:
+    """
+    Packs the sort key of the last row of a page into an opaque, URL-safe cursor.
+    Datetimes are stored as ISO strings; decode_cursor() converts them back.
+    """
+    payload = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    """
+    Inverse of encode_cursor(). `types` gives the expected type of each value
+    (datetime, int, float or str). Raises a 400 on malformed cursors.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(payload, list) or len(payload) != len(types):
+            raise ValueError("cursor arity mismatch")
+        values = []
+        for value, expected in zip(payload, types):
+            if expected is datetime:
+                values.append(datetime.fromisoformat(value))
+            else:
+                values.append(expected(value))
+        return tuple(values)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
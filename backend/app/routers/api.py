@@ -1,22 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Response, BackgroundTasks, Request
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 from typing import List, Optional, Union
 from pydantic import BaseModel
 from ..database import get_db
+from ..pagination import encode_cursor, decode_cursor
 from ..models import Problem, KnowledgePoint, LearningRecord, SolutionAttempt, User, PracticeProblem
 import os
 from datetime import datetime
-from ..services.ai_service import AIService
 
-UPLOAD_DIR = "backend/uploads"
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
 from datetime import datetime
-from ..services.ai_service import AIService, AIServiceException
-from ..auth_deps import get_current_user
+from ..services.ai_service import AIService, AIServiceException, get_ai_service
+from ..services.knowledge_registry import knowledge_registry
+from ..services.dedup_service import DedupService, dedup_enabled, image_hash
+from ..services.embedding_service import EmbeddingService, index_embeddings
+from ..services.latex_render import latex_cache
+from ..services.artifact_store import artifact_store, artifact_response, artifact_download
+from ..services.upload_ingest import save_image_upload, UploadRejected
+from fastapi.concurrency import run_in_threadpool
+from ..auth_deps import get_current_user, get_current_active_admin
+from ..services.log_sink import get_logger
+
+logger = get_logger("api")
 
 router = APIRouter(dependencies=[Depends(get_current_user)])
-ai_service = AIService()
 
 class ProblemSchema(BaseModel):
     id: int
@@ -29,7 +36,7 @@ class ProblemSchema(BaseModel):
     ai_model: Optional[str] = None
     
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class KnowledgePointSchema(BaseModel):
     id: int
@@ -38,38 +45,83 @@ class KnowledgePointSchema(BaseModel):
     children: List['KnowledgePointSchema'] = []
 
     class Config:
-        orm_mode = True
+        from_attributes = True
+
+class ProblemListItemSchema(BaseModel):
+    """Lightweight projection for list views: no solution text or full ai_analysis JSON."""
+    id: int
+    image_path: str
+    latex_content: Optional[str] = None
+    difficulty: Optional[int] = None
+    knowledge_path: Optional[str] = None
+    knowledge_points: List[str] = []
+    created_at: datetime
+    current_mastery_level: Optional[int] = None
+    ai_model: Optional[str] = None
 
 # Problem Endpoints
-@router.get("/problems", response_model=List[ProblemSchema])
+@router.get("/problems", response_model=List[ProblemListItemSchema])
 def get_problems(
+    response: Response,
     skip: int = 0, 
     limit: int = 20, 
     mastery: Optional[int] = None,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    # Query problems with their learning records
+    """
+    Lists the user's problems, newest first.
+    Pass the `X-Next-Cursor` response header back as `cursor` to fetch the next page;
+    keyset pagination on (created_at, id) keeps deep pages as cheap as the first one.
+    `skip` is still honoured when no cursor is given.
+    """
+    limit = max(1, min(limit, 100))
+
     # We use outerjoin because we want problems even if they don't have records (unless filtering)
-    query = db.query(Problem, LearningRecord).outerjoin(
+    query = db.query(
+        Problem.id,
+        Problem.image_path,
+        Problem.latex_content,
+        Problem.difficulty,
+        Problem.knowledge_path,
+        Problem.ai_analysis["knowledge_points"].label("knowledge_points"),
+        Problem.created_at,
+        Problem.ai_model,
+        LearningRecord.mastery_level,
+    ).outerjoin(
         LearningRecord, 
         (Problem.id == LearningRecord.problem_id) & (LearningRecord.user_id == current_user.id)
     ).filter(Problem.user_id == current_user.id)
     
     if mastery is not None:
         query = query.filter(LearningRecord.mastery_level == mastery)
+
+    if cursor:
+        last_created_at, last_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(tuple_(Problem.created_at, Problem.id) < tuple_(last_created_at, last_id))
+    elif skip:
+        query = query.offset(skip)
         
-    # Sort by creation date
-    results = query.order_by(Problem.created_at.desc()).offset(skip).limit(limit).all()
+    rows = query.order_by(Problem.created_at.desc(), Problem.id.desc()).limit(limit).all()
     
     problems = []
-    for problem, record in results:
-        # Populate transient attribute for Pydantic
-        if record:
-            problem.current_mastery_level = record.mastery_level
-        else:
-            problem.current_mastery_level = None
-        problems.append(problem)
+    for row in rows:
+        kps = row.knowledge_points if isinstance(row.knowledge_points, list) else []
+        problems.append(ProblemListItemSchema(
+            id=row.id,
+            image_path=row.image_path,
+            latex_content=row.latex_content,
+            difficulty=row.difficulty,
+            knowledge_path=row.knowledge_path,
+            knowledge_points=[str(kp) for kp in kps],
+            created_at=row.created_at,
+            current_mastery_level=row.mastery_level,
+            ai_model=row.ai_model,
+        ))
+
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
         
     return problems
 
@@ -90,6 +142,17 @@ def get_problem(problem_id: int, db: Session = Depends(get_db), current_user: Us
         
     return problem
 
+@router.get("/problems/{problem_id}/latex.png")
+def get_problem_latex_image(problem_id: int, request: Request, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """The problem statement rendered to PNG (cached; rendered on first request)."""
+    latex = db.query(Problem.latex_content).filter(Problem.id == problem_id, Problem.user_id == current_user.id).scalar()
+    if latex is None:
+        raise HTTPException(status_code=404, detail="Problem not found")
+    rendered = latex_cache.render(latex)
+    if not rendered:
+        raise HTTPException(status_code=422, detail="Problem text could not be rendered")
+    return artifact_response(request, rendered[0], "image/png")
+
 # Knowledge Points Endpoints
 @router.get("/knowledge-points", response_model=List[KnowledgePointSchema])
 def get_knowledge_tree(db: Session = Depends(get_db)):
@@ -99,6 +162,12 @@ def get_knowledge_tree(db: Session = Depends(get_db)):
     roots = db.query(KnowledgePoint).filter(KnowledgePoint.parent_id == None).all()
     return roots
 
+@router.post("/knowledge-nodes/refresh", dependencies=[Depends(get_current_active_admin)])
+def refresh_knowledge_nodes():
+    """Reloads the in-memory knowledge node registry after knowledge_nodes was edited."""
+    count = knowledge_registry.refresh()
+    return {"message": "Knowledge registry refreshed", "nodes": count}
+
 class MasteryRequest(BaseModel):
     level: int # 1, 2, 3
 
@@ -273,26 +342,39 @@ async def review_problem(
     }
 
 @router.post("/problems/{problem_id}/reanalyze")
-async def reanalyze_problem(problem_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    from ..models import KnowledgeNode
-    
+async def reanalyze_problem(
+    problem_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    ai_service: AIService = Depends(get_ai_service)
+):
     problem = db.query(Problem).filter(Problem.id == problem_id, Problem.user_id == current_user.id).first()
     if not problem:
         raise HTTPException(status_code=404, detail="Problem not found")
         
+    image_file = artifact_store.resolve(problem.image_path)
+    if not image_file:
+        raise HTTPException(status_code=404, detail="Problem image not found")
+
     # Re-run AI analysis
     try:
-        analysis_result = await ai_service.analyze_image(problem.image_path)
+        analysis_result = await ai_service.analyze_image(image_file, user_id=current_user.id)
+    except AIServiceException as e:
+        status_code = 429 if e.error_type in ("rate_limit", "quota_exceeded") else 401 if e.error_type == "auth_error" else 503
+        raise HTTPException(
+            status_code=status_code,
+            detail={"message": e.args[0], "error_type": e.error_type, "retry_seconds": e.retry_seconds}
+        )
     except Exception as e:
-        print(f"Re-analysis failed: {e}")
+        logger.error(f"Re-analysis failed: {e}")
         raise HTTPException(status_code=500, detail=f"AI Analysis failed: {str(e)}")
 
     # Extract and Validate Knowledge Path
-    kp_path = analysis_result.get("knowledge_path")
-    if kp_path:
-        exists = db.query(KnowledgeNode).filter(KnowledgeNode.path == kp_path).first()
-        if not exists:
-            print(f"Warning: AI returned non-existent knowledge path during re-analysis: {kp_path}")
+    raw_kp_path = analysis_result.get("knowledge_path")
+    kp_path = knowledge_registry.resolve(raw_kp_path)
+    if raw_kp_path and kp_path != raw_kp_path:
+        logger.warning(f"Warning: AI returned non-existent knowledge path during re-analysis: {raw_kp_path}, resolved to: {kp_path}")
     
     # Update Problem record
     ai_data = analysis_result.get("ai_analysis", {})
@@ -304,16 +386,39 @@ async def reanalyze_problem(problem_id: int, db: Session = Depends(get_db), curr
     problem.difficulty = analysis_result.get("difficulty", 1)
     problem.knowledge_path = kp_path
     problem.ai_model = analysis_result.get("ai_model")
+
+    if dedup_enabled():
+        if not problem.image_hash:
+            problem.image_hash = await run_in_threadpool(image_hash, image_file)
+        DedupService(db).refresh_problem(problem)
     
     db.commit()
     db.refresh(problem)
+    background_tasks.add_task(index_embeddings, ai_service, [("problem", problem.id)], True)
     
     return {"message": "Problem re-analyzed successfully", "id": problem.id, "knowledge_path": kp_path}
 
+@router.get("/problems/{problem_id}/bank")
+async def get_bank_matches(problem_id: int, limit: int = 5, db: Session = Depends(get_db), current_user: User = Depends(get_current_user),
+                           ai_service: AIService = Depends(get_ai_service)):
+    """Existing problems from the shared bank that are semantically close to this one."""
+    problem = db.query(Problem).filter(Problem.id == problem_id, Problem.user_id == current_user.id).first()
+    if not problem:
+        raise HTTPException(status_code=404, detail="Problem not found")
+    try:
+        return await EmbeddingService(db, ai_service).find_bank_matches(problem, current_user.id, limit=max(1, min(limit, 20)))
+    except Exception as e:
+        logger.warning(f"Problem bank lookup failed: {e}")
+        raise HTTPException(status_code=503, detail="Problem bank lookup failed")
+
 @router.post("/problems/{problem_id}/similar")
-async def generate_similar_practice(problem_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    from ..models import KnowledgeNode
-    
+async def generate_similar_practice(
+    problem_id: int,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    ai_service: AIService = Depends(get_ai_service)
+):
     problem = db.query(Problem).filter(Problem.id == problem_id, Problem.user_id == current_user.id).first()
     if not problem:
         raise HTTPException(status_code=404, detail="Problem not found")
@@ -323,28 +428,58 @@ async def generate_similar_practice(problem_id: int, db: Session = Depends(get_d
     difficulty = problem.difficulty or 1
     
     # Get knowledge node name for better AI context
-    knowledge_path_name = "相关知识点"
-    if problem.knowledge_path:
-        root_path = problem.knowledge_path.split('.')[0] + '.' + problem.knowledge_path.split('.')[1] if len(problem.knowledge_path.split('.')) > 1 else problem.knowledge_path
-        node = db.query(KnowledgeNode).filter(KnowledgeNode.path == problem.knowledge_path).first()
-        if node:
-            knowledge_path_name = node.name
+    knowledge_path_name = knowledge_registry.name_for(problem.knowledge_path, "相关知识点")
 
     # Handle knowledge points safely from JSON
     kps = []
     if problem.ai_analysis and isinstance(problem.ai_analysis, dict):
         kps = problem.ai_analysis.get("knowledge_points", [])
     
+    # Serve real problems from the bank when there are close ones; generate only otherwise
+    bank_matches = []
+    try:
+        bank_matches = await EmbeddingService(db, ai_service).find_bank_matches(problem, current_user.id)
+    except Exception as e:
+        logger.warning(f"Problem bank lookup failed, falling back to generation: {e}")
+
+    if bank_matches:
+        saved_problems = []
+        for match in bank_matches:
+            new_prob = PracticeProblem(
+                user_id=current_user.id,
+                latex_content=match["latex_content"],
+                difficulty=match["difficulty"] or difficulty,
+                knowledge_path=problem.knowledge_path,
+                ai_model="Problem Bank",
+                source_problem_id=problem.id,
+                ai_analysis={
+                    "topic": ["Problem Bank"],
+                    "solution": match["solution"],
+                    "thinking_process": match["thinking_process"],
+                    "answer": match["answer"],
+                    "knowledge_points": kps,
+                    "bank_source": f"{match['source_type']}:{match['source_id']}",
+                    "similarity": match["similarity"]
+                }
+            )
+            db.add(new_prob)
+            saved_problems.append(new_prob)
+        db.commit()
+        for sp in saved_problems:
+            db.refresh(sp)
+        return saved_problems
+
     try:
         # Call AI with rich context
         result = await ai_service.generate_similar_problems(
             original_latex=latex, 
             knowledge_points=kps, 
             difficulty=difficulty,
-            knowledge_path_name=knowledge_path_name
+            knowledge_path_name=knowledge_path_name,
+            user_id=current_user.id
         )
     except AIServiceException as e:
-        status_code = 429 if e.error_type == "rate_limit" else 401 if e.error_type == "auth_error" else 503
+        status_code = 429 if e.error_type in ("rate_limit", "quota_exceeded") else 401 if e.error_type == "auth_error" else 503
         raise HTTPException(
             status_code=status_code, 
             detail={"message": e.args[0], "error_type": e.error_type, "retry_seconds": e.retry_seconds}
@@ -376,6 +511,9 @@ async def generate_similar_practice(problem_id: int, db: Session = Depends(get_d
     db.commit()
     for sp in saved_problems:
         db.refresh(sp)
+
+    # Generated problems join the bank for future lookups
+    background_tasks.add_task(index_embeddings, ai_service, [("practice", sp.id) for sp in saved_problems])
         
     # We return the schemas so frontend receives the newly generated DB IDs.
     return saved_problems
@@ -397,7 +535,8 @@ async def submit_practice_solution(
     problem_id: int, 
     file: UploadFile = File(...), 
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     practice = db.query(PracticeProblem).filter(
         PracticeProblem.id == problem_id, 
@@ -408,12 +547,11 @@ async def submit_practice_solution(
         raise HTTPException(status_code=404, detail="Practice problem not found")
         
     # Save file
-    safe_filename = f"practice_{problem_id}_{int(datetime.utcnow().timestamp())}_{file.filename}"
-    file_location = os.path.join(UPLOAD_DIR, safe_filename)
-    
-    with open(file_location, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    try:
+        stored_name, _ = await save_image_upload(file)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    file_location = artifact_store.path(stored_name)
         
     # Extract AI reference answer
     problem_latex = practice.latex_content or "N/A"
@@ -431,15 +569,15 @@ async def submit_practice_solution(
             
     # Call AI Teaching Model to analyze the handwritten solution vs reference
     try:
-        feedback = await ai_service.analyze_solution(problem_latex, standard_solution, file_location)
+        feedback = await ai_service.analyze_solution(problem_latex, standard_solution, file_location, user_id=current_user.id)
     except AIServiceException as e:
-        status_code = 429 if e.error_type == "rate_limit" else 401 if e.error_type == "auth_error" else 503
+        status_code = 429 if e.error_type in ("rate_limit", "quota_exceeded") else 401 if e.error_type == "auth_error" else 503
         raise HTTPException(
             status_code=status_code, 
             detail={"message": e.args[0], "error_type": e.error_type, "retry_seconds": e.retry_seconds}
         )
     except Exception as e:
-        print(f"AI Practice Analysis failed: {e}")
+        logger.error(f"AI Practice Analysis failed: {e}")
         feedback = {"score": 0, "error": str(e)}
         
     # Return directly, no need to clutter DB with solution attempts for practice
@@ -450,19 +588,19 @@ async def submit_solution(
     problem_id: int, 
     file: UploadFile = File(...), 
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    ai_service: AIService = Depends(get_ai_service)
 ):
     problem = db.query(Problem).filter(Problem.id == problem_id, Problem.user_id == current_user.id).first()
     if not problem:
         raise HTTPException(status_code=404, detail="Problem not found")
         
     # Save file
-    safe_filename = f"solution_{problem_id}_{int(datetime.utcnow().timestamp())}_{file.filename}"
-    file_location = os.path.join(UPLOAD_DIR, safe_filename)
-    
-    with open(file_location, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    try:
+        stored_name, _ = await save_image_upload(file)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    file_location = artifact_store.path(stored_name)
         
     # Prepare context for AI
     problem_latex = problem.latex_content or "N/A"
@@ -478,22 +616,22 @@ async def submit_solution(
             
     # Call AI
     try:
-        feedback = await ai_service.analyze_solution(problem_latex, standard_solution, file_location)
+        feedback = await ai_service.analyze_solution(problem_latex, standard_solution, file_location, user_id=current_user.id)
     except AIServiceException as e:
-        status_code = 429 if e.error_type == "rate_limit" else 401 if e.error_type == "auth_error" else 503
+        status_code = 429 if e.error_type in ("rate_limit", "quota_exceeded") else 401 if e.error_type == "auth_error" else 503
         raise HTTPException(
             status_code=status_code, 
             detail={"message": e.args[0], "error_type": e.error_type, "retry_seconds": e.retry_seconds}
         )
     except Exception as e:
-        print(f"AI Analysis failed: {e}")
+        logger.error(f"AI Analysis failed: {e}")
         feedback = {"score": 0, "error": str(e)}
         
     # Save Attempt
     attempt = SolutionAttempt(
         problem_id=problem_id,
         user_id=current_user.id,
-        image_path=safe_filename,
+        image_path=stored_name,
         feedback_json=feedback
     )
     db.add(attempt)
@@ -503,19 +641,47 @@ async def submit_solution(
     return attempt
 
 # --- Reports ---
-from ..services.report_service import ReportService
+from ..services.report_jobs import report_jobs, cohort_summary_filename
 from ..models import WeeklyReport
-from fastapi.responses import FileResponse
+from datetime import date, timedelta
 
-@router.post("/reports/generate")
-def generate_weekly_report(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    service = ReportService(db)
-    try:
-        report = service.generate_weekly_report(user_id=current_user.id)
-        return report
-    except Exception as e:
-        print(f"Error generating report: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+@router.post("/reports/generate", status_code=202)
+def generate_weekly_report(week_start: Optional[date] = None, current_user: User = Depends(get_current_user)):
+    """Queues the user's weekly report (current week by default). Poll /reports/jobs/{id} for progress."""
+    if not week_start:
+        today = date.today()
+        week_start = today - timedelta(days=today.weekday()) # Monday
+    job = report_jobs.submit_user_report(current_user.id, week_start)
+    return job.to_dict()
+
+@router.post("/reports/generate-all", status_code=202, dependencies=[Depends(get_current_active_admin)])
+def generate_all_weekly_reports(week_start: Optional[date] = None):
+    """Queues reports for every user (previous week by default), as the Monday job does."""
+    job = report_jobs.submit_all_users(week_start)
+    return job.to_dict()
+
+@router.post("/reports/cohort/generate", status_code=202, dependencies=[Depends(get_current_active_admin)])
+def generate_cohort_reports(class_name: str, week_start: Optional[date] = None, db: Session = Depends(get_db)):
+    """Queues reports for every student in a class plus a teacher summary (previous week by default)."""
+    if not db.query(User.id).filter(User.class_name == class_name).first():
+        raise HTTPException(status_code=404, detail="No students in this class")
+    job = report_jobs.submit_cohort(class_name, week_start)
+    return job.to_dict()
+
+@router.get("/reports/cohort/download", dependencies=[Depends(get_current_active_admin)])
+def download_cohort_summary(class_name: str, week_start: date, request: Request):
+    filename = cohort_summary_filename(class_name, week_start)
+    response = artifact_download(request, f"reports/{filename}", "application/pdf", filename=filename)
+    if not response:
+        raise HTTPException(status_code=404, detail="Class report not found")
+    return response
+
+@router.get("/reports/jobs/{job_id}")
+def get_report_job(job_id: str, current_user: User = Depends(get_current_user)):
+    job = report_jobs.get(job_id)
+    if not job or (not current_user.is_admin and job.user_ids != [current_user.id]):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 @router.get("/reviews/today")
 async def get_today_reviews(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
@@ -589,19 +755,14 @@ def get_reports(db: Session = Depends(get_db), current_user: User = Depends(get_
     return db.query(WeeklyReport).filter(WeeklyReport.user_id == current_user.id).order_by(WeeklyReport.week_start.desc()).all()
 
 @router.get("/reports/{report_id}/download")
-def download_report(report_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def download_report(report_id: int, request: Request, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
     report = db.query(WeeklyReport).filter(WeeklyReport.id == report_id, WeeklyReport.user_id == current_user.id).first()
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
         
-    # Construct absolute path
-    # stored relative path: "reports/filename.pdf"
-    # static dir: backend/static
-    
-    base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../uploads"))
-    file_path = os.path.join(base_path, report.pdf_path) # report.pdf_path includes "reports/" prefix
-    
-    if not os.path.exists(file_path):
+    # report.pdf_path is relative to the artifact store ("reports/filename.pdf")
+    filename = f"weekly_report_{report.week_start.isoformat()}.pdf"
+    response = artifact_download(request, report.pdf_path, "application/pdf", filename=filename)
+    if not response:
         raise HTTPException(status_code=404, detail="File not found on server")
-        
-    return FileResponse(file_path, filename=os.path.basename(file_path), media_type='application/pdf')
+    return response
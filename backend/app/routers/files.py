@@ -0,0 +1,40 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from ..auth_deps import get_current_active_admin
+from ..services.artifact_store import artifact_download, is_public_name
+from ..services.storage_gc import storage_gc
+
+router = APIRouter()
+
+@router.get("/static/{name:path}")
+def get_static_file(name: str, request: Request):
+    """
+    Serves uploaded photos by name (the frontend uses /static/<basename of image_path>).
+    Unauthenticated, so only content-addressed blobs and legacy flat uploads:
+    reports go through the report endpoints, which check who is asking.
+    """
+    if not is_public_name(name):
+        raise HTTPException(status_code=404, detail="File not found")
+    response = artifact_download(request, name)
+    if not response:
+        raise HTTPException(status_code=404, detail="File not found")
+    return response
+
+@router.get("/api/storage/gc", dependencies=[Depends(get_current_active_admin)])
+def get_storage_gc():
+    """Statistics of the last garbage collection of the artifact store."""
+    return {
+        "running": storage_gc.running(),
+        "mode": storage_gc.mode,
+        "last_run": storage_gc.last_run.to_dict() if storage_gc.last_run else None,
+    }
+
+@router.post("/api/storage/gc", status_code=202, dependencies=[Depends(get_current_active_admin)])
+def start_storage_gc(dry_run: bool = True, full: bool = True):
+    """
+    Starts a collection in the background: a mark and sweep, or with full=false
+    only the blobs no row references any more. A dry run (the default) only
+    counts what would be collected.
+    """
+    if not storage_gc.run_in_background(dry_run=dry_run, full=full):
+        raise HTTPException(status_code=409, detail="Storage GC is already running")
+    return {"started": True, "dry_run": dry_run, "full": full}
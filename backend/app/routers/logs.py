@@ -1,11 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func, tuple_
 from sqlalchemy.orm import Session
 from typing import List, Optional, Any
 from ..database import get_db
+from ..pagination import encode_cursor, decode_cursor
 from ..models import User, SystemLog
-from ..auth_deps import get_current_user
+from ..auth_deps import get_current_user, get_current_active_admin
+from ..services.log_sink import system_log_handler
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta
 
 router = APIRouter(
     prefix="/logs",
@@ -16,6 +19,7 @@ class SystemLogSchema(BaseModel):
     id: int
     level: str
     category: Optional[str] = None
+    model: Optional[str] = None
     message: Optional[str] = None
     details: Optional[Any] = None
     created_at: datetime
@@ -23,12 +27,84 @@ class SystemLogSchema(BaseModel):
     class Config:
         from_attributes = True
 
+class ModelErrorBucket(BaseModel):
+    minute: datetime
+    model: Optional[str] = None
+    level: str
+    count: int
+
 @router.get("/system", response_model=List[SystemLogSchema])
 def get_system_logs(
-    limit: int = 50,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    level: Optional[List[str]] = Query(None),
+    category: Optional[str] = None,
+    model: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Fetches the most recent system logs. Accessible by all authenticated users."""
-    logs = db.query(SystemLog).order_by(SystemLog.created_at.desc()).limit(limit).all()
+    """
+    System logs, newest first. Accessible by all authenticated users.
+    Filters combine with AND; `level` may be repeated. Pass the X-Next-Cursor
+    response header back as `cursor` to fetch the next page.
+    """
+    query = db.query(SystemLog)
+    if level:
+        query = query.filter(SystemLog.level.in_([l.upper() for l in level]))
+    if category:
+        query = query.filter(SystemLog.category == category)
+    if model:
+        query = query.filter(SystemLog.model == model)
+    if since:
+        query = query.filter(SystemLog.created_at >= since)
+    if until:
+        query = query.filter(SystemLog.created_at < until)
+    if cursor:
+        last_created_at, last_id = decode_cursor(cursor, datetime, int)
+        query = query.filter(tuple_(SystemLog.created_at, SystemLog.id) < tuple_(last_created_at, last_id))
+
+    logs = query.order_by(SystemLog.created_at.desc(), SystemLog.id.desc()).limit(limit).all()
+    if len(logs) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(logs[-1].created_at, logs[-1].id)
     return logs
+
+@router.get("/model-errors", response_model=List[ModelErrorBucket])
+def get_model_error_counts(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    level: List[str] = Query(["ERROR", "WARNING"]),
+    category: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Failed AI calls per model per minute, for dashboards. Defaults to the last
+    hour; windows are capped at 7 days. Per-model failures are WARNING rows,
+    calls where every model failed are ERROR rows.
+    """
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(hours=1)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    if until - since > timedelta(days=7):
+        raise HTTPException(status_code=400, detail="Time window is limited to 7 days")
+
+    minute = func.date_trunc("minute", SystemLog.created_at).label("minute")
+    query = db.query(minute, SystemLog.model, SystemLog.level, func.count(SystemLog.id).label("count")).filter(
+        SystemLog.created_at >= since,
+        SystemLog.created_at < until,
+        SystemLog.model.isnot(None),
+        SystemLog.level.in_([l.upper() for l in level]),
+    )
+    if category:
+        query = query.filter(SystemLog.category == category)
+    rows = query.group_by(minute, SystemLog.model, SystemLog.level).order_by(minute, SystemLog.model).all()
+    return [ModelErrorBucket(minute=r.minute, model=r.model, level=r.level, count=r.count) for r in rows]
+
+@router.get("/sink", dependencies=[Depends(get_current_active_admin)])
+def get_log_sink_stats():
+    """Buffered / written / dropped counters of the background SystemLog writer."""
+    return system_log_handler.stats()
@@ -0,0 +1,31 @@
+import os
+import secrets
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from ..database import engine
+from ..services.metrics import registry, DB_POOL
+
+router = APIRouter(tags=["metrics"])
+
+def _collect_db_pool():
+    pool = engine.pool
+    # Only QueuePool tracks these; SQLite's pools don't
+    for state, getter in (("size", "size"), ("checked_out", "checkedout"), ("overflow", "overflow")):
+        if hasattr(pool, getter):
+            # QueuePool reports overflow as negative until the pool is full
+            DB_POOL.set(max(0, getattr(pool, getter)()), state=state)
+
+registry.register_collector(_collect_db_pool)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics(request: Request):
+    """
+    Prometheus scrape endpoint. When METRICS_TOKEN is set the scraper must send
+    it as a bearer token; otherwise restrict access at the proxy.
+    """
+    token = os.getenv("METRICS_TOKEN")
+    if token:
+        supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not secrets.compare_digest(supplied, token):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
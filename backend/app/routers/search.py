@@ -0,0 +1,49 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from pydantic import BaseModel
+from datetime import datetime
+from ..database import get_db
+from ..models import User
+from ..auth_deps import get_current_user
+from ..pagination import encode_cursor, decode_cursor
+from ..services.search_service import SearchService
+
+router = APIRouter(
+    prefix="/search",
+    tags=["search"]
+)
+
+class ProblemSearchHit(BaseModel):
+    id: int
+    image_path: str
+    latex_content: Optional[str] = None
+    difficulty: Optional[int] = None
+    knowledge_path: Optional[str] = None
+    created_at: Optional[datetime] = None
+    rank: float
+    highlight: Optional[str] = None
+
+@router.get("/problems", response_model=List[ProblemSearchHit])
+def search_problems(
+    response: Response,
+    q: str,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Ranked full-text + fuzzy search over the user's problems (LaTeX, solution, knowledge points).
+    Pass the `X-Next-Cursor` response header back as `cursor` for the next page.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    limit = max(1, min(limit, 50))
+
+    after = decode_cursor(cursor, float, int) if cursor else None
+    hits, next_key = SearchService(db).search_problems(current_user.id, q, limit=limit, after=after)
+
+    if next_key:
+        response.headers["X-Next-Cursor"] = encode_cursor(*next_key)
+    return hits
@@ -1,9 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 import os
-import google.generativeai as genai
 from typing import List, Dict, Optional
 from dotenv import set_key
+from ..services.log_sink import get_logger
+from ..services.model_providers import get_provider
+
+logger = get_logger("settings")
 
 router = APIRouter()
 
@@ -19,21 +22,11 @@ class ModelConfig(BaseModel):
 @router.get("/settings/models/available")
 async def get_available_models():
     """
-    Fetches the list of available Gemini models.
+    Fetches the list of available models from the configured AI_PROVIDER.
     """
     try:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-             return {"models": ["gemini-1.5-pro", "gemini-1.5-flash", "gemini-2.0-flash-lite"]} # Fallback list if no key
-        
-        genai.configure(api_key=api_key)
         # Typically we only want text/generation models for these tasks
-        models = []
-        for m in genai.list_models():
-            if 'generateContent' in m.supported_generation_methods:
-                # remove "models/" prefix from the name returned by API usually
-                name = m.name.replace("models/", "")
-                models.append(name)
+        models = get_provider().list_models()
         
         # If API fails to return or returns empty, provide fallbacks
         if not models:
@@ -41,7 +34,7 @@ async def get_available_models():
 
         return {"models": models}
     except Exception as e:
-        print(f"Error fetching models: {e}")
+        logger.error(f"Error fetching models: {e}")
         # Return a default list if internet is down or API key is invalid
         return {"models": ["gemini-1.5-pro", "gemini-1.5-flash", "gemini-2.0-flash-lite", "gemini-3-pro"]}
 
@@ -85,5 +78,5 @@ async def update_model_config(config: ModelConfig):
                 
         return {"message": "Configuration updated successfully", "config": config}
     except Exception as e:
-        print(f"Failed to update config: {e}")
+        logger.error(f"Failed to update config: {e}")
         raise HTTPException(status_code=500, detail="Failed to update configuration")
@@ -1,89 +1,550 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks, Header, Request, Response
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-import shutil
 import os
-import uuid
-from typing import Optional
-from ..database import get_db
-from ..models import Problem, DifficultyLevel, KnowledgeNode, User
+import asyncio
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from ..database import get_db, SessionLocal
+from ..models import Problem, DifficultyLevel, User, SourceDocument
 from ..auth_deps import get_current_user
-from ..services.ai_service import AIService, AIServiceException
-from datetime import datetime
+from ..services.ai_service import AIService, AIServiceException, get_ai_service
+from ..services.knowledge_registry import knowledge_registry
+from ..services.dedup_service import DedupService, dedup_enabled, image_hash, latex_simhash, canonical_id, FAILED_ANALYSIS_LATEX
+from ..services.embedding_service import index_embeddings
+from ..services.artifact_store import artifact_store
+from ..services.upload_ingest import save_image_upload, ingest_image, UploadRejected
+from ..services.resumable_uploads import resumable_uploads, ResumableUpload
+from ..services.document_ingest import document_rasterizer, verify_document, DOCUMENT_ANALYSIS_CONCURRENCY
+from ..services.page_segmentation import page_count
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime, timedelta
+from ..services.log_sink import get_logger
+
+logger = get_logger("upload")
 
 router = APIRouter()
-ai_service = AIService()
 
-UPLOAD_DIR = "uploads"
-SCAN_DATA_DIR = "./backend/uploads"
-if not os.path.exists(SCAN_DATA_DIR):
-    os.makedirs(SCAN_DATA_DIR, exist_ok=True)
 
 @router.post("/upload")
 async def upload_file(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    ai_service: AIService = Depends(get_ai_service)
 ):
-    # 1. Generate unique filename
-    file_ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
-    unique_filename = f"{uuid.uuid4()}.{file_ext}"
-    file_path = os.path.join(SCAN_DATA_DIR, unique_filename)
-    
-    # 2. Save file
+    # 1-2. Validate and save the photo under its content hash (identical bytes are stored once)
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        stored_name, created = await save_image_upload(file)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    return await process_stored_upload(stored_name, created, db, current_user, background_tasks, ai_service)
+
+async def process_stored_upload(stored_name: str, created: bool, db: Session, current_user: User, background_tasks: BackgroundTasks,
+                                ai_service: AIService) -> dict:
+    """Steps 3-6 of an upload, once the photo is in the artifact store: dedup, analysis, saving the Problem."""
+    file_path = artifact_store.path(stored_name)
     
-    # 3. Call AI Service (Immediate processing)
-    try:
-        # Note: analyze_image is async
-        analysis_result = await ai_service.analyze_image(file_path)
-    except AIServiceException as e:
-        status_code = 429 if e.error_type == "rate_limit" else 401 if e.error_type == "auth_error" else 503
-        raise HTTPException(
-            status_code=status_code, 
-            detail={"message": e.args[0], "error_type": e.error_type, "retry_seconds": e.retry_seconds}
-        )
-    except Exception as e:
-        print(f"AI Analysis failed: {e}")
-        analysis_result = {
-            "latex_content": "\\text{Analysis Failed}",
-            "ai_analysis": {"error": str(e)},
-            "difficulty": 1,
-            "knowledge_points": [],
-            "knowledge_path": None
-        }
+    # 3. Byte-identical photo: reuse the existing analysis without calling the model
+    dedup = DedupService(db) if dedup_enabled() else None
+    img_hash = None
+    duplicate = None
+    if dedup:
+        img_hash = await run_in_threadpool(image_hash, file_path)
+        if not created:
+            duplicate = dedup.find_exact_duplicate(stored_name)
+        if duplicate:
+            own_copy = dedup.find_user_copy(duplicate, current_user.id)
+            if own_copy:
+                # Same student uploaded it again: no new problem, no second review schedule
+                return _already_uploaded(own_copy)
+            logger.info(f"Image is identical to problem {duplicate.id}, reusing its analysis")
+
+    # 4. Call AI Service (Immediate processing)
+    if duplicate:
+        analysis_result = _reused_analysis(duplicate)
+    else:
+        try:
+            # Note: analyze_image is async
+            analysis_result = await ai_service.analyze_image(file_path, user_id=current_user.id)
+        except AIServiceException as e:
+            status_code = 429 if e.error_type in ("rate_limit", "quota_exceeded") else 401 if e.error_type == "auth_error" else 503
+            raise HTTPException(
+                status_code=status_code, 
+                detail={"message": e.args[0], "error_type": e.error_type, "retry_seconds": e.retry_seconds}
+            )
+        except Exception as e:
+            logger.error(f"AI Analysis failed: {e}")
+            analysis_result = {
+                "latex_content": "\\text{Analysis Failed}",
+                "ai_analysis": {"error": str(e)},
+                "difficulty": 1,
+                "knowledge_points": [],
+                "knowledge_path": None
+            }
+
+    # Same problem from a different photo (or a classmate's worksheet) is linked by its text;
+    # a similar image only counts when the text confirms it
+    latex_hash = latex_simhash(analysis_result.get("latex_content")) if dedup else None
+    if dedup and not duplicate:
+        duplicate = dedup.find_duplicate(img_hash, latex_hash)
+        if duplicate:
+            own_copy = dedup.find_user_copy(duplicate, current_user.id)
+            if own_copy:
+                if created:
+                    artifact_store.delete(stored_name)
+                return _already_uploaded(own_copy)
  
-    # 4. Extract and Validate Knowledge Path
-    kp_path = analysis_result.get("knowledge_path")
-    if kp_path:
-        # Verify the path exists in knowledge_nodes
-        exists = db.query(KnowledgeNode).filter(KnowledgeNode.path == kp_path).first()
-        if not exists:
-            print(f"Warning: AI returned non-existent knowledge path: {kp_path}")
-            # Optional: find closest parent or set to None
-            # For now, let's just keep it if it's a valid format, or set to null if preferred.
+    # 5-6. Validate the knowledge path and save to the database
+    new_problem = _new_problem(analysis_result, current_user.id, stored_name, duplicate)
+    db.add(new_problem)
+    db.flush()
+
+    # Only successful analyses are indexed, so a failed one is never copied to a later upload
+    if dedup and latex_hash:
+        new_problem.image_hash = img_hash
+        new_problem.latex_simhash = latex_hash
+        dedup.index_problem(new_problem)
+
+    db.commit()
+    db.refresh(new_problem)
+
+    # Make the problem findable in the similar-problem bank
+    background_tasks.add_task(index_embeddings, ai_service, [("problem", new_problem.id)])
     
-    # 5. Save to Database
+    return {"id": new_problem.id, "message": "File processed successfully", "knowledge_path": new_problem.knowledge_path, "duplicate_of": new_problem.duplicate_of_id}
+
+def _already_uploaded(problem: Problem) -> dict:
+    return {"id": problem.id, "message": "Problem already uploaded", "knowledge_path": problem.knowledge_path, "duplicate_of": canonical_id(problem)}
+
+def _reused_analysis(problem: Problem) -> dict:
+    """The analysis of an existing problem, for a new copy of it."""
+    return {
+        "latex_content": problem.latex_content,
+        "ai_analysis": dict(problem.ai_analysis or {}),
+        "difficulty": problem.difficulty,
+        "knowledge_path": problem.knowledge_path,
+        "ai_model": problem.ai_model
+    }
+
+def _new_problem(analysis_result: dict, user_id: int, image_path: str, duplicate: Optional[Problem], **columns) -> Problem:
+    """A Problem for an analysis result; unknown knowledge paths are mapped onto the nearest existing ancestor (or dropped)."""
+    raw_kp_path = analysis_result.get("knowledge_path")
+    kp_path = knowledge_registry.resolve(raw_kp_path)
+    if raw_kp_path and kp_path != raw_kp_path:
+        logger.warning(f"Warning: AI returned non-existent knowledge path: {raw_kp_path}, resolved to: {kp_path}")
+
     ai_data = analysis_result.get("ai_analysis", {})
     if "knowledge_points" in analysis_result:
         ai_data["knowledge_points"] = analysis_result["knowledge_points"]
 
-    new_problem = Problem(
-        user_id=current_user.id,
-        image_path=file_path,
+    return Problem(
+        user_id=user_id,
+        image_path=image_path,
         latex_content=analysis_result.get("latex_content"),
         ai_analysis=ai_data,
         difficulty=analysis_result.get("difficulty", 1),
         knowledge_path=kp_path,
         ai_model=analysis_result.get("ai_model"),
-        created_at=datetime.utcnow()
+        duplicate_of_id=canonical_id(duplicate) if duplicate else None,
+        created_at=datetime.utcnow(),
+        **columns
     )
-    
-    db.add(new_problem)
+
+# --- Documents ---
+# A scanner PDF or a worksheet photo with several problems: pages are cut into
+# problem regions (see services/document_ingest), the regions are analyzed
+# concurrently and each becomes its own Problem linked to the document and page.
+# Re-sending a processed document returns the stored result; re-sending one
+# that was only partly processed retries just the regions that failed.
+
+DOCUMENT_STALE_AFTER = timedelta(minutes=30) # a "processing" document older than this was interrupted
+
+@router.post("/documents")
+async def upload_document(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    ai_service: AIService = Depends(get_ai_service)
+):
+    try:
+        stored_name, _ = await save_image_upload(file, verify=verify_document)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
+    return await process_stored_document(stored_name, file.filename, db, current_user, background_tasks, ai_service)
+
+@router.get("/documents/{document_id}")
+def get_document(document_id: int, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+    document = db.query(SourceDocument).filter(SourceDocument.id == document_id, SourceDocument.user_id == current_user.id).first()
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return _document_summary(document)
+
+def _document_summary(document: SourceDocument, message: Optional[str] = None) -> dict:
+    regions = document.regions or []
+    return {
+        "document_id": document.id,
+        "filename": document.filename,
+        "status": document.status,
+        "pages": document.page_count,
+        "problems": [{"id": r["problem_id"], "page": r["page"], "region": r["region"]} for r in regions if r.get("problem_id")],
+        "failed": [{"page": r["page"], "region": r["region"], "error": r.get("error")} for r in regions if not r.get("problem_id")],
+        "message": message,
+    }
+
+async def process_stored_document(stored_name: str, filename: Optional[str], db: Session, current_user: User, background_tasks: BackgroundTasks,
+                                  ai_service: AIService) -> dict:
+    """Cuts a stored document into problem regions and creates a Problem per region."""
+    content_hash = os.path.splitext(os.path.basename(stored_name))[0]
+    document = db.query(SourceDocument).filter(SourceDocument.user_id == current_user.id, SourceDocument.content_hash == content_hash).first()
+    if document and document.status == "complete":
+        return _document_summary(document, "Document already processed")
+    now = datetime.utcnow()
+    if document and document.status == "processing" and document.updated_at > now - DOCUMENT_STALE_AFTER:
+        raise HTTPException(status_code=409, detail="Document is already being processed")
+
+    file_path = artifact_store.path(stored_name)
+    if not document:
+        pages = await run_in_threadpool(page_count, file_path)
+        document = SourceDocument(
+            user_id=current_user.id, content_hash=content_hash, file_path=stored_name,
+            filename=(filename or "")[:255] or None, page_count=pages, created_at=now
+        )
+        db.add(document)
+    document.status = "processing"
+    document.updated_at = now
+    try:
+        db.commit()
+    except IntegrityError:
+        # The same document was just sent twice at once
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Document is already being processed")
+
+    try:
+        new_ids = await _process_document_regions(document, db, current_user, ai_service)
+    except BaseException:
+        db.rollback()
+        document.status = "partial"
+        db.commit()
+        raise
+
+    if new_ids:
+        background_tasks.add_task(index_embeddings, ai_service, [("problem", problem_id) for problem_id in new_ids])
+    if document.status == "complete":
+        message = f"Document processed: {len(new_ids)} new problems"
+    else:
+        message = "Some regions could not be processed; upload the document again to retry them"
+    return _document_summary(document, message)
+
+async def _process_document_regions(document: SourceDocument, db: Session, current_user: User, ai_service: AIService) -> List[int]:
+    """Renders, analyzes and saves the regions of a document that have no problem yet; returns the new problem ids."""
+    # Fetched from the storage backend when another node stored the document
+    file_path = artifact_store.resolve(document.file_path) or artifact_store.path(document.file_path)
+    dedup = DedupService(db) if dedup_enabled() else None
+    semaphore = asyncio.Semaphore(DOCUMENT_ANALYSIS_CONCURRENCY)
+
+    regions = [dict(r) for r in document.regions or []]
+    if document.regions is None:
+        # Someone else already sent these exact bytes: reuse their regions and analyses
+        template = db.query(SourceDocument).filter(
+            SourceDocument.content_hash == document.content_hash,
+            SourceDocument.status == "complete",
+            SourceDocument.id != document.id
+        ).first()
+        if template:
+            regions = [{**r, "problem_id": None, "copy_of": r["problem_id"], "error": None} for r in template.regions or []]
+            pages_to_render = []
+        else:
+            pages_to_render = list(range(document.page_count))
+    else:
+        # Pages that failed to render last time are recorded without an image
+        pages_to_render = sorted({r["page"] - 1 for r in regions if not r.get("image_path")})
+        regions = [r for r in regions if r.get("image_path")]
+
+    async def analyze(region: dict):
+        """(region, analysis or None, duplicate, image hash)"""
+        region["error"] = None
+        source = db.get(Problem, region["copy_of"]) if region.get("copy_of") else None
+        if source:
+            return region, _reused_analysis(source), source, source.image_hash
+        region_path = artifact_store.resolve(region["image_path"]) or artifact_store.path(region["image_path"])
+        img_hash = None
+        if dedup:
+            img_hash = await run_in_threadpool(image_hash, region_path)
+            # Only a byte-identical crop skips the model; similar ones are confirmed by their text below
+            duplicate = dedup.find_exact_duplicate(region["image_path"])
+            if duplicate:
+                return region, _reused_analysis(duplicate), duplicate, img_hash
+        async with semaphore:
+            try:
+                analysis_result = await ai_service.analyze_image(region_path, user_id=current_user.id)
+            except AIServiceException as e:
+                region["error"] = e.error_type
+                return region, None, None, img_hash
+            except Exception as e:
+                logger.error(f"AI Analysis failed for {region['image_path']}: {e}")
+                region["error"] = "analysis_failed"
+                return region, None, None, img_hash
+        if analysis_result.get("latex_content") == FAILED_ANALYSIS_LATEX:
+            # Left for a retry instead of saving an empty problem
+            region["error"] = "analysis_failed"
+            return region, None, None, img_hash
+        return region, analysis_result, None, img_hash
+
+    async def render_and_analyze(page_index: int):
+        # Regions of a page are analyzed while later pages are still rendering
+        try:
+            stored = await document_rasterizer.page_regions(file_path, page_index)
+        except Exception as e:
+            logger.error(f"Failed to render page {page_index + 1} of document {document.id}: {e}")
+            failed = {"page": page_index + 1, "region": None, "box": None, "image_path": None, "problem_id": None, "error": "render_failed"}
+            return [(failed, None, None, None)]
+        page_regions = [
+            {"page": page_index + 1, "region": i + 1, "box": list(box), "image_path": name, "problem_id": None, "error": None}
+            for i, (box, name) in enumerate(stored)
+        ]
+        return await asyncio.gather(*(analyze(region) for region in page_regions))
+
+    batches = await asyncio.gather(
+        asyncio.gather(*(analyze(region) for region in regions if not region.get("problem_id"))),
+        *(render_and_analyze(page_index) for page_index in pages_to_render)
+    )
+    outcomes = [outcome for batch in batches for outcome in batch]
+    done = [region for region in regions if region.get("problem_id")]
+
+    # Database writes stay sequential, in page order
+    new_ids = []
+    outcomes.sort(key=lambda outcome: (outcome[0]["page"], outcome[0]["region"] or 0))
+    for region, analysis_result, duplicate, img_hash in outcomes:
+        region.pop("copy_of", None)
+        done.append(region)
+        if analysis_result is None:
+            continue
+        latex_hash = latex_simhash(analysis_result.get("latex_content")) if dedup else None
+        if dedup and not duplicate:
+            duplicate = dedup.find_duplicate(img_hash, latex_hash)
+        if dedup and duplicate:
+            own_copy = dedup.find_user_copy(duplicate, current_user.id)
+            if own_copy:
+                # Already in the student's list (e.g. the same problem on two worksheets)
+                region["problem_id"] = own_copy.id
+                continue
+        problem = _new_problem(
+            analysis_result, current_user.id, region["image_path"], duplicate,
+            source_document_id=document.id, source_page=region["page"]
+        )
+        db.add(problem)
+        db.flush()
+        if dedup and latex_hash:
+            problem.image_hash = img_hash
+            problem.latex_simhash = latex_hash
+            dedup.index_problem(problem)
+        region["problem_id"] = problem.id
+        new_ids.append(problem.id)
+
+    done.sort(key=lambda region: (region["page"], region["region"] or 0))
+    document.regions = done
+    document.status = "complete" if all(region.get("problem_id") for region in done) else "partial"
+    document.updated_at = datetime.utcnow()
     db.commit()
-    db.refresh(new_problem)
-    
-    return {"id": new_problem.id, "message": "File processed successfully", "knowledge_path": kp_path}
+    logger.info(f"Document {document.id}: {len(done)} regions on {document.page_count} pages, {len(new_ids)} new problems, status {document.status}")
+    return new_ids
+
+# --- Resumable uploads ---
+# tus-like: POST /uploads {size} -> id; PATCH /uploads/{id} with Upload-Offset
+# and the next bytes; HEAD /uploads/{id} after an interruption to learn the
+# offset; POST /uploads/{id}/finalize runs the same processing as /upload
+# (as /documents for a PDF).
+
+PATCH_CONTENT_TYPE = "application/offset+octet-stream"
+PATCH_WRITE_SIZE = 1024 * 1024
+
+class ResumableUploadCreate(BaseModel):
+    size: int = Field(..., gt=0)
+    filename: Optional[str] = None
+
+def _upload_headers(upload: ResumableUpload, offset: int) -> dict:
+    return {
+        "Upload-Offset": str(offset),
+        "Upload-Length": str(upload.size),
+        "Upload-Expires": datetime.utcfromtimestamp(upload.expires_at).strftime("%a, %d %b %Y %H:%M:%S GMT"),
+        "Cache-Control": "no-store",
+    }
+
+def _upload_status(upload: ResumableUpload, offset: int) -> dict:
+    return {
+        "id": upload.id,
+        "size": upload.size,
+        "offset": offset,
+        "finalized": upload.result is not None,
+        "expires_at": datetime.utcfromtimestamp(upload.expires_at).isoformat() + "Z",
+    }
+
+def _get_upload(upload_id: str, current_user: User) -> ResumableUpload:
+    upload = resumable_uploads.get(upload_id, current_user.id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return upload
+
+@router.post("/uploads", status_code=201)
+def create_resumable_upload(body: ResumableUploadCreate, response: Response, current_user: User = Depends(get_current_user)):
+    try:
+        upload = resumable_uploads.create(current_user.id, body.size, body.filename)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    response.headers["Location"] = f"/api/uploads/{upload.id}"
+    response.headers.update(_upload_headers(upload, 0))
+    return _upload_status(upload, 0)
+
+@router.head("/uploads/{upload_id}")
+def head_resumable_upload(upload_id: str, current_user: User = Depends(get_current_user)):
+    upload = _get_upload(upload_id, current_user)
+    return Response(status_code=200, headers=_upload_headers(upload, resumable_uploads.offset(upload)))
+
+@router.get("/uploads/{upload_id}")
+def get_resumable_upload(upload_id: str, response: Response, current_user: User = Depends(get_current_user)):
+    upload = _get_upload(upload_id, current_user)
+    offset = resumable_uploads.offset(upload)
+    response.headers.update(_upload_headers(upload, offset))
+    return _upload_status(upload, offset)
+
+@router.patch("/uploads/{upload_id}", status_code=204)
+async def patch_resumable_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset"),
+    current_user: User = Depends(get_current_user)
+):
+    """Appends the request body at Upload-Offset, which must equal the bytes received so far."""
+    if request.headers.get("content-type", "").split(";")[0].strip().lower() != PATCH_CONTENT_TYPE:
+        raise HTTPException(status_code=415, detail=f"Content-Type must be {PATCH_CONTENT_TYPE}")
+    upload = _get_upload(upload_id, current_user)
+    try:
+        async with resumable_uploads.lock(upload.id, wait=False):
+            upload = _get_upload(upload_id, current_user) # another worker may have finalized or removed it meanwhile
+            offset = await run_in_threadpool(resumable_uploads.offset, upload)
+            if upload.result is not None or upload_offset != offset:
+                # The client's view is stale (e.g. the last response was lost); it should HEAD and resume
+                raise HTTPException(status_code=409, detail="Upload-Offset does not match", headers=_upload_headers(upload, offset))
+
+            # Written in ~1 MiB pieces off the event loop; what arrived before a disconnect is kept
+            buffer = bytearray()
+            try:
+                async for chunk in request.stream():
+                    if offset + len(buffer) + len(chunk) > upload.size:
+                        raise HTTPException(status_code=413, detail="Data exceeds the declared upload size")
+                    buffer += chunk
+                    if len(buffer) >= PATCH_WRITE_SIZE:
+                        offset = await run_in_threadpool(resumable_uploads.append, upload, bytes(buffer))
+                        buffer.clear()
+            finally:
+                if buffer:
+                    offset = await run_in_threadpool(resumable_uploads.append, upload, bytes(buffer))
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return Response(status_code=204, headers=_upload_headers(upload, offset))
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_resumable_upload(
+    upload_id: str,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    ai_service: AIService = Depends(get_ai_service)
+):
+    """Processes a complete upload like POST /upload (or POST /documents for a PDF). Repeating it returns the first result."""
+    upload = _get_upload(upload_id, current_user)
+    async with resumable_uploads.lock(upload.id):
+        upload = _get_upload(upload_id, current_user) # a concurrent finalize may have finished meanwhile
+        if upload.result is not None:
+            return upload.result
+        offset = await run_in_threadpool(resumable_uploads.offset, upload)
+        if offset != upload.size:
+            raise HTTPException(status_code=409, detail=f"Upload incomplete: {offset} of {upload.size} bytes received",
+                                headers=_upload_headers(upload, offset))
+        try:
+            stored_name, created = await run_in_threadpool(resumable_uploads.store, upload, verify_document)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        if stored_name.endswith(".pdf"):
+            result = await process_stored_document(stored_name, upload.filename, db, current_user, background_tasks, ai_service)
+        else:
+            result = await process_stored_upload(stored_name, created, db, current_user, background_tasks, ai_service)
+        await run_in_threadpool(resumable_uploads.set_result, upload, result)
+        return result
+
+@router.delete("/uploads/{upload_id}", status_code=204)
+def delete_resumable_upload(upload_id: str, current_user: User = Depends(get_current_user)):
+    upload = _get_upload(upload_id, current_user)
+    resumable_uploads.delete(upload.id)
+    return Response(status_code=204)
+
+# --- Watched scans ---
+# A scanner (or a synced folder) dropping photos and PDFs into the watched scan
+# directory: each file is processed like POST /upload (a photo) or POST
+# /documents (a PDF) for the SCAN_USERNAME account, then removed from the
+# directory once it is in the artifact store.
+
+SCAN_SETTLE_SECONDS = 1.0 # a file whose size stayed the same this long is completely written
+
+async def _settled_size(file_path: str) -> int:
+    """Size of the file once it stops growing; 0 if it vanished or stayed empty."""
+    last = -1
+    while True:
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            return 0
+        if size == last:
+            return size
+        last = size
+        await asyncio.sleep(SCAN_SETTLE_SECONDS)
+
+async def ingest_watched_file(file_path: str) -> Optional[dict]:
+    """Processes a file found by the scan watcher; returns the same result as the matching upload endpoint."""
+    username = os.getenv("SCAN_USERNAME")
+    if not username:
+        logger.warning(f"Ignoring {file_path}: set SCAN_USERNAME to the account watched scans belong to")
+        return None
+    if not await _settled_size(file_path):
+        return None
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        if not user:
+            logger.error(f"Ignoring {file_path}: SCAN_USERNAME {username} does not exist")
+            return None
+        try:
+            with open(file_path, "rb") as source:
+                stored_name, created = await run_in_threadpool(ingest_image, source, "", None, verify_document)
+        except UploadRejected as e:
+            logger.warning(f"Rejected watched file {file_path}: {e}")
+            return None
+        # Stored under its content hash: dropping it again processes it again (or returns the result)
+        os.remove(file_path)
+
+        ai_service = get_ai_service()
+        background_tasks = BackgroundTasks()
+        try:
+            if stored_name.endswith(".pdf"):
+                result = await process_stored_document(stored_name, os.path.basename(file_path), db, user, background_tasks, ai_service)
+            else:
+                result = await process_stored_upload(stored_name, created, db, user, background_tasks, ai_service)
+        except HTTPException as e:
+            logger.error(f"Watched file {file_path} could not be processed ({e.status_code}): {e.detail}")
+            return None
+        await background_tasks()
+        logger.info(f"Watched file {file_path}: {result.get('message')}")
+        return result
+    except Exception as e:
+        logger.exception(f"Watched file {file_path} failed: {e}")
+        return None
+    finally:
+        db.close()
@@ -0,0 +1,127 @@
+import os
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, cast, Date
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from pydantic import BaseModel
+from datetime import datetime, timedelta
+from ..database import get_db
+from ..models import User, AIUsageHourly
+from ..auth_deps import get_current_user, get_current_active_admin
+from ..services.ai_usage import ai_usage, seconds_until_reset
+
+router = APIRouter(
+    prefix="/usage",
+    tags=["usage"]
+)
+
+GROUP_COLUMNS = {
+    "user": AIUsageHourly.user_id,
+    "category": AIUsageHourly.category,
+    "model": AIUsageHourly.model,
+    "day": cast(AIUsageHourly.hour, Date),
+}
+
+class UsageRow(BaseModel):
+    user_id: Optional[int] = None
+    username: Optional[str] = None
+    category: Optional[str] = None
+    model: Optional[str] = None
+    day: Optional[str] = None
+    calls: int
+    failures: int
+    images: int
+    prompt_tokens: int
+    candidate_tokens: int
+    avg_latency_ms: Optional[float] = None
+    est_cost_usd: Optional[float] = None
+
+class MyUsage(BaseModel):
+    tokens_today: int
+    daily_quota: int # 0: unlimited
+    resets_in_seconds: int
+
+def _model_prices() -> dict:
+    """
+    AI_MODEL_PRICES: JSON of USD per million tokens, e.g.
+    {"gemini-2.0-flash-lite": {"input": 0.075, "output": 0.3}}
+    """
+    try:
+        return json.loads(os.getenv("AI_MODEL_PRICES", "{}"))
+    except ValueError:
+        return {}
+
+@router.get("/summary", response_model=List[UsageRow], dependencies=[Depends(get_current_active_admin)])
+def get_usage_summary(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    group_by: List[str] = Query(["user", "model"]),
+    user_id: Optional[int] = None,
+    category: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Model usage totals, grouped by any of user, category, model and day (UTC).
+    Defaults to the last 7 days. Cost estimates need grouping by model and a
+    price in AI_MODEL_PRICES.
+    """
+    unknown = set(group_by) - set(GROUP_COLUMNS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by: {', '.join(sorted(unknown))}")
+    # Include what this process has not written yet
+    ai_usage.flush()
+
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(days=7)
+    keys = [GROUP_COLUMNS[g].label(g) for g in group_by]
+    query = db.query(
+        *keys,
+        func.sum(AIUsageHourly.calls).label("calls"),
+        func.sum(AIUsageHourly.failures).label("failures"),
+        func.sum(AIUsageHourly.images).label("images"),
+        func.sum(AIUsageHourly.prompt_tokens).label("prompt_tokens"),
+        func.sum(AIUsageHourly.candidate_tokens).label("candidate_tokens"),
+        func.sum(AIUsageHourly.latency_ms).label("latency_ms"),
+    ).filter(AIUsageHourly.hour >= since, AIUsageHourly.hour < until)
+    if user_id is not None:
+        query = query.filter(AIUsageHourly.user_id == user_id)
+    if category:
+        query = query.filter(AIUsageHourly.category == category)
+    rows = query.group_by(*keys).order_by(func.sum(AIUsageHourly.prompt_tokens + AIUsageHourly.candidate_tokens).desc()).all()
+
+    usernames = {}
+    if "user" in group_by:
+        ids = {r.user for r in rows}
+        usernames = dict(db.query(User.id, User.username).filter(User.id.in_(ids)).all())
+    prices = _model_prices()
+
+    result = []
+    for r in rows:
+        # SUM of BIGINT comes back as Decimal on PostgreSQL
+        totals = {k: int(getattr(r, k) or 0) for k in ("calls", "failures", "images", "prompt_tokens", "candidate_tokens", "latency_ms")}
+        item = UsageRow(
+            calls=totals["calls"], failures=totals["failures"], images=totals["images"],
+            prompt_tokens=totals["prompt_tokens"], candidate_tokens=totals["candidate_tokens"],
+            avg_latency_ms=round(totals["latency_ms"] / totals["calls"], 1) if totals["calls"] else None,
+        )
+        if "user" in group_by:
+            item.user_id = r.user
+            item.username = usernames.get(r.user)
+        if "category" in group_by:
+            item.category = r.category
+        if "day" in group_by:
+            item.day = r.day.isoformat()
+        if "model" in group_by:
+            item.model = r.model
+            price = prices.get(r.model)
+            if price:
+                item.est_cost_usd = round((item.prompt_tokens * price.get("input", 0) + item.candidate_tokens * price.get("output", 0)) / 1e6, 4)
+        result.append(item)
+    return result
+
+@router.get("/me", response_model=MyUsage)
+def get_my_usage(current_user: User = Depends(get_current_user)):
+    """Tokens used today (UTC) against the daily quota."""
+    used, quota = ai_usage.quota_status(current_user.id)
+    return MyUsage(tokens_today=used, daily_quota=quota, resets_in_seconds=seconds_until_reset())
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from ..database import get_db
 from ..models import User
 from ..services.auth_service import AuthService
@@ -19,6 +19,8 @@ class UserBase(BaseModel):
     username: str
     name: Optional[str] = None
     is_admin: bool = False
+    class_name: Optional[str] = None
+    ai_daily_token_quota: Optional[int] = Field(None, ge=0) # None: AI_DAILY_TOKEN_QUOTA, 0: unlimited
 
 class UserCreate(UserBase):
     password: str
@@ -27,6 +29,8 @@ class UserUpdate(BaseModel):
     name: Optional[str] = None
     password: Optional[str] = None
     is_admin: Optional[bool] = None
+    class_name: Optional[str] = None
+    ai_daily_token_quota: Optional[int] = Field(None, ge=0)
 
 class UserOut(UserBase):
     id: int
@@ -54,7 +58,9 @@ def create_user(user: UserCreate, db: Session = Depends(get_db)):
         username=user.username,
         hashed_password=hashed_password,
         name=user.name,
-        is_admin=user.is_admin
+        is_admin=user.is_admin,
+        class_name=user.class_name or None,
+        ai_daily_token_quota=user.ai_daily_token_quota
     )
     db.add(new_user)
     db.commit()
@@ -71,6 +77,10 @@ def update_user(user_id: int, user_update: UserUpdate, db: Session = Depends(get
         db_user.name = user_update.name
     if user_update.is_admin is not None:
         db_user.is_admin = user_update.is_admin
+    if user_update.class_name is not None:
+        db_user.class_name = user_update.class_name or None # "" clears it
+    if "ai_daily_token_quota" in user_update.model_fields_set:
+        db_user.ai_daily_token_quota = user_update.ai_daily_token_quota # null: back to the default
     if user_update.password:
         db_user.hashed_password = auth_service.get_password_hash(user_update.password)
         
@@ -1,6 +1,4 @@
 import os
-import google.generativeai as genai
-import PIL.Image
 from dotenv import load_dotenv
 import json
 import re
@@ -9,10 +7,19 @@ import glob
 load_dotenv()
 
 from pydantic import BaseModel, ValidationError
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
+import time
 import traceback
-from ..database import SessionLocal
-from ..models import SystemLog
+from .log_sink import get_logger
+from .metrics import AI_CALL_SECONDS, AI_REQUESTS, AI_JSON_PARSE
+from .tracing import get_tracer, get_current_span, traced
+from .ai_usage import ai_usage, seconds_until_reset
+from .model_providers import ModelProvider, get_provider
+from fastapi.concurrency import run_in_threadpool
+
+logger = get_logger("ai")
+tracer = get_tracer(__name__)
 
 class AIAnalysisResponse(BaseModel):
     latex_content: str
@@ -28,33 +35,34 @@ class AIServiceException(Exception):
         self.retry_seconds = retry_seconds
 
 class AIService:
-    def __init__(self):
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            print("Warning: GEMINI_API_KEY not set")
-        else:
-            genai.configure(api_key=api_key)
+    def __init__(self, provider: Optional[ModelProvider] = None):
+        # AI_PROVIDER=fake swaps Gemini for the offline stand-in (benchmarks, local dev)
+        self._provider = provider
 
-    def _log_system_error(self, category: str, message: str, details: Any = None):
-        try:
-            db = SessionLocal()
-            log_entry = SystemLog(
-                level="ERROR",
-                category=category,
-                message=message,
-                details=details
-            )
-            db.add(log_entry)
-            db.commit()
-            db.close()
-        except Exception as e:
-            print(f"Failed to write to system_logs: {e}")
+    @property
+    def provider(self) -> ModelProvider:
+        # Resolved on first use, so constructing the service imports no model SDK
+        if self._provider is None:
+            self._provider = get_provider()
+        return self._provider
+
+    def _log_system_error(self, category: str, message: str, details: Any = None, model: Optional[str] = None):
+        # Queued for the SystemLog writer thread; never blocks the request on the DB
+        logger.error(message, extra={"category": category, "details": details, "model": model})
 
-    async def call_gemini_with_fallback(self, category: str, prompt: str, image_path: str = None) -> str:
+    @traced("ai.generate")
+    async def call_gemini_with_fallback(self, category: str, prompt: str, image_path: str = None, user_id: Optional[int] = None) -> Tuple[str, str]:
         """
         Routes request to PRIMARY model for category, falls back to FALLBACK model on failure.
         Categories: 'vision', 'teaching', 'utility'
+        Usage is accounted to user_id, whose daily token quota is checked first.
         """
+        if user_id:
+            # May read the database; cached for AI_QUOTA_REFRESH_SECONDS
+            used, quota = await run_in_threadpool(ai_usage.quota_status, user_id)
+            if quota and used >= quota:
+                raise AIServiceException("Daily AI token quota exceeded", "quota_exceeded", seconds_until_reset())
+
         # Resolve model names
         primary_env = f"MODEL_{category.upper()}_PRIMARY"
         fallback_env = f"MODEL_{category.upper()}_FALLBACK"
@@ -65,7 +73,7 @@ class AIService:
         # Default safety net
         if not primary_model:
             primary_model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash-lite")
-            print(f"Warning: {primary_env} not set. Defaulting to {primary_model}")
+            logger.warning(f"{primary_env} not set. Defaulting to {primary_model}")
 
         candidates = [(primary_model, "Primary")]
         if fallback_model and fallback_model != primary_model:
@@ -74,32 +82,29 @@ class AIService:
         last_error = None
         
         for model_name, role in candidates:
+            started = time.perf_counter()
             try:
-                print(f"[{category.upper()}] Calling {role} model: {model_name}...")
-                model = genai.GenerativeModel(model_name)
-                
-                generation_config = {"response_mime_type": "application/json"}
-                
-                content = [prompt]
-                if image_path:
-                    # Note: PIL.Image.open is lazy, load() makes it eager.
-                    # Opening is fast, processing happens at send.
-                    # We open fresh for each attempt to avoid closed file issues if any.
-                    img = PIL.Image.open(image_path)
-                    content.append(img)
-                
-                # Use async generation
-                response = await model.generate_content_async(
-                    content,
-                    generation_config=generation_config
-                )
-                
-                return response.text, model_name
+                with tracer.start_as_current_span("ai.call", attributes={"ai.category": category, "ai.model": model_name, "ai.role": role.lower()}):
+                    logger.info(f"[{category.upper()}] Calling {role} model: {model_name}...")
+                    response = await self.provider.generate(category, model_name, prompt, image_path)
+                    ai_usage.record(
+                        user_id, category, model_name,
+                        prompt_tokens=response.prompt_tokens,
+                        candidate_tokens=response.candidate_tokens,
+                        images=1 if image_path else 0,
+                        latency_ms=(time.perf_counter() - started) * 1000
+                    )
+                    AI_CALL_SECONDS.observe(time.perf_counter() - started, category=category, model=model_name, role=role.lower(), outcome="success")
+                    AI_REQUESTS.inc(category=category, outcome=role.lower())
+                    return response.text, model_name
                 
             except Exception as e:
-                print(f"[WARNING] 主模型 {model_name} ({role}) 调用失败，正在切换至备选模型 (if available)。Error: {e}")
+                AI_CALL_SECONDS.observe(time.perf_counter() - started, category=category, model=model_name, role=role.lower(), outcome="error")
+                ai_usage.record(user_id, category, model_name, images=1 if image_path else 0, latency_ms=(time.perf_counter() - started) * 1000, failed=True)
+                logger.warning(f"主模型 {model_name} ({role}) 调用失败，正在切换至备选模型 (if available)。Error: {e}", extra={"category": category, "model": model_name})
                 last_error = e
         # If we got here, all models failed
+        AI_REQUESTS.inc(category=category, outcome="failed")
         error_msg = f"All models failed for {category}. Last error: {str(last_error)}"
         
         # Parse specific errors for the user UI
@@ -112,18 +117,18 @@ class AIService:
             retry_seconds = int(retry_match.group(1))
 
         if "429" in last_error_str or "resourceexhausted" in last_error_str:
-            self._log_system_error(category, f"Rate Limit Exceeded (429): {str(last_error)}", {"primary": primary_model, "fallback": fallback_model, "traceback": traceback.format_exc() if last_error else None})
+            self._log_system_error(category, f"Rate Limit Exceeded (429): {str(last_error)}", {"primary": primary_model, "fallback": fallback_model, "traceback": traceback.format_exc() if last_error else None}, model=model_name)
             raise AIServiceException("AI Model Rate Limit Exceeded", "rate_limit", retry_seconds)
             
         elif "401" in last_error_str or "403" in last_error_str or "permissiondenied" in last_error_str or "api_key_invalid" in last_error_str:
-            self._log_system_error(category, f"Authentication Error: {str(last_error)}", {"primary": primary_model, "fallback": fallback_model, "traceback": traceback.format_exc() if last_error else None})
+            self._log_system_error(category, f"Authentication Error: {str(last_error)}", {"primary": primary_model, "fallback": fallback_model, "traceback": traceback.format_exc() if last_error else None}, model=model_name)
             raise AIServiceException("AI Model Authentication Failed", "auth_error")
             
         elif "503" in last_error_str or "504" in last_error_str or "serviceunavailable" in last_error_str or "deadlineexceeded" in last_error_str:
-            self._log_system_error(category, f"Service Unavailable: {str(last_error)}", {"primary": primary_model, "fallback": fallback_model, "traceback": traceback.format_exc() if last_error else None})
+            self._log_system_error(category, f"Service Unavailable: {str(last_error)}", {"primary": primary_model, "fallback": fallback_model, "traceback": traceback.format_exc() if last_error else None}, model=model_name)
             raise AIServiceException("AI Model Service Unavailable", "service_error")
             
-        self._log_system_error(category, error_msg, {"primary": primary_model, "fallback": fallback_model, "traceback": traceback.format_exc() if last_error else None})
+        self._log_system_error(category, error_msg, {"primary": primary_model, "fallback": fallback_model, "traceback": traceback.format_exc() if last_error else None}, model=model_name)
         raise last_error or Exception(error_msg)
 
     def _load_reference_context(self) -> str:
@@ -150,7 +155,7 @@ class AIService:
                     content = f.read()
                     context_parts.append(f"--- Document: {filename} ---\n{content}\n")
             except Exception as e:
-                print(f"Error reading reference doc {file_path}: {e}")
+                logger.warning(f"Error reading reference doc {file_path}: {e}")
                 
         if not context_parts:
             return ""
@@ -158,11 +163,13 @@ class AIService:
         return "REFERENCE CONTEXT (Shanghai Local Standards):\n" + "\n".join(context_parts)
 
 
-    async def analyze_image(self, image_path: str):
-        print(f"Analyzing image: {image_path}")
+    @traced("ai.analyze_image")
+    async def analyze_image(self, image_path: str, user_id: Optional[int] = None):
+        logger.info(f"Analyzing image: {image_path}")
         
         # Load reference context
-        reference_context = self._load_reference_context()
+        with tracer.start_as_current_span("ai.prompt_build"):
+            reference_context = self._load_reference_context()
         
         knowledge_mapping = {
             "集合与逻辑": "SH_MATH.01",
@@ -253,30 +260,10 @@ class AIService:
 
         try:
             # Route to VISION models
-            text, used_model = await self.call_gemini_with_fallback('vision', prompt, image_path)
+            text, used_model = await self.call_gemini_with_fallback('vision', prompt, image_path, user_id=user_id)
             
-            # Clean up markdown
-            text = re.sub(r'```json\n|\n```', '', text).strip()
-            print(f"DEBUG: AI Raw Text: {text[:500]}...")
-
-            # Parse JSON - Use a more robust approach
-            try:
-                data = json.loads(text)
-            except json.JSONDecodeError as je:
-                print(f"Standard JSON parse failed, trying robust mode: {je}")
-                # Try to handle common LaTeX backslash issues by allowing control characters
-                # and potentially raw backslashes if the model sent them.
-                try:
-                    data = json.loads(text, strict=False)
-                except Exception as e2:
-                    # Final attempt: global escape backslashes that are not already escaped
-                    # This is tricky without a proper parser, but a common fix for LaTeX JSON:
-                    # Note: We only do this if everything else fails.
-                    escaped_text = text.replace('\\', '\\\\')
-                    escaped_text = escaped_text.replace('\\\\"', '\\"')
-                    escaped_text = escaped_text.replace('\\\\n', '\\n')
-                    escaped_text = escaped_text.replace('\\\\t', '\\t')
-                    data = json.loads(escaped_text, strict=False)
+            logger.debug(f"AI Raw Text: {text[:500]}...")
+            data = self._parse_json(text, 'vision')
             
             # Validate with Pydantic
             validated_data = AIAnalysisResponse(**data)
@@ -291,7 +278,6 @@ class AIService:
         except AIServiceException as e:
             raise e
         except Exception as e:
-            print(f"Analysis failed: {e}")
             self._log_system_error("vision", f"Vision Analysis Failed: {str(e)}", {"traceback": traceback.format_exc()})
             return {
                 "latex_content": "\\text{Analysis Failed}",
@@ -301,6 +287,40 @@ class AIService:
             }
 
 
+    @traced("ai.json_parse")
+    def _parse_json(self, text: str, category: str) -> Any:
+        """
+        Parses model output as JSON. Models often return LaTeX with unescaped
+        backslashes, so stricter attempts fall back to more forgiving ones; which
+        one worked is counted in AI_JSON_PARSE.
+        """
+        text = re.sub(r'```json\n|\n```', '', text).strip()
+        try:
+            data = json.loads(text)
+            mode = "strict"
+        except json.JSONDecodeError as je:
+            logger.info(f"Standard JSON parse failed, trying robust mode: {je}")
+            try:
+                # Allows raw control characters (newlines, tabs) inside strings
+                data = json.loads(text, strict=False)
+                mode = "lenient"
+            except json.JSONDecodeError:
+                # Last resort: escape every backslash, then undo it for the escapes JSON needs
+                escaped_text = text.replace('\\', '\\\\')
+                escaped_text = escaped_text.replace('\\\\"', '\\"')
+                escaped_text = escaped_text.replace('\\\\n', '\\n')
+                escaped_text = escaped_text.replace('\\\\t', '\\t')
+                try:
+                    data = json.loads(escaped_text, strict=False)
+                    mode = "repaired"
+                except json.JSONDecodeError:
+                    AI_JSON_PARSE.inc(category=category, mode="failed")
+                    get_current_span().set_attribute("ai.json_parse.mode", "failed")
+                    raise
+        AI_JSON_PARSE.inc(category=category, mode=mode)
+        get_current_span().set_attribute("ai.json_parse.mode", mode)
+        return data
+
     def _fix_latex(self, text: str) -> str:
         """
         Post-procesing to ensure specific LaTeX commands are wrapped in $...$
@@ -313,7 +333,7 @@ class AIService:
         text = re.sub(r'(?<!\$)\\\\underline\\{.*?\\}', r'$\g<0>$', text)
         return text
 
-    async def generate_similar_problems(self, original_latex: str, knowledge_points: List[str] = [], difficulty: int = 1, knowledge_path_name: str = "相关知识点") -> Dict[str, Any]:
+    async def generate_similar_problems(self, original_latex: str, knowledge_points: List[str] = [], difficulty: int = 1, knowledge_path_name: str = "相关知识点", user_id: Optional[int] = None) -> Dict[str, Any]:
         """
         Generates 2 similar practice problems with rich context and rigorous prompt.
         """
@@ -361,23 +381,9 @@ class AIService:
         
         try:
             # Route to UTILITY/REASONING models
-            text, used_model = await self.call_gemini_with_fallback('utility', prompt)
+            text, used_model = await self.call_gemini_with_fallback('utility', prompt, user_id=user_id)
             
-            # Clean and parse
-            text = re.sub(r'```json\n|\n```', '', text).strip()
-            
-            try:
-                data = json.loads(text)
-            except json.JSONDecodeError as je:
-                print(f"Standard JSON parse failed, trying robust mode: {je}")
-                try:
-                    data = json.loads(text, strict=False)
-                except Exception as e2:
-                    escaped_text = text.replace('\\', '\\\\')
-                    escaped_text = escaped_text.replace('\\\\"', '\\"')
-                    escaped_text = escaped_text.replace('\\\\n', '\\n')
-                    escaped_text = escaped_text.replace('\\\\t', '\\t')
-                    data = json.loads(escaped_text, strict=False)
+            data = self._parse_json(text, 'utility')
             
             problems = data.get("problems", [])
             
@@ -394,11 +400,18 @@ class AIService:
         except AIServiceException as e:
             raise e
         except Exception as e:
-            print(f"Error generating similar problems: {e}")
             self._log_system_error("utility", f"Practice Generation Failed: {str(e)}", {"traceback": traceback.format_exc()})
             return {"problems": [], "error": str(e)}
 
-    async def analyze_solution(self, problem_latex: str, standard_solution: str, solution_image_path: str):
+    async def embed_text(self, text: str, task_type: str = "retrieval_document") -> List[float]:
+        """
+        Returns the embedding vector for `text` using MODEL_EMBEDDING.
+        Errors are raised to the caller; embeddings are best-effort and never block a request.
+        """
+        model_name = os.getenv("MODEL_EMBEDDING", "models/text-embedding-004")
+        return await self.provider.embed(model_name, text, task_type)
+
+    async def analyze_solution(self, problem_latex: str, standard_solution: str, solution_image_path: str, user_id: Optional[int] = None):
         """
         Analyzes a student's handwritten solution against the problem and standard solution.
         Uses TEACHING models (high reasoning capability).
@@ -430,16 +443,15 @@ class AIService:
         
         try:
             # Route to TEACHING models
-            text = await self.call_gemini_with_fallback('teaching', prompt, solution_image_path)
-            
-            text = re.sub(r'```json\n|\n```', '', text).strip()
-            data = json.loads(text)
+            text, used_model = await self.call_gemini_with_fallback('teaching', prompt, solution_image_path, user_id=user_id)
+            data = self._parse_json(text, 'teaching')
+            if isinstance(data, dict):
+                data["ai_model"] = used_model
             return data
             
         except AIServiceException as e:
             raise e
         except Exception as e:
-            print(f"Error analyzing solution: {e}")
             self._log_system_error("teaching", f"Solution Analysis Failed: {str(e)}", {"traceback": traceback.format_exc()})
             return {
                 "score": 0,
@@ -447,3 +459,8 @@ class AIService:
                 "calculation_errors": ["Error processing solution analysis"],
                 "suggestions": f"Analysis failed: {str(e)}"
             }
+
+@lru_cache(maxsize=None)
+def get_ai_service() -> AIService:
+    """The shared AIService; use as a FastAPI dependency (override it in app.dependency_overrides)."""
+    return AIService()
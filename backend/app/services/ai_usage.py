@@ -0,0 +1,163 @@
+"""
+Per-user, per-model accounting of Gemini usage, and daily token quotas.
+
+Every model call is added to an in-memory aggregate keyed by (hour, user,
+category, model). A background thread upserts the aggregates into
+ai_usage_hourly every AI_USAGE_FLUSH_SECONDS, so recording a call is a dict
+update rather than a database write.
+
+Quotas are soft: a user's usage today (UTC) is the database total, re-read at
+most every AI_QUOTA_REFRESH_SECONDS, plus what this process recorded since.
+Calls already in flight when the quota is reached still complete.
+"""
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from .log_sink import get_logger
+
+logger = get_logger("usage")
+
+FIELDS = ("calls", "failures", "images", "prompt_tokens", "candidate_tokens", "latency_ms")
+
+def default_daily_quota() -> int:
+    """AI_DAILY_TOKEN_QUOTA: tokens per user per UTC day; 0 (default) means unlimited."""
+    return int(os.getenv("AI_DAILY_TOKEN_QUOTA", "0"))
+
+def seconds_until_reset() -> int:
+    now = datetime.utcnow()
+    return int((datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) - now).total_seconds()) + 1
+
+class _QuotaState:
+    __slots__ = ("day", "used", "quota", "refreshed_at")
+
+    def __init__(self, day, used: int, quota: int):
+        self.day = day
+        self.used = used
+        self.quota = quota
+        self.refreshed_at = time.monotonic()
+
+class AIUsageRecorder:
+    def __init__(self, flush_interval: float = 10.0, quota_refresh: float = 60.0):
+        self.flush_interval = flush_interval
+        self.quota_refresh = quota_refresh
+        self._pending: Dict[Tuple, list] = {}
+        self._quota: Dict[int, _QuotaState] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, user_id: Optional[int], category: str, model: str, prompt_tokens: int = 0, candidate_tokens: int = 0, images: int = 0, latency_ms: float = 0, failed: bool = False):
+        now = datetime.utcnow()
+        key = (now.replace(minute=0, second=0, microsecond=0), user_id or 0, category, model)
+        tokens = prompt_tokens + candidate_tokens
+        with self._lock:
+            totals = self._pending.get(key)
+            if totals is None:
+                totals = self._pending[key] = [0] * len(FIELDS)
+            totals[0] += 1
+            totals[1] += int(failed)
+            totals[2] += images
+            totals[3] += prompt_tokens
+            totals[4] += candidate_tokens
+            totals[5] += int(latency_ms)
+            state = self._quota.get(user_id) if user_id else None
+            if state is not None and state.day == now.date():
+                state.used += tokens
+
+    def quota_status(self, user_id: int) -> Tuple[int, int]:
+        """(tokens used today, daily quota) for the user; a quota of 0 means unlimited."""
+        today = datetime.utcnow().date()
+        with self._lock:
+            state = self._quota.get(user_id)
+            if state is not None and state.day == today and time.monotonic() - state.refreshed_at < self.quota_refresh:
+                return state.used, state.quota
+        return self._refresh_quota(user_id, today)
+
+    def _refresh_quota(self, user_id: int, today) -> Tuple[int, int]:
+        from ..database import SessionLocal
+        from ..models import AIUsageHourly, User
+
+        midnight = datetime.combine(today, datetime.min.time())
+        db = SessionLocal()
+        try:
+            stored = db.query(func.coalesce(func.sum(AIUsageHourly.prompt_tokens + AIUsageHourly.candidate_tokens), 0)).filter(
+                AIUsageHourly.user_id == user_id,
+                AIUsageHourly.hour >= midnight
+            ).scalar()
+            quota = db.query(User.ai_daily_token_quota).filter(User.id == user_id).scalar()
+        finally:
+            db.close()
+        if quota is None:
+            quota = default_daily_quota()
+
+        with self._lock:
+            # Recorded in this process but not flushed yet
+            unflushed = sum(t[3] + t[4] for (hour, uid, _, _), t in self._pending.items() if uid == user_id and hour >= midnight)
+            state = _QuotaState(today, int(stored) + unflushed, quota)
+            self._quota[user_id] = state
+        return state.used, state.quota
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ai-usage-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the writer after flushing pending usage."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> int:
+        """Upserts pending aggregates; returns the number of buckets written."""
+        from ..database import SessionLocal
+        from ..models import AIUsageHourly
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        rows = [
+            {"hour": hour, "user_id": user_id, "category": category, "model": model, **dict(zip(FIELDS, totals))}
+            for (hour, user_id, category, model), totals in pending.items()
+        ]
+        stmt = insert(AIUsageHourly).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_ai_usage_hourly_bucket",
+            set_={field: getattr(AIUsageHourly, field) + getattr(stmt.excluded, field) for field in FIELDS}
+        )
+        db = SessionLocal()
+        try:
+            db.execute(stmt)
+            db.commit()
+            return len(rows)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Failed to write AI usage ({len(rows)} buckets), will retry: {e}")
+            # Put it back so the next flush retries it
+            with self._lock:
+                for key, totals in pending.items():
+                    current = self._pending.setdefault(key, [0] * len(FIELDS))
+                    for i, value in enumerate(totals):
+                        current[i] += value
+            return 0
+        finally:
+            db.close()
+
+ai_usage = AIUsageRecorder(
+    flush_interval=float(os.getenv("AI_USAGE_FLUSH_SECONDS", "10")),
+    quota_refresh=float(os.getenv("AI_QUOTA_REFRESH_SECONDS", "60")),
+)
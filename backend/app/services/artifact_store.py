@@ -0,0 +1,336 @@
+"""
+One place for every file the backend writes and serves: uploaded photos,
+solution photos, report PDFs and render caches.
+
+Files live under a single root (ARTIFACT_ROOT, default backend/uploads resolved
+from this file, so it no longer depends on the directory uvicorn started in)
+and are addressed by names relative to it. Uploads are blobs with
+content-addressed names, sharded two levels deep so no directory grows past a
+few thousand entries: blobs/<h[0:2]>/<h[2:4]>/<sha256>.<ext>. That makes them
+immutable, safe to cache forever and stored once however often they are
+uploaded; services/blob_refs counts the rows that reference each one.
+
+Where the files are kept durably is up to the storage backend
+(services/storage_backends, STORAGE_BACKEND). With a remote backend the root
+holds node-local working copies: save_upload places the verified file there
+and sends it to the backend, and resolve fetches files other nodes stored.
+"""
+import os
+import re
+import hashlib
+import tempfile
+import mimetypes
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+from fastapi import Request, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
+from .metrics import UPLOAD_BYTES
+from .tracing import traced
+from .storage_backends import StorageBackend, create_backend
+from .log_sink import get_logger
+
+logger = get_logger("storage")
+
+CHUNK_SIZE = 64 * 1024
+BLOB_DIR = "blobs"
+_CONTENT_NAME = re.compile(r"^[0-9a-f]{64}$")
+_SHARDED_BLOB = re.compile(r"^blobs/([0-9a-f]{2})/([0-9a-f]{2})/([0-9a-f]{64})\.[0-9a-z]+$")
+# Uploads from before content addressing sit directly under the root (<uuid>.<ext>)
+_FLAT_UPLOAD = re.compile(r"^[0-9A-Za-z][0-9A-Za-z_-]*\.[0-9A-Za-z]+$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+LOCATE_CACHE_SIZE = 10000
+
+def _default_root() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), "../../uploads"))
+
+def safe_extension(filename: Optional[str], default: str = "jpg") -> str:
+    ext = filename.rsplit(".", 1)[-1].lower() if filename and "." in filename else ""
+    return ext if re.fullmatch(r"[a-z0-9]{1,5}", ext) else default
+
+def blob_name(digest: str, ext: str, prefix: str = BLOB_DIR) -> str:
+    """Store-relative name of the blob with this sha256 hex digest."""
+    return f"{prefix}/{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+class ArtifactStore:
+    def __init__(self, root: Optional[str] = None, backend: Optional[StorageBackend] = None):
+        self.root = os.path.abspath(root or os.getenv("ARTIFACT_ROOT") or _default_root())
+        os.makedirs(self.root, exist_ok=True)
+        self.backend = backend or create_backend(self.root)
+        # stored path -> name, for content-addressed files of a remote backend (they never change)
+        self._located: Dict[str, str] = {}
+
+    def path(self, name: str) -> str:
+        """Absolute path for a store-relative name. Rejects names that escape the root."""
+        full = os.path.abspath(os.path.join(self.root, name))
+        if full != self.root and not full.startswith(self.root + os.sep):
+            raise ValueError(f"Artifact name outside the store: {name}")
+        return full
+
+    def candidate_names(self, stored: str) -> List[str]:
+        """
+        Store-relative names a path as stored in the database may refer to, most
+        specific first. Older rows hold paths relative to wherever the server was
+        started ("./backend/uploads/x.jpg"), bare filenames or absolute paths.
+        """
+        normalized = stored.replace("\\", "/")
+        if os.path.isabs(stored):
+            if not stored.startswith(self.root + os.sep):
+                return [os.path.basename(normalized)]
+            normalized = os.path.relpath(stored, self.root).replace(os.sep, "/")
+        for prefix in ("./backend/uploads/", "backend/uploads/", "./uploads/", "uploads/"):
+            if normalized.startswith(prefix):
+                normalized = normalized[len(prefix):]
+                break
+        candidates = [normalized]
+        basename = os.path.basename(normalized)
+        if basename != normalized:
+            candidates.append(basename)
+        # Flat content-addressed names from before sharding, and the basename the frontend requests
+        stem, ext = os.path.splitext(basename)
+        if _CONTENT_NAME.match(stem) and ext:
+            sharded = blob_name(stem, ext[1:])
+            if sharded != normalized:
+                candidates.append(sharded)
+        return candidates
+
+    def resolve(self, stored: Optional[str]) -> Optional[str]:
+        """Finds the file for a path as stored in the database; see candidate_names."""
+        if not stored:
+            return None
+        for candidate in self.candidate_names(stored):
+            try:
+                full = self.path(candidate)
+            except ValueError:
+                continue
+            if os.path.isfile(full):
+                return full
+        if self.backend.remote:
+            for candidate in self.candidate_names(stored):
+                try:
+                    full = self.path(candidate)
+                except ValueError:
+                    continue
+                if self.backend.fetch(candidate, full):
+                    return full
+        return None
+
+    def locate(self, stored: Optional[str]) -> Optional[str]:
+        """Store-relative name of the file for a path as stored in the database, without fetching it."""
+        if not stored:
+            return None
+        if stored in self._located:
+            return self._located[stored]
+        for candidate in self.candidate_names(stored):
+            try:
+                full = self.path(candidate)
+            except ValueError:
+                continue
+            # A remote backend has every file there is a working copy of
+            if os.path.isfile(full) or (self.backend.remote and self.backend.exists(candidate)):
+                if self.backend.remote and is_content_addressed(candidate):
+                    if len(self._located) >= LOCATE_CACHE_SIZE:
+                        self._located.clear()
+                    self._located[stored] = candidate
+                return candidate
+        return None
+
+    @traced("artifact.save_upload")
+    def save_upload(self, source: BinaryIO, ext: str = "", subdir: str = "", verify: Optional[Callable[[str], str]] = None) -> Tuple[str, bool]:
+        """
+        Streams `source` into the store as a blob named by its content hash
+        (under `subdir` instead of blobs/ if given).
+        Returns (name, created); created is False when identical bytes were already stored.
+        `verify(tmp_path)` may check the complete file before it is renamed into
+        place; it returns the extension to use and raises to reject the file.
+        """
+        prefix = subdir or BLOB_DIR
+        top_dir = self.path(prefix)
+        os.makedirs(top_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        # Next to the shards, so the final rename stays on one filesystem
+        fd, tmp_path = tempfile.mkstemp(dir=top_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            if verify:
+                ext = verify(tmp_path)
+            UPLOAD_BYTES.observe(size)
+            name = blob_name(digest.hexdigest(), ext, prefix)
+            final = self.path(name)
+            stored = self.backend.exists(name)
+            # Callers read the file right away, so a remote backend gets a working copy too
+            if os.path.exists(final):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final), exist_ok=True)
+                os.replace(tmp_path, final)
+            if stored:
+                # Counts as fresh for the storage GC's grace period until a row references it
+                self.backend.touch(name)
+                return name, False
+            try:
+                self.backend.put(final, name)
+            except BaseException:
+                os.remove(final)
+                raise
+            return name, True
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def publish(self, name: str):
+        """Stores a file written directly under the root (report PDFs) with the backend."""
+        self.backend.put(self.path(name), name)
+
+    def evict(self, name: str):
+        """Drops the working copy of a file a remote backend keeps; no-op for the local backend."""
+        if not self.backend.remote:
+            return
+        try:
+            os.remove(self.path(name))
+        except (OSError, ValueError):
+            pass
+
+    def delete(self, name: str):
+        try:
+            os.remove(self.path(name))
+        except (OSError, ValueError):
+            pass
+        if self.backend.remote:
+            try:
+                self.backend.delete(name)
+            except Exception as e:
+                logger.warning(f"Could not delete {name} from {self.backend.name}: {e}")
+
+artifact_store = ArtifactStore()
+
+def is_public_name(name: str) -> bool:
+    """
+    Whether /static may serve `name`: a sharded blob, or the bare basename of a
+    blob or a legacy flat upload. Reports, thumbnails, render caches and partial
+    uploads have their own (authenticated) routes or none at all.
+    """
+    match = _SHARDED_BLOB.match(name)
+    if match:
+        return match.group(3).startswith(match.group(1) + match.group(2))
+    return bool(_FLAT_UPLOAD.match(name))
+
+def is_content_addressed(path: str) -> bool:
+    return bool(_CONTENT_NAME.match(os.path.splitext(os.path.basename(path))[0]))
+
+def etag_for(path: str, stat: os.stat_result) -> str:
+    if is_content_addressed(path):
+        return f'"{os.path.splitext(os.path.basename(path))[0]}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+def _iter_file(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Single "bytes=" range -> (start, end inclusive). None if unsatisfiable; raises ValueError if unparseable."""
+    match = _RANGE.match(header.strip())
+    if not match:
+        raise ValueError(header)
+    first, last = match.groups()
+    if not first and not last:
+        raise ValueError(header)
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+def artifact_response(request: Request, path: str, media_type: str, filename: Optional[str] = None) -> Response:
+    """
+    Serves a stored file with ETag/If-None-Match, single byte-range requests (206)
+    and streaming in CHUNK_SIZE pieces. With ARTIFACT_SENDFILE=x-accel-redirect
+    (nginx) or x-sendfile (Apache/lighttpd) the body is left to the proxy.
+    """
+    stat = os.stat(path)
+    etag = etag_for(path, stat)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    # Content-addressed files never change under the same name
+    headers["Cache-Control"] = "private, max-age=31536000, immutable" if is_content_addressed(path) else "private, no-cache"
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    sendfile = os.getenv("ARTIFACT_SENDFILE", "").lower()
+    if sendfile == "x-accel-redirect":
+        prefix = os.getenv("ARTIFACT_ACCEL_PREFIX", "/_artifacts/")
+        headers["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + os.path.relpath(path, artifact_store.root).replace(os.sep, "/")
+        return Response(headers=headers, media_type=media_type)
+    if sendfile == "x-sendfile":
+        headers["X-Sendfile"] = path
+        return Response(headers=headers, media_type=media_type)
+
+    size = stat.st_size
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            byte_range = (0, size - 1) # unparseable or multi-range: whole file, as allowed by RFC 9110
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        start, end = byte_range
+        if (start, end) != (0, size - 1):
+            length = end - start + 1
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(length)
+            return StreamingResponse(_iter_file(path, start, length), status_code=206, headers=headers, media_type=media_type)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_iter_file(path, 0, size), headers=headers, media_type=media_type)
+
+def artifact_download(request: Request, stored: str, media_type: Optional[str] = None, filename: Optional[str] = None) -> Optional[Response]:
+    """
+    Response for a download of a stored file, or None if there is no such file.
+    A backend with presigned URLs gets a 307 to one, so the bytes go straight
+    from the bucket to the client; otherwise the file is served with
+    artifact_response.
+    """
+    backend = artifact_store.backend
+    if backend.remote:
+        name = artifact_store.locate(stored)
+        if not name:
+            return None
+        immutable = is_content_addressed(name)
+        url = backend.presigned_url(
+            name, media_type or mimetypes.guess_type(name)[0], filename,
+            cache_control="private, max-age=31536000, immutable" if immutable else "private, no-cache",
+        )
+        if url:
+            # The redirect of an immutable file may be reused until shortly before the URL expires
+            cache = f"private, max-age={max(0, backend.presign_expires - 300)}" if immutable else "no-store"
+            return RedirectResponse(url, status_code=307, headers={"Cache-Control": cache})
+    path = artifact_store.resolve(stored)
+    if not path:
+        return None
+    return artifact_response(request, path, media_type or mimetypes.guess_type(path)[0] or "application/octet-stream", filename=filename)
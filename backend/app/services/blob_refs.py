@@ -0,0 +1,120 @@
+"""
+Reference counting for blobs in the artifact store.
+
+Every row that points at a stored file (problem and solution photos, source
+documents) holds one reference to it, and a source document one more per
+region crop. ORM inserts, deletes and path changes adjust blob_refs in the
+same transaction through mapper events, so a count never disagrees with
+committed rows. Identical uploads share one blob and one row here with a
+higher count; a count of 0 marks a blob nothing uses any more, which the
+storage GC collects without a full mark (StorageGC.collect_released).
+
+Bulk statements (bulk_insert_mappings, query(...).delete()) bypass mapper
+events; run rebuild_blob_refs() after them.
+"""
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event, func, inspect, select, union_all, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from ..models import BlobRef, Problem, SolutionAttempt, SourceDocument
+from .log_sink import get_logger
+
+logger = get_logger("blobs")
+
+# (model, attribute holding a store-relative blob name)
+BLOB_COLUMNS: List[Tuple[type, str]] = [
+    (Problem, "image_path"),
+    (SolutionAttempt, "image_path"),
+    (SourceDocument, "file_path"),
+]
+
+def region_images(regions: Optional[list]) -> List[str]:
+    """Blob names of the region crops in SourceDocument.regions."""
+    return [r["image_path"] for r in regions or [] if r.get("image_path")]
+
+def _single(name: Optional[str]) -> List[str]:
+    return [name] if name else []
+
+def _adjust(connection, deltas: Dict[str, int]):
+    insert = pg_insert if connection.dialect.name == "postgresql" else sqlite_insert
+    now = datetime.utcnow()
+    for name, delta in deltas.items():
+        if not name or not delta:
+            continue
+        stmt = insert(BlobRef).values(name=name, refcount=max(delta, 0), updated_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[BlobRef.name],
+            set_={"refcount": BlobRef.refcount + delta, "updated_at": now}
+        )
+        connection.execute(stmt)
+
+def _count(deltas: Dict[str, int], names: Iterable[str], delta: int):
+    for name in names:
+        deltas[name] = deltas.get(name, 0) + delta
+
+def _listen(model, attribute: str, names: Callable[[object], List[str]] = _single):
+    def after_insert(mapper, connection, target):
+        deltas: Dict[str, int] = {}
+        _count(deltas, names(getattr(target, attribute)), 1)
+        _adjust(connection, deltas)
+
+    def after_delete(mapper, connection, target):
+        deltas: Dict[str, int] = {}
+        _count(deltas, names(getattr(target, attribute)), -1)
+        _adjust(connection, deltas)
+
+    def after_update(mapper, connection, target):
+        history = inspect(target).attrs[attribute].history
+        if not history.has_changes():
+            return
+        deltas: Dict[str, int] = {}
+        for value in history.deleted:
+            _count(deltas, names(value), -1)
+        for value in history.added:
+            _count(deltas, names(value), 1)
+        _adjust(connection, deltas)
+
+    # Load the old value on assignment even when it was expired, or the update could not release it
+    event.listen(getattr(model, attribute), "set", lambda target, value, old, initiator: value, active_history=True)
+    event.listen(model, "after_insert", after_insert)
+    event.listen(model, "after_delete", after_delete)
+    event.listen(model, "after_update", after_update)
+
+_tracking = False
+
+def track_blob_references():
+    """Installs the mapper events (once per process)."""
+    global _tracking
+    if _tracking:
+        return
+    for model, attribute in BLOB_COLUMNS:
+        _listen(model, attribute)
+    # Regions are reassigned as a whole, never changed in place
+    _listen(SourceDocument, "regions", region_images)
+    _tracking = True
+
+def referenced_blobs():
+    """SELECT name, count(*) over every referencing column."""
+    parts = [
+        select(getattr(model, attribute).label("name")).where(getattr(model, attribute).isnot(None))
+        for model, attribute in BLOB_COLUMNS
+    ]
+    refs = union_all(*parts).subquery()
+    return select(refs.c.name, func.count().label("refcount")).group_by(refs.c.name)
+
+def rebuild_blob_refs(db: Session) -> int:
+    """Recounts every blob from the referencing tables (after bulk changes or a migration); returns the number of blobs."""
+    counts = dict(db.execute(referenced_blobs()).all())
+    for (regions,) in db.execute(select(SourceDocument.regions).where(SourceDocument.regions.isnot(None)).execution_options(yield_per=1000)):
+        for name in region_images(regions):
+            counts[name] = counts.get(name, 0) + 1
+    now = datetime.utcnow()
+    rows = [{"name": name, "refcount": count, "updated_at": now} for name, count in counts.items()]
+    db.execute(delete(BlobRef))
+    if rows:
+        db.execute(BlobRef.__table__.insert(), rows)
+    db.commit()
+    logger.info(f"Rebuilt reference counts for {len(rows)} blobs")
+    return len(rows)
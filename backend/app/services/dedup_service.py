@@ -0,0 +1,168 @@
+import os
+import hashlib
+from typing import List, Optional, Tuple
+import PIL.Image
+import PIL.ImageOps
+from sqlalchemy.orm import Session
+from ..models import Problem, ProblemFingerprint
+from .search_service import normalize_search_text
+from .log_sink import get_logger
+from .tracing import traced
+
+logger = get_logger("dedup")
+
+BAND_COUNT = 8 # 8 bands x 8 bits: candidates are complete for distances up to 7
+FAILED_ANALYSIS_LATEX = "\\text{Analysis Failed}"
+
+def _threshold(env_name: str, default: int) -> int:
+    value = int(os.getenv(env_name, str(default)))
+    return max(0, min(value, BAND_COUNT - 1))
+
+def dedup_enabled() -> bool:
+    return os.getenv("DEDUP_ENABLED", "true").lower() not in ("0", "false", "no")
+
+@traced("dedup.image_hash")
+def image_hash(image_path: str) -> Optional[str]:
+    """
+    64-bit difference hash (dHash) of an image as 16 hex chars.
+    Robust to re-compression, resizing and small lighting changes, which is what
+    re-photographing the same worksheet produces, but too coarse to tell apart
+    different problems laid out alike: a match is a hint, never proof (see
+    DedupService.find_duplicate). Returns None if the file can't be read.
+    """
+    try:
+        with PIL.Image.open(image_path) as img:
+            img = PIL.ImageOps.exif_transpose(img)
+            small = img.convert("L").resize((9, 8), PIL.Image.LANCZOS)
+            pixels = list(small.getdata())
+    except Exception as e:
+        logger.warning(f"Failed to hash image {image_path}: {e}")
+        return None
+
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f"{bits:016x}"
+
+def latex_simhash(latex: Optional[str]) -> Optional[str]:
+    """
+    64-bit SimHash over word 3-shingles of the normalized LaTeX (same normalization
+    as search). Returns None for empty/failed analyses, which must never match each other.
+    """
+    if not latex or latex == FAILED_ANALYSIS_LATEX:
+        return None
+    tokens = normalize_search_text(latex).split()
+    if len(tokens) < 3:
+        return None
+
+    weights = [0] * 64
+    for i in range(len(tokens) - 2):
+        shingle = " ".join(tokens[i:i + 3]).encode("utf-8")
+        h = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if (h >> bit) & 1 else -1
+
+    bits = 0
+    for bit in range(64):
+        if weights[bit] > 0:
+            bits |= 1 << bit
+    return f"{bits:016x}"
+
+def hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+def band_keys(hex_hash: str) -> List[str]:
+    return [f"{i}:{hex_hash[i * 2:i * 2 + 2]}" for i in range(BAND_COUNT)]
+
+class DedupService:
+    def __init__(self, db: Session):
+        self.db = db
+        self.image_max_distance = _threshold("DEDUP_IMAGE_MAX_DISTANCE", 4)
+        self.text_max_distance = _threshold("DEDUP_TEXT_MAX_DISTANCE", 3)
+
+    def _find(self, kind: str, hex_hash: Optional[str], max_distance: int, exclude_id: Optional[int] = None) -> Optional[Problem]:
+        if not hex_hash:
+            return None
+        hash_column = Problem.image_hash if kind == "image" else Problem.latex_simhash
+
+        candidates = self.db.query(Problem.id, hash_column).join(
+            ProblemFingerprint, ProblemFingerprint.problem_id == Problem.id
+        ).filter(
+            ProblemFingerprint.kind == kind,
+            ProblemFingerprint.band_key.in_(band_keys(hex_hash))
+        ).distinct().all()
+
+        best: Optional[Tuple[int, int]] = None
+        for problem_id, candidate_hash in candidates:
+            if problem_id == exclude_id or not candidate_hash:
+                continue
+            distance = hamming(hex_hash, candidate_hash)
+            # Closest wins; ties go to the oldest (lowest id) copy
+            if distance <= max_distance and (best is None or (distance, problem_id) < best):
+                best = (distance, problem_id)
+
+        if best is None:
+            return None
+        return self.db.query(Problem).filter(Problem.id == best[1]).first()
+
+    def find_image_duplicate(self, hex_hash: Optional[str], exclude_id: Optional[int] = None) -> Optional[Problem]:
+        return self._find("image", hex_hash, self.image_max_distance, exclude_id)
+
+    def find_text_duplicate(self, hex_hash: Optional[str], exclude_id: Optional[int] = None) -> Optional[Problem]:
+        return self._find("latex", hex_hash, self.text_max_distance, exclude_id)
+
+    def find_exact_duplicate(self, image_path: str, exclude_id: Optional[int] = None) -> Optional[Problem]:
+        """
+        The oldest analyzed problem stored under the same blob, i.e. a byte-identical
+        photo (blob names are content hashes). The only match that may skip analysis.
+        """
+        query = self.db.query(Problem).filter(Problem.image_path == image_path, Problem.latex_simhash != None)
+        if exclude_id is not None:
+            query = query.filter(Problem.id != exclude_id)
+        return query.order_by(Problem.id.asc()).first()
+
+    def find_duplicate(self, img_hash: Optional[str], text_hash: Optional[str], exclude_id: Optional[int] = None) -> Optional[Problem]:
+        """
+        Near-duplicate of an analyzed problem. A close image hash is only a hint:
+        worksheets sharing a layout hash alike whatever the problem, so the image
+        match counts only when its text agrees too; otherwise the text decides.
+        """
+        if not text_hash:
+            return None
+        hinted = self.find_image_duplicate(img_hash, exclude_id)
+        if hinted and hinted.latex_simhash and hamming(hinted.latex_simhash, text_hash) <= self.text_max_distance:
+            return hinted
+        return self.find_text_duplicate(text_hash, exclude_id)
+
+    def find_user_copy(self, duplicate: Problem, user_id: int) -> Optional[Problem]:
+        """The user's own problem for the same canonical problem, if they already have one."""
+        canonical = canonical_id(duplicate)
+        return self.db.query(Problem).filter(
+            Problem.user_id == user_id,
+            (Problem.id == canonical) | (Problem.duplicate_of_id == canonical)
+        ).order_by(Problem.id.asc()).first()
+
+    def index_problem(self, problem: Problem):
+        """Stores LSH bands for the problem's hashes. Caller commits."""
+        self.db.query(ProblemFingerprint).filter(ProblemFingerprint.problem_id == problem.id).delete(synchronize_session=False)
+        for kind, hex_hash in (("image", problem.image_hash), ("latex", problem.latex_simhash)):
+            if not hex_hash:
+                continue
+            for key in band_keys(hex_hash):
+                self.db.add(ProblemFingerprint(problem_id=problem.id, kind=kind, band_key=key))
+
+    def refresh_problem(self, problem: Problem):
+        """
+        Recomputes the text hash after (re)analysis and re-indexes the problem.
+        Failed analyses are removed from the index entirely. Caller commits.
+        """
+        problem.latex_simhash = latex_simhash(problem.latex_content)
+        if problem.latex_simhash is None:
+            problem.image_hash = None
+        self.index_problem(problem)
+
+def canonical_id(problem: Problem) -> int:
+    return problem.duplicate_of_id or problem.id
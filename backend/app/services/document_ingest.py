@@ -0,0 +1,90 @@
+"""
+Ingestion of multi-problem documents: scanner PDFs and worksheet photos.
+
+Pages are rendered and segmented in a process pool (DOCUMENT_PROCESSES,
+default min(4, CPUs); 0 renders in the threadpool) by page_segmentation, and
+each problem region is stored in the artifact store as its own PNG. The upload
+router analyzes the regions and creates one Problem per region.
+"""
+import io
+import os
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
+from .artifact_store import artifact_store
+from .page_segmentation import Box, extract_page_regions, is_pdf, page_count
+from .upload_ingest import UploadRejected, verify_image
+from .log_sink import get_logger
+
+logger = get_logger("documents")
+
+MAX_DOCUMENT_PAGES = int(os.getenv("MAX_DOCUMENT_PAGES", "50"))
+DOCUMENT_DPI = int(os.getenv("DOCUMENT_DPI", "200"))
+# Regions analyzed by the model at the same time, per document
+DOCUMENT_ANALYSIS_CONCURRENCY = int(os.getenv("DOCUMENT_ANALYSIS_CONCURRENCY", "4"))
+
+def verify_document(path: str) -> str:
+    """Like verify_image, but also accepts PDFs of up to MAX_DOCUMENT_PAGES pages; returns the extension to store it under."""
+    if not is_pdf(path):
+        return verify_image(path)
+    import pypdfium2
+    try:
+        pages = page_count(path)
+    except pypdfium2.PdfiumError as e:
+        logger.info(f"PDF verification failed: {e}")
+        raise UploadRejected("Corrupt or password-protected PDF", 415)
+    if pages == 0:
+        raise UploadRejected("PDF has no pages", 415)
+    if pages > MAX_DOCUMENT_PAGES:
+        raise UploadRejected(f"PDF has {pages} pages; at most {MAX_DOCUMENT_PAGES} are accepted", 413)
+    return "pdf"
+
+class DocumentRasterizer:
+    def __init__(self):
+        self.max_processes = int(os.getenv("DOCUMENT_PROCESSES", str(min(4, os.cpu_count() or 1))))
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _process_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.max_processes <= 0:
+            return None
+        with self._lock:
+            if self._processes is None:
+                # spawn: forking a process that runs the watcher/scheduler threads isn't safe
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.max_processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._processes
+
+    async def page_regions(self, path: str, page_index: int) -> List[Tuple[Box, str]]:
+        """Renders and segments one page off the event loop; returns (box, stored name) per problem region."""
+        pool = self._process_pool()
+        if pool is None:
+            regions = await run_in_threadpool(extract_page_regions, path, page_index, DOCUMENT_DPI)
+        else:
+            try:
+                regions = await asyncio.wrap_future(pool.submit(extract_page_regions, path, page_index, DOCUMENT_DPI))
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM on a huge page); start a fresh pool for the next page
+                with self._lock:
+                    if self._processes is pool:
+                        self._processes = None
+                pool.shutdown(wait=False)
+                raise
+        stored = []
+        for box, png in regions:
+            name, _ = await run_in_threadpool(artifact_store.save_upload, io.BytesIO(png), "png")
+            stored.append((box, name))
+        return stored
+
+    def shutdown(self):
+        with self._lock:
+            if self._processes:
+                self._processes.shutdown(wait=False, cancel_futures=True)
+                self._processes = None
+
+document_rasterizer = DocumentRasterizer()
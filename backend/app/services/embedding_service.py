@@ -0,0 +1,249 @@
+import os
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from ..models import Problem, PracticeProblem, ProblemEmbedding
+from .dedup_service import FAILED_ANALYSIS_LATEX
+from .log_sink import get_logger
+
+logger = get_logger("embedding")
+
+SOURCE_MODELS = {"problem": Problem, "practice": PracticeProblem}
+
+def embedding_model_name() -> str:
+    return os.getenv("MODEL_EMBEDDING", "models/text-embedding-004")
+
+def encode_vector(values) -> bytes:
+    """L2-normalizes and packs a vector as little-endian float16 (2 bytes per dimension)."""
+    vec = np.asarray(values, dtype=np.float32)
+    norm = np.linalg.norm(vec)
+    if norm > 0:
+        vec = vec / norm
+    return vec.astype("<f2").tobytes()
+
+def decode_vector(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<f2")
+
+def embedding_text(latex: Optional[str], ai_analysis) -> Optional[str]:
+    """Text that gets embedded: the problem statement plus its knowledge points."""
+    if not latex or latex == FAILED_ANALYSIS_LATEX:
+        return None
+    kps = []
+    if isinstance(ai_analysis, dict):
+        kps = [str(kp) for kp in ai_analysis.get("knowledge_points") or []]
+    if kps:
+        return f"{latex}\n知识点: {', '.join(kps)}"
+    return latex
+
+class _Partition:
+    def __init__(self):
+        self.keys: List[Tuple[str, int]] = []
+        self.positions: Dict[Tuple[str, int], int] = {}
+        self.matrix = np.zeros((0, 0), dtype=np.float16)
+        self.last_id = 0
+        self.lock = threading.Lock()
+
+class EmbeddingIndex:
+    """
+    In-process vector index, partitioned by (embedding model, knowledge_path).
+    Each partition is a float16 matrix of unit vectors searched by a single
+    matrix-vector product: partitions hold hundreds to a few thousand problems,
+    where exact search is sub-millisecond and needs no ANN training/rebuilds.
+    Partitions load lazily and pull only rows newer than the last seen id, so
+    inserts made by other workers show up on the next query.
+    """
+
+    def __init__(self):
+        self._partitions: Dict[Tuple[str, str], _Partition] = {}
+        self._lock = threading.Lock()
+
+    def _partition(self, model: str, path: str) -> _Partition:
+        key = (model, path)
+        with self._lock:
+            part = self._partitions.get(key)
+            if part is None:
+                part = self._partitions[key] = _Partition()
+            return part
+
+    def sync(self, db: Session, model: str, path: str) -> _Partition:
+        part = self._partition(model, path)
+        rows = db.query(
+            ProblemEmbedding.id, ProblemEmbedding.source_type, ProblemEmbedding.source_id, ProblemEmbedding.vector
+        ).filter(
+            ProblemEmbedding.model == model,
+            ProblemEmbedding.knowledge_path == path,
+            ProblemEmbedding.id > part.last_id
+        ).order_by(ProblemEmbedding.id.asc()).all()
+        if not rows:
+            return part
+
+        with part.lock:
+            appended_keys = []
+            appended_vectors = []
+            for row_id, source_type, source_id, blob in rows:
+                key = (source_type, source_id)
+                vec = decode_vector(blob)
+                if key in part.positions:
+                    # Re-embedded (e.g. after reanalysis): overwrite in place
+                    part.matrix[part.positions[key]] = vec
+                else:
+                    appended_keys.append(key)
+                    appended_vectors.append(vec)
+            if appended_vectors:
+                new_rows = np.vstack(appended_vectors)
+                part.matrix = new_rows if part.matrix.size == 0 else np.vstack([part.matrix, new_rows])
+                for key in appended_keys:
+                    part.positions[key] = len(part.keys)
+                    part.keys.append(key)
+            part.last_id = rows[-1][0]
+        return part
+
+    def search(
+        self,
+        db: Session,
+        path: str,
+        query: np.ndarray,
+        limit: int,
+        min_similarity: float,
+        exclude: Set[Tuple[str, int]],
+    ) -> List[Tuple[str, int, float]]:
+        part = self.sync(db, embedding_model_name(), path)
+        with part.lock:
+            if part.matrix.size == 0 or part.matrix.shape[1] != query.shape[0]:
+                return []
+            scores = part.matrix.astype(np.float32) @ query.astype(np.float32)
+            keys = list(part.keys)
+
+        # Over-fetch so excluded keys don't starve the result
+        k = min(len(keys), limit + len(exclude))
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(keys) else np.arange(len(keys))
+        results = []
+        for i in sorted(top, key=lambda i: -scores[i]):
+            if scores[i] < min_similarity:
+                break
+            if keys[i] in exclude:
+                continue
+            results.append((keys[i][0], keys[i][1], float(scores[i])))
+            if len(results) >= limit:
+                break
+        return results
+
+embedding_index = EmbeddingIndex()
+
+class EmbeddingService:
+    def __init__(self, db: Session, ai_service):
+        self.db = db
+        self.ai_service = ai_service
+
+    async def embed(self, source_type: str, obj, force: bool = False) -> Optional[np.ndarray]:
+        """
+        Returns the stored unit vector for `obj`, computing and storing it if missing
+        or produced by a different embedding model. Caller commits.
+        """
+        existing = self.db.query(ProblemEmbedding).filter(
+            ProblemEmbedding.source_type == source_type,
+            ProblemEmbedding.source_id == obj.id
+        ).first()
+        if existing and existing.model == embedding_model_name() and not force:
+            return decode_vector(existing.vector)
+
+        content = embedding_text(obj.latex_content, obj.ai_analysis)
+        if not content:
+            return None
+        values = await self.ai_service.embed_text(content)
+        blob = encode_vector(values)
+
+        if existing:
+            # New row id so the in-memory partitions pick up the change
+            self.db.delete(existing)
+            self.db.flush()
+        self.db.add(ProblemEmbedding(
+            source_type=source_type,
+            source_id=obj.id,
+            knowledge_path=obj.knowledge_path or "",
+            model=embedding_model_name(),
+            dim=len(values),
+            vector=blob
+        ))
+        return decode_vector(blob)
+
+    def _exclusions(self, problem: Problem, user_id: int) -> Set[Tuple[str, int]]:
+        """The problem itself, its duplicates, and practice the user already has for it."""
+        canonical = problem.duplicate_of_id or problem.id
+        exclude = {("problem", problem.id)}
+        same = self.db.query(Problem.id).filter((Problem.id == canonical) | (Problem.duplicate_of_id == canonical)).all()
+        exclude.update(("problem", pid) for (pid,) in same)
+
+        practice = self.db.query(PracticeProblem.id, PracticeProblem.ai_analysis).filter(
+            PracticeProblem.source_problem_id == problem.id,
+            PracticeProblem.user_id == user_id
+        ).all()
+        for pid, analysis in practice:
+            exclude.add(("practice", pid))
+            if isinstance(analysis, dict) and analysis.get("bank_source"):
+                source_type, _, source_id = analysis["bank_source"].partition(":")
+                exclude.add((source_type, int(source_id)))
+        return exclude
+
+    async def find_bank_matches(self, problem: Problem, user_id: int, limit: int = 2, min_similarity: Optional[float] = None) -> List[dict]:
+        """
+        Existing problems / practice problems in the same knowledge_path that are
+        semantically close to `problem`, best first.
+        """
+        if min_similarity is None:
+            min_similarity = float(os.getenv("BANK_MIN_SIMILARITY", "0.85"))
+        if not problem.knowledge_path:
+            return []
+
+        query = await self.embed("problem", problem)
+        if query is None:
+            return []
+        self.db.commit()
+
+        hits = embedding_index.search(
+            self.db, problem.knowledge_path, query, limit, min_similarity, self._exclusions(problem, user_id)
+        )
+
+        matches = []
+        for source_type, source_id, score in hits:
+            obj = self.db.query(SOURCE_MODELS[source_type]).filter(SOURCE_MODELS[source_type].id == source_id).first()
+            # Rows may have been deleted or re-classified since they were indexed
+            if not obj or obj.knowledge_path != problem.knowledge_path:
+                continue
+            analysis = obj.ai_analysis if isinstance(obj.ai_analysis, dict) else {}
+            matches.append({
+                "source_type": source_type,
+                "source_id": source_id,
+                "latex_content": obj.latex_content,
+                "difficulty": obj.difficulty,
+                "knowledge_path": obj.knowledge_path,
+                "similarity": round(score, 4),
+                "thinking_process": analysis.get("thinking_process", ""),
+                "solution": analysis.get("solution", ""),
+                "answer": analysis.get("answer", ""),
+            })
+        return matches
+
+async def index_embeddings(ai_service, items: List[Tuple[str, int]], force: bool = False):
+    """
+    Background task: embeds newly inserted problems so they become searchable.
+    Failures are logged and skipped; the backfill script can catch up later.
+    """
+    db = SessionLocal()
+    try:
+        service = EmbeddingService(db, ai_service)
+        for source_type, source_id in items:
+            model = SOURCE_MODELS[source_type]
+            obj = db.query(model).filter(model.id == source_id).first()
+            if not obj:
+                continue
+            try:
+                await service.embed(source_type, obj, force=force)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Failed to embed {source_type} {source_id}: {e}")
+    finally:
+        db.close()
@@ -4,35 +4,61 @@ from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import threading
 import asyncio
+from typing import Optional
+from .log_sink import get_logger
+
+logger = get_logger("watcher")
+
+SCAN_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.pdf')
 
 class ScanHandler(FileSystemEventHandler):
     def __init__(self, callback):
         self.callback = callback
 
     def on_created(self, event):
-        if not event.is_directory and event.src_path.lower().endswith(('.jpg', '.jpeg', '.png')):
-            print(f"New scan detected: {event.src_path}")
-            # Run callback in a thread-safe way or simply call it
-            # For async callback, we might need a loop
+        if not event.is_directory:
+            self._dispatch(event.src_path)
+
+    def on_moved(self, event):
+        # Scanners often write a temporary file and rename it when done
+        if not event.is_directory:
+            self._dispatch(event.dest_path)
+
+    def _dispatch(self, path: str):
+        if path.lower().endswith(SCAN_EXTENSIONS):
+            logger.info(f"New scan detected: {path}")
+            # Called on the observer thread; the callback hands the file to the event loop
             if self.callback:
-                 self.callback(event.src_path)
+                 self.callback(path)
 
 class FileWatcher:
     def __init__(self, watch_dir: str, callback):
         self.watch_dir = watch_dir
         self.callback = callback
-        self.observer = Observer()
+        self.observer: Optional[Observer] = None
         
         # Ensure directory exists
         if not os.path.exists(watch_dir):
             os.makedirs(watch_dir)
 
     def start(self):
+        if self.observer:
+            return
+        # A stopped observer cannot be restarted: a new one for every start
+        self.observer = Observer()
         event_handler = ScanHandler(self.callback)
         self.observer.schedule(event_handler, self.watch_dir, recursive=False)
         self.observer.start()
-        print(f"Started watching directory: {self.watch_dir}")
+        logger.info(f"Started watching directory: {self.watch_dir}")
+
+    def queue_depth(self) -> int:
+        """Events received by the observer but not yet handled."""
+        return self.observer.event_queue.qsize() if self.observer else 0
 
     def stop(self):
+        if not self.observer:
+            return
         self.observer.stop()
         self.observer.join()
+        self.observer = None
+        logger.info(f"Stopped watching directory: {self.watch_dir}")
@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+from ..database import SessionLocal
+from ..models import KnowledgeNode
+from .log_sink import get_logger
+
+logger = get_logger("knowledge")
+
+@dataclass(frozen=True)
+class KnowledgeNodeEntry:
+    id: int
+    name: str
+    path: str
+
+class KnowledgeRegistry:
+    """
+    In-memory copy of the (small, mostly static) knowledge_nodes table.
+    Loaded at startup and reloaded lazily once the TTL has expired, so request
+    handlers can validate and name knowledge paths without a DB round trip.
+    """
+
+    def __init__(self, ttl_seconds: Optional[int] = None):
+        if ttl_seconds is None:
+            ttl_seconds = int(os.getenv("KNOWLEDGE_REGISTRY_TTL", "300"))
+        self.ttl_seconds = ttl_seconds
+        self._by_path: Dict[str, KnowledgeNodeEntry] = {}
+        self._by_name: Dict[str, str] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, db=None) -> int:
+        """(Re)loads all nodes from the database. Returns the number of nodes loaded."""
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            rows = db.query(KnowledgeNode.id, KnowledgeNode.name, KnowledgeNode.path).all()
+        finally:
+            if own_session:
+                db.close()
+
+        by_path = {}
+        by_name = {}
+        for node_id, name, path in rows:
+            path = str(path)
+            by_path[path] = KnowledgeNodeEntry(id=node_id, name=name, path=path)
+            by_name.setdefault(name, path)
+
+        with self._lock:
+            self._by_path = by_path
+            self._by_name = by_name
+            self._loaded_at = time.monotonic()
+        return len(by_path)
+
+    def refresh(self) -> int:
+        return self.load()
+
+    def _ensure_fresh(self):
+        if time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return
+        try:
+            self.load()
+        except Exception as e:
+            # Keep serving the previous snapshot; retry after another TTL.
+            logger.error(f"Failed to refresh knowledge registry: {e}")
+            with self._lock:
+                self._loaded_at = time.monotonic()
+
+    def get(self, path: Optional[str]) -> Optional[KnowledgeNodeEntry]:
+        if not path:
+            return None
+        self._ensure_fresh()
+        return self._by_path.get(path)
+
+    def path_for(self, name: Optional[str]) -> Optional[str]:
+        if not name:
+            return None
+        self._ensure_fresh()
+        return self._by_name.get(name)
+
+    def resolve(self, path: Optional[str]) -> Optional[str]:
+        """
+        Maps an AI-provided knowledge path onto a known node.
+        Exact path first, then a node name (models sometimes answer with the label),
+        then the nearest existing ancestor (SH_MATH.03.02.07 -> SH_MATH.03.02).
+        Returns None if nothing matches. If the registry is empty (table missing
+        or never loaded) the path is passed through unchanged.
+        """
+        if not path:
+            return None
+        path = path.strip()
+        self._ensure_fresh()
+        by_path = self._by_path
+        if not by_path:
+            return path
+        if path in by_path:
+            return path
+        if path in self._by_name:
+            return self._by_name[path]
+
+        parts = path.split(".")
+        while len(parts) > 1:
+            parts.pop()
+            candidate = ".".join(parts)
+            if candidate in by_path:
+                return candidate
+        return None
+
+    def name_for(self, path: Optional[str], default: Optional[str] = None) -> Optional[str]:
+        """Name of the node at `path`, or of its nearest known ancestor."""
+        resolved = self.resolve(path)
+        entry = self._by_path.get(resolved) if resolved else None
+        return entry.name if entry else default
+
+knowledge_registry = KnowledgeRegistry()
@@ -0,0 +1,223 @@
+"""
+Renders problem text (prose with $...$ math, as produced by the vision prompt)
+to PNG with matplotlib mathtext, and caches the result on disk.
+
+Each distinct (text, render settings) pair is rendered once: files are named by
+the sha256 of their input, sharded into 256 subdirectories, and evicted
+least-recently-used (by mtime, refreshed on every hit) once the cache grows
+past LATEX_CACHE_MAX_MB. Safe to share between processes.
+"""
+import os
+import re
+import hashlib
+import threading
+from typing import List, Optional, Tuple
+from .log_sink import get_logger
+
+logger = get_logger("latex")
+
+RENDER_VERSION = "1" # bump when the rendering changes so old images are not reused
+DEFAULT_DPI = 200
+DEFAULT_FONT_SIZE = 11
+WRAP_CHARS = 60 # characters per line; CJK text has no spaces to wrap on
+CJK_FONT_FAMILIES = [
+    "PingFang SC", "Heiti SC", "Noto Sans CJK SC", "Source Han Sans SC",
+    "Microsoft YaHei", "SimHei", "WenQuanYi Micro Hei",
+]
+
+_MATH_SEGMENT = re.compile(r"(\$[^$]*\$)")
+# Environments and commands mathtext doesn't know, mapped to something it does
+_UNSUPPORTED = [
+    (re.compile(r"\\(?:begin|end)\{[a-z*]+\}"), ""),
+    (re.compile(r"\\(?:underline|boxed|mathrm|textbf|textrm)\{([^{}]*)\}"), r"\1"),
+    (re.compile(r"\\(?:left|right)(?=[.()\[\]|])\.?"), ""),
+    (re.compile(r"\\\\"), r";\\quad "),
+    (re.compile(r"\\(?:dfrac|tfrac)"), r"\\frac"),
+    (re.compile(r"&"), " "),
+]
+
+def _default_cache_dir() -> str:
+    from .artifact_store import artifact_store
+    return artifact_store.path("latex_cache")
+
+def _simplify(text: str) -> str:
+    for pattern, replacement in _UNSUPPORTED:
+        text = pattern.sub(replacement, text)
+    return text
+
+def _plain(text: str) -> str:
+    # Last resort: show the source itself; "\$" is a literal dollar in matplotlib
+    return text.replace("$", r"\$")
+
+def wrap_text(text: str, width: int = WRAP_CHARS) -> List[str]:
+    """
+    Splits text into lines of roughly `width` visible characters, never breaking
+    inside a $...$ segment, so each line stays valid mathtext on its own.
+    """
+    lines = []
+    for paragraph in text.splitlines() or [""]:
+        current = ""
+        length = 0
+        for segment in _MATH_SEGMENT.split(paragraph):
+            if not segment:
+                continue
+            if segment.startswith("$") and segment.endswith("$") and len(segment) > 1:
+                cost = max(1, len(segment) // 2) # commands render much narrower than their source
+                if length + cost > width and current:
+                    lines.append(current)
+                    current, length = "", 0
+                current += segment
+                length += cost
+                continue
+            for char in segment:
+                if length >= width and current:
+                    lines.append(current)
+                    current, length = "", 0
+                current += char
+                length += 1
+        lines.append(current)
+    return lines
+
+class LatexRenderCache:
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or os.getenv("LATEX_CACHE_DIR") or _default_cache_dir()
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("LATEX_CACHE_MAX_MB", "200")) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._rendering = {} # key -> Lock, so concurrent requests render a formula once
+        self._size: Optional[int] = None # bytes on disk, computed lazily
+        self._font = None
+
+    def key(self, text: str, dpi: int = DEFAULT_DPI, font_size: int = DEFAULT_FONT_SIZE) -> str:
+        payload = f"{RENDER_VERSION}|{dpi}|{font_size}|{os.getenv('REPORT_FONT_PATH', '')}|{text}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.png")
+
+    def render(self, text: Optional[str], dpi: int = DEFAULT_DPI, font_size: int = DEFAULT_FONT_SIZE) -> Optional[Tuple[str, str]]:
+        """
+        Returns (png_path, key) for the rendered text, rendering it on a cache miss.
+        Returns None for empty text or if nothing could be rendered.
+        """
+        if not text or not text.strip():
+            return None
+        key = self.key(text, dpi, font_size)
+        path = self.path_for(key)
+        if self._touch(path):
+            return path, key
+
+        with self._lock:
+            key_lock = self._rendering.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                if self._touch(path): # rendered by another thread while we waited
+                    return path, key
+                size = self._render_to(path, text, dpi, font_size)
+            finally:
+                with self._lock:
+                    self._rendering.pop(key, None)
+        if size is None:
+            return None
+
+        self._account(size)
+        return path, key
+
+    def _touch(self, path: str) -> bool:
+        try:
+            os.utime(path) # marks it recently used for eviction
+            return True
+        except OSError:
+            return False
+
+    def _font_properties(self):
+        # Without a CJK font Chinese prose renders as empty boxes
+        if self._font is None:
+            from matplotlib.font_manager import FontProperties, fontManager
+            font_path = os.getenv("REPORT_FONT_PATH")
+            if font_path and os.path.exists(font_path):
+                self._font = FontProperties(fname=font_path)
+            else:
+                installed = {f.name for f in fontManager.ttflist}
+                families = [name for name in CJK_FONT_FAMILIES if name in installed]
+                self._font = FontProperties(family=families + ["DejaVu Sans"])
+        return self._font
+
+    def _render_to(self, path: str, text: str, dpi: int, font_size: int) -> Optional[int]:
+        # Imported lazily: matplotlib is heavy and only needed on a cache miss
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        font = self._font_properties().copy()
+        font.set_size(font_size)
+        for candidate in (text, _simplify(text), _plain(text)):
+            fig = Figure()
+            FigureCanvasAgg(fig)
+            fig.text(0, 1, "\n".join(wrap_text(candidate)), fontproperties=font, va="top", ha="left")
+            try:
+                fig.savefig(tmp_path, dpi=dpi, bbox_inches="tight", pad_inches=0.05, transparent=True, format="png")
+            except Exception:
+                # mathtext parse errors surface at draw time; try a simpler form
+                continue
+            os.replace(tmp_path, path)
+            return os.path.getsize(path)
+
+        logger.warning(f"Failed to render LaTeX: {text[:80]!r}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return None
+
+    def _account(self, added: int):
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += added
+            if self._size <= self.max_bytes:
+                return
+            self._size = self._evict()
+
+    def _disk_usage(self) -> int:
+        total = 0
+        for entry in self._entries():
+            total += entry[2]
+        return total
+
+    def _entries(self) -> List[Tuple[float, str, int]]:
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for f in os.scandir(shard.path):
+                if f.name.endswith(".png"):
+                    try:
+                        stat = f.stat()
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, f.path, stat.st_size))
+        return entries
+
+    def _evict(self) -> int:
+        """Deletes least recently used files down to 80% of the budget. Returns the new size."""
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        target = int(self.max_bytes * 0.8)
+        removed = 0
+        for _, path, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        logger.info(f"LaTeX cache: evicted {removed} images ({total // 1024} KiB left)")
+        return total
+
+latex_cache = LatexRenderCache()
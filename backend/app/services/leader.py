@@ -0,0 +1,215 @@
+"""
+Leader election between worker processes, so work that must happen once (the
+scan directory watcher, scheduled jobs) runs in exactly one process however
+many uvicorn/gunicorn workers and nodes share the database.
+
+With PostgreSQL the leader is the process holding a session-level advisory
+lock (pg_try_advisory_lock) on a dedicated connection. PostgreSQL releases it
+as soon as that connection ends, so when the leader dies, or its node drops
+off the network and TCP keepalives give up, another worker takes over within
+LEADER_RETRY_SECONDS (default 10). The leader checks its connection just as
+often and steps down when it is lost. Session locks do not survive a
+transaction-mode pooler (PgBouncer); point LEADER_DATABASE_URL at the server
+directly in that case.
+
+Other databases (SQLite: one host) use an exclusive flock on a lock file next
+to the database, which the OS releases when the process exits.
+LEADER_ELECTION=off makes every process a leader, which is only right with a
+single worker.
+
+Election only covers the work above. State the workers share lives in the
+database (report job progress, scheduled_job_runs) or, for one host, behind
+an flock (resumable upload PATCH/finalize). Partial resumable uploads stay on
+the node that received them, so with several nodes a client's requests for
+one upload must reach the same node (sticky sessions or a shared
+ARTIFACT_ROOT).
+"""
+import os
+import hashlib
+import tempfile
+import threading
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+from ..database import engine
+from .log_sink import get_logger
+
+logger = get_logger("leader")
+
+def _lock_key(name: str) -> int:
+    """Stable signed 64-bit advisory lock key for `name`."""
+    return int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], "big", signed=True)
+
+class _AdvisoryLock:
+    def __init__(self, key: int, url):
+        self.key = key
+        connect_args = {}
+        if url.get_driver_name() == "psycopg2":
+            # Detect a dead server (or a dead network) within about a minute
+            connect_args = {"keepalives": 1, "keepalives_idle": 30, "keepalives_interval": 10, "keepalives_count": 3}
+        # Not from the pool: the lock lives exactly as long as this one session
+        self.engine = create_engine(url, poolclass=NullPool, isolation_level="AUTOCOMMIT", connect_args=connect_args)
+        self.conn = None
+
+    def acquire(self) -> bool:
+        conn = self.engine.connect()
+        try:
+            acquired = conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}).scalar()
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self.conn = conn
+        return True
+
+    def alive(self) -> bool:
+        try:
+            self.conn.execute(text("SELECT 1"))
+            return True
+        except Exception:
+            self._close()
+            return False
+
+    def release(self):
+        if self.conn is None:
+            return
+        try:
+            self.conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+        except Exception:
+            pass # the session ending releases it anyway
+        self._close()
+
+    def _close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        self.conn = None
+
+class _FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self.fd: Optional[int] = None
+
+    def acquire(self) -> bool:
+        import fcntl
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode()) # for whoever wonders which process it is
+        self.fd = fd
+        return True
+
+    def alive(self) -> bool:
+        return self.fd is not None
+
+    def release(self):
+        if self.fd is not None:
+            os.close(self.fd) # drops the flock
+            self.fd = None
+
+class _NoLock:
+    def acquire(self) -> bool:
+        return True
+
+    def alive(self) -> bool:
+        return True
+
+    def release(self):
+        pass
+
+class LeaderElection:
+    def __init__(self, name: str = "mathrob-leader"):
+        self.name = name
+        self.mode = os.getenv("LEADER_ELECTION", "auto").lower() # auto, off
+        self.retry_seconds = float(os.getenv("LEADER_RETRY_SECONDS", "10"))
+        self._callbacks: List[Tuple[Optional[Callable[[], None]], Optional[Callable[[], None]]]] = []
+        self._leader = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = None
+
+    def _create_lock(self):
+        if self.mode == "off":
+            return _NoLock()
+        if engine.dialect.name == "postgresql":
+            return _AdvisoryLock(_lock_key(self.name), make_url(os.getenv("LEADER_DATABASE_URL") or engine.url))
+        try:
+            import fcntl # noqa: F401
+        except ImportError:
+            logger.warning("No advisory locks or flock available: every process runs the leader's work")
+            return _NoLock()
+        database = engine.url.database
+        directory = os.path.dirname(os.path.abspath(database)) if database and database != ":memory:" else tempfile.gettempdir()
+        return _FileLock(os.path.join(directory, f".{self.name}.lock"))
+
+    def on_change(self, elected: Optional[Callable[[], None]] = None, demoted: Optional[Callable[[], None]] = None):
+        """Registers callbacks run (on the election thread) when this process becomes or stops being the leader."""
+        self._callbacks.append((elected, demoted))
+
+    def is_leader(self) -> bool:
+        return self._leader.is_set()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._lock = self._lock or self._create_lock()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Steps down (running the demoted callbacks) and releases the lock for another process."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.retry_seconds + 5)
+        if self.is_leader():
+            self._demote()
+        if self._lock:
+            self._lock.release()
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.is_leader():
+                try:
+                    acquired = self._lock.acquire()
+                except Exception as e:
+                    logger.warning(f"Leader election failed: {e}")
+                    acquired = False
+                if acquired and not self._stop.is_set():
+                    self._elect()
+            elif not self._lock.alive():
+                logger.error("Lost the leader lock (database connection gone); stepping down")
+                self._demote()
+            self._stop.wait(self.retry_seconds)
+
+    def _elect(self):
+        logger.info(f"Process {os.getpid()} is now the leader")
+        self._leader.set()
+        for elected, _ in self._callbacks:
+            if not elected:
+                continue
+            try:
+                elected()
+            except Exception as e:
+                logger.exception(f"Leader start-up callback failed: {e}")
+
+    def _demote(self):
+        self._leader.clear()
+        for _, demoted in reversed(self._callbacks):
+            if not demoted:
+                continue
+            try:
+                demoted()
+            except Exception as e:
+                logger.exception(f"Leader step-down callback failed: {e}")
+        logger.info(f"Process {os.getpid()} is no longer the leader")
+
+leader = LeaderElection()
@@ -0,0 +1,204 @@
+"""
+Application logging: every module logs to a "mathrob.<area>" logger, which
+prints to the console and feeds SystemLogHandler.
+
+SystemLogHandler never touches the database on the calling thread. Records go
+into a bounded in-memory ring buffer; a background thread drains it and
+bulk-inserts SystemLog rows in batches. When the buffer is full the oldest
+entries are dropped and counted, so a burst of failures (e.g. a Gemini outage)
+can't slow requests down or grow memory without bound.
+"""
+import os
+import sys
+import json
+import logging
+import threading
+import traceback
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import insert, delete, select
+
+ROOT_LOGGER = "mathrob"
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+def get_logger(area: str) -> logging.Logger:
+    """Logger for one area of the app; the area doubles as the SystemLog category."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{area}")
+
+def _json_safe(value):
+    try:
+        return json.loads(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return str(value)
+
+class SystemLogHandler(logging.Handler):
+    def __init__(self, capacity: int = 10000, batch_size: int = 200, flush_interval: float = 1.0, level: int = logging.WARNING):
+        super().__init__(level)
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = deque(maxlen=capacity)
+        self._buffer_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.dropped = 0 # entries pushed out of a full buffer
+        self.written = 0
+        self.failed = 0 # entries lost to failed inserts
+        self._dropped_reported = 0
+
+    def emit(self, record: logging.LogRecord):
+        if self._thread is not None and threading.get_ident() == self._thread.ident:
+            return # never log our own DB writes back into the buffer
+        try:
+            entry = self._to_row(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self._buffer_lock:
+            if len(self._buffer) == self.capacity:
+                self.dropped += 1
+            self._buffer.append(entry)
+            full_batch = len(self._buffer) >= self.batch_size
+        if full_batch:
+            self._wakeup.set()
+
+    def _to_row(self, record: logging.LogRecord) -> dict:
+        category = getattr(record, "category", None)
+        if not category:
+            category = record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(ROOT_LOGGER + ".") else record.name
+        details = getattr(record, "details", None)
+        if details is not None and not isinstance(details, dict):
+            details = {"details": details}
+        # Any other extra={...} fields are kept alongside the details
+        extra = {k: v for k, v in vars(record).items() if k not in _RESERVED and k not in ("category", "details", "model")}
+        if extra or record.exc_info:
+            details = dict(details or {})
+            details.update(extra)
+            if record.exc_info:
+                details.setdefault("traceback", "".join(traceback.format_exception(*record.exc_info)))
+        return {
+            "level": record.levelname,
+            "category": category[:50],
+            "model": (str(record.model)[:100] if getattr(record, "model", None) else None),
+            "message": record.getMessage(),
+            "details": _json_safe(details) if details is not None else None,
+            "created_at": datetime.utcfromtimestamp(record.created),
+        }
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="system-log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the writer after flushing what is buffered."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._buffer_lock:
+            queued = len(self._buffer)
+        return {"queued": queued, "capacity": self.capacity, "dropped": self.dropped, "written": self.written, "failed": self.failed}
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._drain()
+        self._drain()
+
+    def _take_batch(self) -> list:
+        with self._buffer_lock:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            dropped = self.dropped - self._dropped_reported
+            self._dropped_reported = self.dropped
+        if dropped:
+            batch.append({
+                "level": "WARNING",
+                "category": "logging",
+                "model": None,
+                "message": f"Log buffer full: dropped {dropped} oldest entries",
+                "details": {"dropped_total": self.dropped, "capacity": self.capacity},
+                "created_at": datetime.utcnow(),
+            })
+        return batch
+
+    def _drain(self):
+        from ..database import SessionLocal
+        from ..models import SystemLog
+
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            db = SessionLocal()
+            try:
+                db.execute(insert(SystemLog), batch)
+                db.commit()
+                self.written += len(batch)
+            except Exception as e:
+                db.rollback()
+                self.failed += len(batch)
+                # stderr, not logging: a failing DB must not feed the buffer it drains
+                print(f"Failed to write {len(batch)} system log entries: {e}", file=sys.stderr)
+                return
+            finally:
+                db.close()
+
+def purge_system_logs(retention_days: Optional[int] = None, batch_size: int = 5000) -> int:
+    """
+    Deletes SystemLog rows older than retention_days (SYSTEM_LOG_RETENTION_DAYS,
+    default 30; 0 keeps everything). Works in id-ordered batches so each
+    transaction stays short and never locks the whole table. Returns rows deleted.
+    """
+    from ..database import SessionLocal
+    from ..models import SystemLog
+
+    if retention_days is None:
+        retention_days = int(os.getenv("SYSTEM_LOG_RETENTION_DAYS", "30"))
+    if retention_days <= 0:
+        return 0
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+
+    total = 0
+    db = SessionLocal()
+    try:
+        while True:
+            ids = select(SystemLog.id).where(SystemLog.created_at < cutoff).order_by(SystemLog.id).limit(batch_size)
+            deleted = db.execute(delete(SystemLog).where(SystemLog.id.in_(ids.scalar_subquery()))).rowcount
+            db.commit()
+            total += deleted
+            if deleted < batch_size:
+                break
+    finally:
+        db.close()
+    if total:
+        logging.getLogger(f"{ROOT_LOGGER}.logging").info(f"Purged {total} system log entries older than {retention_days} days")
+    return total
+
+system_log_handler = SystemLogHandler(
+    capacity=int(os.getenv("SYSTEM_LOG_BUFFER", "10000")),
+    batch_size=int(os.getenv("SYSTEM_LOG_BATCH", "200")),
+    flush_interval=float(os.getenv("SYSTEM_LOG_FLUSH_SECONDS", "1.0")),
+    level=logging.getLevelName(os.getenv("SYSTEM_LOG_LEVEL", "WARNING").upper()),
+)
+
+def configure_logging():
+    """Console output plus the SystemLog sink for all "mathrob.*" loggers. Idempotent."""
+    logger = logging.getLogger(ROOT_LOGGER)
+    if getattr(logger, "_mathrob_configured", False):
+        return
+    logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+    logger.addHandler(console)
+    logger.addHandler(system_log_handler)
+    logger.propagate = False
+    logger._mathrob_configured = True
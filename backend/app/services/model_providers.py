@@ -0,0 +1,210 @@
+"""
+Model backends behind AIService, chosen with AI_PROVIDER:
+
+- "gemini" (default): Google Gemini through google-generativeai.
+- "fake": an offline stand-in for benchmarks and local development. It needs
+  no API key and returns canned answers for each category with configurable
+  latency and failures:
+
+    FAKE_AI_LATENCY_MS      "median" or "median,p95" of a lognormal (default "800,2500")
+    FAKE_AI_429_RATE        fraction of calls failing with a rate limit (default 0)
+    FAKE_AI_503_RATE        fraction failing with service unavailable (default 0)
+    FAKE_AI_MALFORMED_RATE  fraction of answers with raw LaTeX backslashes /
+                            markdown fences that need JSON repair (default 0)
+    FAKE_AI_SEED            makes the sequence reproducible
+
+Failures use the same messages as the Gemini client, so AIService's error
+classification and fallback handle them the same way.
+
+get_provider() hands out one provider per process, created on first use:
+google.generativeai takes about a second to import, which workers that never
+call the model (or not yet) should not pay at boot.
+"""
+import os
+import json
+import math
+import random
+import asyncio
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from .log_sink import get_logger
+
+logger = get_logger("ai")
+
+@dataclass
+class ModelResponse:
+    text: str
+    prompt_tokens: int = 0
+    candidate_tokens: int = 0
+
+class ModelProvider(ABC):
+    name = ""
+
+    @abstractmethod
+    async def generate(self, category: str, model_name: str, prompt: str, image_path: Optional[str] = None) -> ModelResponse:
+        """One model call; failures raise with the provider's own error message."""
+
+    @abstractmethod
+    async def embed(self, model_name: str, text: str, task_type: str) -> List[float]:
+        """Embedding vector of `text`."""
+
+    def list_models(self) -> List[str]:
+        return []
+
+class GeminiProvider(ModelProvider):
+    name = "gemini"
+
+    def __init__(self):
+        import google.generativeai as genai
+        self.genai = genai
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            logger.warning("GEMINI_API_KEY not set")
+        else:
+            genai.configure(api_key=api_key)
+
+    async def generate(self, category: str, model_name: str, prompt: str, image_path: Optional[str] = None) -> ModelResponse:
+        import PIL.Image
+        from .tracing import get_tracer
+
+        model = self.genai.GenerativeModel(model_name)
+        content = [prompt]
+        if image_path:
+            # PIL.Image.open is lazy; decoding happens when the request is sent.
+            # Opened fresh for each attempt to avoid closed file issues.
+            with get_tracer(__name__).start_as_current_span("ai.image_open"):
+                content.append(PIL.Image.open(image_path))
+        response = await model.generate_content_async(
+            content,
+            generation_config={"response_mime_type": "application/json"}
+        )
+        usage = getattr(response, "usage_metadata", None)
+        return ModelResponse(
+            text=response.text,
+            prompt_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+            candidate_tokens=getattr(usage, "candidates_token_count", 0) or 0,
+        )
+
+    async def embed(self, model_name: str, text: str, task_type: str) -> List[float]:
+        result = await self.genai.embed_content_async(model=model_name, content=text, task_type=task_type)
+        return result["embedding"]
+
+    def list_models(self) -> List[str]:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            return []
+        self.genai.configure(api_key=api_key)
+        return [
+            m.name.replace("models/", "")
+            for m in self.genai.list_models()
+            if 'generateContent' in m.supported_generation_methods
+        ]
+
+FAKE_RESPONSES = {
+    "vision": {
+        "latex_content": "已知函数 $f(x)=\\frac{1}{x}+\\sqrt{x-1}$，求 $f(x)$ 的定义域，并判断 $f(x)$ 在 $[1,+\\infty)$ 上的单调性。",
+        "difficulty": 2,
+        "knowledge_points": ["函数的定义域", "函数的单调性"],
+        "knowledge_path": "SH_MATH.03.02",
+        "ai_analysis": {
+            "topic": ["函数"],
+            "solution": "由 $x \\neq 0$ 且 $x-1 \\geq 0$ 得定义域为 $[1,+\\infty)$。\n\n$\\frac{1}{x}$ 递减，$\\sqrt{x-1}$ 递增，需求导判断：$f'(x)=-\\frac{1}{x^2}+\\frac{1}{2\\sqrt{x-1}}$。",
+            "thinking_process": "先求定义域，再用导数判断单调性。"
+        }
+    },
+    "utility": {
+        "problems": [
+            {
+                "latex": "已知函数 $g(x)=\\frac{2}{x}+\\sqrt{x-2}$，求 $g(x)$ 的定义域。",
+                "solution": "由 $x \\neq 0$ 且 $x \\geq 2$ 得定义域为 $[2,+\\infty)$。",
+                "thinking_process": "分式分母不为零，根号下非负。",
+                "answer": "$[2,+\\infty)$"
+            },
+            {
+                "latex": "求函数 $h(x)=\\ln(x-1)+\\frac{1}{x-3}$ 的定义域。",
+                "solution": "$x>1$ 且 $x \\neq 3$，定义域为 $(1,3)\\cup(3,+\\infty)$。",
+                "thinking_process": "对数真数大于零，分母不为零。",
+                "answer": "$(1,3)\\cup(3,+\\infty)$"
+            }
+        ]
+    },
+    "teaching": {
+        "score": 75,
+        "logic_gaps": ["未说明 $x \\neq 0$ 的条件"],
+        "calculation_errors": [],
+        "suggestions": "定义域求解正确，但应写出每个限制条件的来源。单调性部分可以用 $f'(x)$ 的符号说明。"
+    },
+}
+
+class FakeProvider(ModelProvider):
+    name = "fake"
+
+    def __init__(self):
+        latency = [float(v) for v in os.getenv("FAKE_AI_LATENCY_MS", "800,2500").split(",") if v.strip()]
+        self.median_ms = latency[0]
+        # Lognormal with the given median and 95th percentile (sigma = ln(p95/median) / 1.645)
+        self.sigma = math.log(latency[1] / latency[0]) / 1.645 if len(latency) > 1 and latency[1] > latency[0] > 0 else 0.0
+        self.rate_429 = float(os.getenv("FAKE_AI_429_RATE", "0"))
+        self.rate_503 = float(os.getenv("FAKE_AI_503_RATE", "0"))
+        self.malformed_rate = float(os.getenv("FAKE_AI_MALFORMED_RATE", "0"))
+        seed = os.getenv("FAKE_AI_SEED")
+        self.random = random.Random(int(seed) if seed else None)
+
+    def _latency(self) -> float:
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms * math.exp(self.random.gauss(0, self.sigma)) / 1000
+
+    async def generate(self, category: str, model_name: str, prompt: str, image_path: Optional[str] = None) -> ModelResponse:
+        await asyncio.sleep(self._latency())
+        roll = self.random.random()
+        if roll < self.rate_429:
+            raise RuntimeError("429 Resource has been exhausted (e.g. check quota). retry_delay { seconds: 5 }")
+        if roll < self.rate_429 + self.rate_503:
+            raise RuntimeError("503 The service is currently unavailable.")
+
+        text = json.dumps(FAKE_RESPONSES.get(category, {}), ensure_ascii=False)
+        if self.random.random() < self.malformed_rate:
+            # What models actually send: unescaped LaTeX backslashes in a fenced block
+            text = "```json\n" + text.replace("\\\\", "\\") + "\n```"
+        # Roughly Gemini's accounting: ~4 characters per token, 258 tokens per image
+        return ModelResponse(
+            text=text,
+            prompt_tokens=len(prompt) // 4 + (258 if image_path else 0),
+            candidate_tokens=len(text) // 4,
+        )
+
+    async def embed(self, model_name: str, text: str, task_type: str) -> List[float]:
+        # Deterministic per text, so identical problems still embed identically
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        vector = [rng.gauss(0, 1) for _ in range(768)]
+        norm = math.sqrt(sum(v * v for v in vector))
+        return [v / norm for v in vector]
+
+    def list_models(self) -> List[str]:
+        return ["fake-flash", "fake-pro"]
+
+_PROVIDERS = {"gemini": GeminiProvider, "fake": FakeProvider}
+
+def create_provider(name: Optional[str] = None) -> ModelProvider:
+    name = (name or os.getenv("AI_PROVIDER", "gemini")).lower()
+    if name not in _PROVIDERS:
+        raise ValueError(f"Unknown AI_PROVIDER: {name} (expected one of {', '.join(_PROVIDERS)})")
+    return _PROVIDERS[name]()
+
+_shared: Dict[str, ModelProvider] = {}
+_shared_lock = threading.Lock()
+
+def get_provider(name: Optional[str] = None) -> ModelProvider:
+    """The process-wide provider for `name` (default AI_PROVIDER), created on the first call."""
+    name = (name or os.getenv("AI_PROVIDER", "gemini")).lower()
+    provider = _shared.get(name)
+    if provider is None:
+        with _shared_lock:
+            provider = _shared.get(name)
+            if provider is None:
+                provider = _shared[name] = create_provider(name)
+    return provider
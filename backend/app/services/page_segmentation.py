@@ -0,0 +1,118 @@
+"""
+Rasterizing scanned documents and cutting each page into problem regions.
+
+Kept free of database/app imports so extract_page_regions can run in worker
+processes: it takes a file path and page number and returns the regions as
+PNG bytes. PDFs are rendered with pdfium; a photographed worksheet is treated
+as a one-page document.
+
+Segmentation is a horizontal projection profile: rows without ink separate
+text lines, and gaps clearly wider than the usual line spacing separate
+problems. That matches how worksheets and exam papers are laid out (problems
+stacked top to bottom); two-column layouts come out as one region per row.
+"""
+import io
+import threading
+from typing import List, Tuple
+import numpy as np
+import PIL.Image
+import PIL.ImageOps
+
+PDF_MAGIC = b"%PDF-"
+INK_THRESHOLD = 160 # grey level below which a pixel counts as ink
+MIN_GAP_INCHES = 0.2 # smallest vertical gap that may separate two problems
+GAP_LINE_RATIO = 2.5 # ... and it must be this much wider than the median line gap
+PAD_INCHES = 0.08
+MAX_REGIONS_PER_PAGE = 12
+MAX_PAGE_PIXELS = 40_000_000
+
+Box = Tuple[int, int, int, int] # left, top, right, bottom (exclusive)
+
+# pdfium is not thread-safe; only matters when pages are rendered in threads
+_pdfium_lock = threading.Lock()
+
+def _pdfium():
+    # Imported on first use: only documents need it, not every worker at boot
+    import pypdfium2
+    return pypdfium2
+
+def is_pdf(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(len(PDF_MAGIC)) == PDF_MAGIC
+
+def page_count(path: str) -> int:
+    """Pages in a PDF (1 for an image). Raises pypdfium2.PdfiumError for unreadable or encrypted PDFs."""
+    if not is_pdf(path):
+        return 1
+    with _pdfium_lock:
+        pdf = _pdfium().PdfDocument(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+def render_page(path: str, page_index: int, dpi: int) -> PIL.Image.Image:
+    if not is_pdf(path):
+        with PIL.Image.open(path) as image:
+            return PIL.ImageOps.exif_transpose(image).convert("RGB")
+    with _pdfium_lock:
+        pdf = _pdfium().PdfDocument(path)
+        try:
+            page = pdf[page_index]
+            width, height = page.get_size() # points
+            scale = dpi / 72
+            # Poster-sized pages are rendered at a lower resolution instead of exhausting memory
+            if width * height * scale * scale > MAX_PAGE_PIXELS:
+                scale = (MAX_PAGE_PIXELS / (width * height)) ** 0.5
+            return page.render(scale=scale).to_pil().convert("RGB")
+        finally:
+            pdf.close()
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Start and (exclusive) end indices of the True runs in a 1-D mask."""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+def segment_page(image: PIL.Image.Image, dpi: int, max_regions: int = MAX_REGIONS_PER_PAGE) -> List[Box]:
+    """Boxes of the problem regions on a page, top to bottom. Empty for a blank page."""
+    ink = np.asarray(image.convert("L")) < INK_THRESHOLD
+    height, width = ink.shape
+    # A few dark pixels in a row are scanner noise, not text
+    rows = ink.sum(axis=1) > max(1, width // 500)
+    starts, ends = _runs(rows)
+    if not len(starts):
+        return []
+
+    gaps = starts[1:] - ends[:-1]
+    split_after: List[int] = []
+    if len(gaps):
+        threshold = max(dpi * MIN_GAP_INCHES, float(np.median(gaps)) * GAP_LINE_RATIO)
+        candidates = np.flatnonzero(gaps >= threshold)
+        # Too many: keep the widest gaps
+        if len(candidates) > max_regions - 1:
+            candidates = np.sort(candidates[np.argsort(gaps[candidates])[::-1][:max_regions - 1]])
+        split_after = candidates.tolist()
+
+    pad = int(dpi * PAD_INCHES)
+    boxes: List[Box] = []
+    first = 0
+    for last in split_after + [len(starts) - 1]:
+        top, bottom = int(starts[first]), int(ends[last])
+        first = last + 1
+        columns = np.flatnonzero(ink[top:bottom].any(axis=0))
+        left, right = int(columns[0]), int(columns[-1]) + 1
+        # Page numbers and stray marks: short and narrow
+        if bottom - top < dpi * 0.3 and right - left < width * 0.1:
+            continue
+        boxes.append((max(0, left - pad), max(0, top - pad), min(width, right + pad), min(height, bottom + pad)))
+    return boxes
+
+def extract_page_regions(path: str, page_index: int, dpi: int) -> List[Tuple[Box, bytes]]:
+    """Worker entry point: renders one page and returns (box, PNG bytes) per problem region."""
+    image = render_page(path, page_index, dpi)
+    regions = []
+    for box in segment_page(image, dpi):
+        buffer = io.BytesIO()
+        image.crop(box).save(buffer, "PNG")
+        regions.append((box, buffer.getvalue()))
+    return regions
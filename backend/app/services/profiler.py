@@ -0,0 +1,121 @@
+"""
+Opt-in sampling profiler for single requests.
+
+An admin adds ?profile=1 to any API call; instead of the normal response they
+get the request's samples in collapsed-stack format ("frame;frame;frame count"
+per line), which flamegraph.pl, speedscope and inferno read directly.
+
+A background thread snapshots every thread's Python stack every
+PROFILE_INTERVAL_MS (default 5). Only stacks that pass through app code are
+kept, which covers both async handlers on the event loop and sync handlers in
+the threadpool. Concurrent requests also run app code, so profile on a quiet
+instance. Time spent awaiting I/O (e.g. the Gemini call) is not on any stack;
+use tracing spans for that.
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from typing import Callable, Optional
+from urllib.parse import parse_qs
+from starlette.concurrency import run_in_threadpool
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_DEPTH = 128
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample_count += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                in_app = False
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    code = frame.f_code
+                    in_app = in_app or code.co_filename.startswith(APP_DIR)
+                    stack.append(_frame_label(code))
+                    frame = frame.f_back
+                if in_app:
+                    self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+class ProfileMiddleware:
+    """
+    ASGI middleware for ?profile=1. `is_allowed(token)` decides whether the
+    bearer token may profile; everyone else gets the normal response. It may
+    block (a database lookup), so it runs in the threadpool.
+    """
+
+    def __init__(self, app, is_allowed: Callable[[str], bool]):
+        self.app = app
+        self.is_allowed = is_allowed
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not await self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = SamplingProfiler(float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000)
+        status = {"code": 500}
+
+        async def discard(message):
+            # The profile replaces the response; only its status is kept
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, discard)
+        finally:
+            profiler.stop()
+
+        body = profiler.collapsed().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+                (b"x-profile-samples", str(profiler.sample_count).encode()),
+                (b"x-profile-duration-ms", f"{profiler.duration * 1000:.1f}".encode()),
+                (b"x-profile-status", str(status["code"]).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def _requested(self, scope) -> bool:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        if query.get("profile") != ["1"]:
+            return False
+        headers = dict(scope.get("headers") or [])
+        auth = headers.get(b"authorization", b"").decode("latin-1")
+        if not auth.lower().startswith("bearer "):
+            return False
+        return await run_in_threadpool(self.is_allowed, auth[7:].strip())
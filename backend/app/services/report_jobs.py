@@ -0,0 +1,445 @@
+import os
+import re
+import time
+import threading
+import uuid
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from ..database import SessionLocal
+from ..models import User, ReportJobRecord
+from .log_sink import get_logger
+from .tracing import traced
+
+logger = get_logger("reports")
+
+class ReportJob:
+    def __init__(self, kind: str, user_ids: List[int], week_start: date, class_name: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind # user, all_users, cohort
+        self.class_name = class_name
+        self.summary_path: Optional[str] = None # cohort: teacher summary PDF, relative to uploads
+        self.user_ids = user_ids
+        self.week_start = week_start
+        self.status = "pending" # pending, running, completed, failed
+        self.total = len(user_ids)
+        self.completed = 0
+        self.skipped = 0 # stats unchanged, existing PDF reused
+        self.failed = 0
+        self.report_ids: List[int] = []
+        self.errors: List[str] = []
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock() # one progress write at a time, so an older one never lands last
+        self._saved_at = 0.0
+
+    @classmethod
+    def from_record(cls, record: ReportJobRecord, stale_after: timedelta) -> "ReportJob":
+        """A read-only view of a job another process (or this one, earlier) is running or ran."""
+        job = cls(record.kind, [record.user_id] if record.user_id else [], record.week_start, record.class_name)
+        job.id = record.id
+        job.status = record.status
+        job.total = record.total
+        job.completed = record.completed
+        job.skipped = record.skipped
+        job.failed = record.failed
+        job.report_ids = list(record.report_ids or [])
+        job.summary_path = record.summary_path
+        job.errors = list(record.errors or [])
+        job.created_at = record.created_at
+        job.finished_at = record.finished_at
+        if job.status in ("pending", "running") and record.updated_at and record.updated_at < datetime.utcnow() - stale_after:
+            # The process running it went away without finishing
+            job.status = "failed"
+            job.errors.append("interrupted")
+        return job
+
+    def record_values(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "user_id": self.user_ids[0] if self.kind == "user" else None,
+            "class_name": self.class_name,
+            "week_start": self.week_start,
+            "status": self.status,
+            "total": self.total,
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "report_ids": list(self.report_ids),
+            "summary_path": self.summary_path,
+            "errors": self.errors[-10:],
+            "created_at": self.created_at,
+            "updated_at": datetime.utcnow(),
+            "finished_at": self.finished_at,
+        }
+
+    def to_dict(self) -> dict:
+        done = self.completed + self.failed
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "class_name": self.class_name,
+            "status": self.status,
+            "week_start": self.week_start.isoformat(),
+            "total": self.total,
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "progress": round(done / self.total, 3) if self.total else 1.0,
+            "report_ids": self.report_ids,
+            "summary_path": self.summary_path,
+            "errors": self.errors[-10:],
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+def previous_week_start(today: Optional[date] = None) -> date:
+    today = today or date.today()
+    return today - timedelta(days=today.weekday() + 7)
+
+def cohort_summary_filename(class_name: str, week_start: date) -> str:
+    slug = re.sub(r"[^\w-]+", "_", class_name).strip("_") or "class"
+    return f"class_report_{slug}_{week_start.isoformat()}.pdf"
+
+class ReportJobManager:
+    """
+    Runs weekly report generation off the request path on a shared thread pool.
+    Job progress is written to report_jobs (at most every SAVE_INTERVAL while
+    running), so whichever worker process a status poll reaches can answer it;
+    only the running process keeps the job in memory. That process also touches
+    the rows of its unfinished jobs every HEARTBEAT_INTERVAL, queued ones
+    included, so a job whose row goes JOB_STALE_AFTER without an update is
+    reported as failed: its process stopped. Rows are deleted JOB_RETENTION
+    after their last update.
+    Cohort jobs render their PDFs in a process pool (REPORT_PROCESSES) so a whole
+    class renders in parallel; each worker process keeps its styles, fonts and
+    thumbnails loaded between documents.
+    """
+    JOB_RETENTION = timedelta(hours=24)
+    JOB_STALE_AFTER = timedelta(minutes=5)
+    SAVE_INTERVAL = 1.0 # seconds
+    HEARTBEAT_INTERVAL = 60.0 # seconds
+
+    def __init__(self, max_workers: Optional[int] = None):
+        if max_workers is None:
+            max_workers = int(os.getenv("REPORT_WORKERS", "4"))
+        self.max_workers = max_workers
+        self.max_processes = int(os.getenv("REPORT_PROCESSES", str(min(4, os.cpu_count() or 1))))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, ReportJob] = {} # running in this process
+        self._lock = threading.Lock()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._heartbeat_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="report")
+            return self._executor
+
+    def _process_pool(self) -> Optional[ProcessPoolExecutor]:
+        if self.max_processes <= 0:
+            return None
+        with self._lock:
+            if self._processes is None:
+                # spawn: forking a process that runs the watcher/scheduler threads isn't safe
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.max_processes, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._processes
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        job = self._jobs.get(job_id)
+        if job:
+            return job
+        db = SessionLocal()
+        try:
+            record = db.get(ReportJobRecord, job_id)
+            return ReportJob.from_record(record, self.JOB_STALE_AFTER) if record else None
+        finally:
+            db.close()
+
+    def submit_user_report(self, user_id: int, week_start: date) -> ReportJob:
+        """Queues one user's report; repeated clicks while it runs (on any worker) return the same job."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind == "user" and job.user_ids == [user_id] and job.week_start == week_start and job.status in ("pending", "running"):
+                    return job
+            db = SessionLocal()
+            try:
+                record = db.query(ReportJobRecord).filter(
+                    ReportJobRecord.user_id == user_id,
+                    ReportJobRecord.week_start == week_start,
+                    ReportJobRecord.kind == "user",
+                    ReportJobRecord.status.in_(("pending", "running")),
+                    ReportJobRecord.updated_at >= datetime.utcnow() - self.JOB_STALE_AFTER
+                ).first()
+            finally:
+                db.close()
+            if record:
+                return ReportJob.from_record(record, self.JOB_STALE_AFTER)
+            job = ReportJob("user", [user_id], week_start)
+            self._save(job, force=True)
+            self._track(job)
+        self._prune()
+        return self._start(job)
+
+    def submit_all_users(self, week_start: Optional[date] = None) -> ReportJob:
+        week_start = week_start or previous_week_start()
+        db = SessionLocal()
+        try:
+            user_ids = [row[0] for row in db.query(User.id).order_by(User.id).all()]
+        finally:
+            db.close()
+        logger.info(f"Scheduling weekly reports for {len(user_ids)} users (week of {week_start})")
+        return self._submit(ReportJob("all_users", user_ids, week_start))
+
+    def submit_cohort(self, class_name: str, week_start: Optional[date] = None) -> ReportJob:
+        """Queues per-student reports for a class plus a teacher summary PDF."""
+        week_start = week_start or previous_week_start()
+        db = SessionLocal()
+        try:
+            user_ids = [row[0] for row in db.query(User.id).filter(User.class_name == class_name).order_by(User.id).all()]
+        finally:
+            db.close()
+        job = ReportJob("cohort", user_ids, week_start, class_name=class_name)
+        self._prune()
+        self._save(job, force=True)
+        self._track(job)
+        self._pool().submit(self._run_cohort, job)
+        return job
+
+    def _submit(self, job: ReportJob) -> ReportJob:
+        self._prune()
+        if not job.user_ids:
+            job.status = "completed"
+            job.finished_at = datetime.utcnow()
+            self._finish(job)
+            return job
+        self._save(job, force=True)
+        self._track(job)
+        return self._start(job)
+
+    def _start(self, job: ReportJob) -> ReportJob:
+        pool = self._pool()
+        for user_id in job.user_ids:
+            pool.submit(self._run_one, job, user_id)
+        return job
+
+    @traced("report.job", root=True)
+    def _run_one(self, job: ReportJob, user_id: int):
+        from .report_service import ReportService
+
+        with job._lock:
+            if job.status == "pending":
+                job.status = "running"
+
+        db = SessionLocal()
+        try:
+            report, rebuilt = ReportService(db).generate_weekly_report(user_id=user_id, week_start=job.week_start)
+            with job._lock:
+                job.completed += 1
+                if not rebuilt:
+                    job.skipped += 1
+                job.report_ids.append(report.id)
+        except Exception as e:
+            db.rollback()
+            self._record_failure(job, user_id, e)
+        finally:
+            db.close()
+
+        with job._lock:
+            done = job.completed + job.failed
+            if job.kind == "all_users" and (done % 10 == 0 or done == job.total):
+                logger.info(f"Weekly reports: {done}/{job.total} done ({job.failed} failed)")
+            if done == job.total:
+                job.status = "failed" if job.failed == job.total else "completed"
+                job.finished_at = datetime.utcnow()
+        if job.finished_at:
+            self._finish(job)
+        else:
+            self._save(job)
+
+    @traced("report.cohort_job", root=True)
+    def _run_cohort(self, job: ReportJob):
+        from .report_service import ReportService, REPORT_DIR
+        from .report_render import render_student_report, render_cohort_summary
+        from .artifact_store import artifact_store
+
+        job.status = "running"
+        self._save(job, force=True)
+        db = SessionLocal()
+        try:
+            service = ReportService(db)
+            names = dict(db.query(User.id, User.name).filter(User.id.in_(job.user_ids)).all())
+            usernames = dict(db.query(User.id, User.username).filter(User.id.in_(job.user_ids)).all())
+            students = []
+            pending = []
+            for user_id in job.user_ids:
+                name = names.get(user_id) or usernames.get(user_id) or f"User {user_id}"
+                try:
+                    existing, plan = service.plan_weekly_report(user_id, job.week_start, student=name)
+                except Exception as e:
+                    db.rollback()
+                    self._record_failure(job, user_id, e)
+                    continue
+                students.append({"name": name, **plan["summary"]})
+                if existing:
+                    with job._lock:
+                        job.completed += 1
+                        job.skipped += 1
+                        job.report_ids.append(existing.id)
+                else:
+                    pending.append(plan)
+
+            # Render in worker processes (or inline when REPORT_PROCESSES=0); DB writes stay here
+            pool = self._process_pool()
+            if pool is None:
+                results = []
+                for plan in pending:
+                    try:
+                        render_student_report(plan["file_path"], plan["render"])
+                        results.append((plan, None))
+                    except Exception as e:
+                        results.append((plan, e))
+            else:
+                futures = {pool.submit(render_student_report, plan["file_path"], plan["render"]): plan for plan in pending}
+                results = []
+                for future in as_completed(futures):
+                    results.append((futures[future], future.exception()))
+                if any(isinstance(error, BrokenProcessPool) for _, error in results):
+                    # A worker died (e.g. OOM); start a fresh pool for the next job
+                    with self._lock:
+                        if self._processes is pool:
+                            self._processes = None
+                    pool.shutdown(wait=False)
+
+            for plan, error in results:
+                if error is not None:
+                    self._record_failure(job, plan["user_id"], error)
+                    continue
+                try:
+                    report = service.save_weekly_report(plan)
+                except Exception as e:
+                    db.rollback()
+                    self._record_failure(job, plan["user_id"], e)
+                    continue
+                with job._lock:
+                    job.completed += 1
+                    job.report_ids.append(report.id)
+                self._save(job)
+
+            filename = cohort_summary_filename(job.class_name, job.week_start)
+            os.makedirs(REPORT_DIR, exist_ok=True)
+            render_cohort_summary(os.path.join(REPORT_DIR, filename), {
+                "class_name": job.class_name,
+                "start": job.week_start.isoformat(),
+                "end": (job.week_start + timedelta(days=6)).isoformat(),
+                "students": [{**s, "mastery": {str(k): v for k, v in s["mastery"].items()}} for s in students],
+            })
+            job.summary_path = f"reports/{filename}"
+            artifact_store.publish(job.summary_path)
+            job.status = "failed" if job.total and job.failed == job.total else "completed"
+            logger.info(f"Class report '{job.class_name}': {job.completed}/{job.total} students ({job.skipped} reused, {job.failed} failed)")
+        except Exception as e:
+            logger.error(f"Class report '{job.class_name}' failed: {e}")
+            job.errors.append(str(e))
+            job.status = "failed"
+        finally:
+            db.close()
+            job.finished_at = datetime.utcnow()
+            self._finish(job)
+
+    def _record_failure(self, job: ReportJob, user_id: int, error: Exception):
+        logger.error(f"Report generation failed for user {user_id}: {error}")
+        with job._lock:
+            job.failed += 1
+            job.errors.append(f"user {user_id}: {error}")
+
+    def _save(self, job: ReportJob, force: bool = False):
+        """Writes the job's progress to report_jobs; without `force` at most every SAVE_INTERVAL."""
+        with job._save_lock:
+            now = time.monotonic()
+            if not force and now - job._saved_at < self.SAVE_INTERVAL:
+                return
+            job._saved_at = now
+            with job._lock:
+                values = job.record_values()
+            db = SessionLocal()
+            try:
+                db.merge(ReportJobRecord(**values))
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                if force:
+                    raise
+                logger.warning(f"Could not save progress of report job {job.id}: {e}")
+            finally:
+                db.close()
+
+    def _track(self, job: ReportJob):
+        """Keeps `job` in memory, and its row fresh, until _finish."""
+        self._jobs[job.id] = job
+        with self._heartbeat_lock:
+            if self._heartbeat_thread is None or not self._heartbeat_thread.is_alive():
+                self._stop.clear()
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="report-heartbeat", daemon=True)
+                self._heartbeat_thread.start()
+
+    def _heartbeat(self):
+        """Touches the rows of this process's unfinished jobs, which a queued job would not do itself."""
+        while not self._stop.wait(self.HEARTBEAT_INTERVAL):
+            job_ids = list(self._jobs)
+            if not job_ids:
+                continue
+            db = SessionLocal()
+            try:
+                db.query(ReportJobRecord).filter(ReportJobRecord.id.in_(job_ids)).update(
+                    {"updated_at": datetime.utcnow()}, synchronize_session=False
+                )
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Could not refresh report jobs: {e}")
+            finally:
+                db.close()
+
+    def _finish(self, job: ReportJob):
+        """Final state to the database; from now on polls are answered from there."""
+        try:
+            self._save(job, force=True)
+        except Exception as e:
+            logger.error(f"Could not save the result of report job {job.id}: {e}")
+        finally:
+            self._jobs.pop(job.id, None)
+
+    def _prune(self):
+        """Deletes job rows not updated for JOB_RETENTION (finished, or interrupted long ago)."""
+        cutoff = datetime.utcnow() - self.JOB_RETENTION
+        db = SessionLocal()
+        try:
+            db.query(ReportJobRecord).filter(ReportJobRecord.updated_at < cutoff).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not prune report jobs: {e}")
+        finally:
+            db.close()
+
+    def shutdown(self):
+        self._stop.set()
+        with self._lock:
+            if self._executor:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._processes:
+                self._processes.shutdown(wait=False, cancel_futures=True)
+                self._processes = None
+
+report_jobs = ReportJobManager()
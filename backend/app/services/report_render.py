@@ -0,0 +1,253 @@
+"""
+PDF rendering for weekly and class reports.
+
+Kept free of database/app imports so the render functions can run in worker
+processes: they take plain dict payloads and write a PDF to the given path.
+Styles, fonts and image thumbnails are loaded once per process and reused
+across every document that process renders; problem LaTeX comes from the
+on-disk render cache shared by all processes.
+"""
+import os
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Optional, Tuple
+import PIL.Image
+import PIL.ImageOps
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from .latex_render import latex_cache
+from .log_sink import get_logger
+from .tracing import traced
+
+logger = get_logger("reports")
+
+THUMBNAIL_MAX_SIDE = 800 # px; embedded at 200pt wide, so this is ~4x oversampled
+THUMBNAIL_WIDTH = 200 # pt
+THUMBNAIL_MAX_HEIGHT = 260 # pt
+LATEX_DPI = 200
+LATEX_MAX_WIDTH = 450 # pt; A4 text column with default margins
+LATEX_MAX_HEIGHT = 600 # pt; taller images don't fit a page frame
+
+_thumb_lock = threading.Lock()
+_thumb_sizes = {}
+
+@lru_cache(maxsize=1)
+def body_font() -> str:
+    """
+    Registers REPORT_FONT_PATH (a .ttf with CJK glyphs, e.g. Noto Sans SC) once per
+    process. Falls back to Helvetica, which can't show Chinese text.
+    """
+    font_path = os.getenv("REPORT_FONT_PATH")
+    if font_path and os.path.exists(font_path):
+        try:
+            pdfmetrics.registerFont(TTFont("ReportFont", font_path))
+            return "ReportFont"
+        except Exception as e:
+            logger.warning(f"Failed to register report font {font_path}: {e}")
+    return "Helvetica"
+
+@lru_cache(maxsize=1)
+def styles():
+    sheet = getSampleStyleSheet()
+    font = body_font()
+    if font != "Helvetica":
+        for name in ("Normal", "BodyText", "Title", "Heading2", "Heading3"):
+            sheet[name].fontName = font
+    return sheet
+
+def _table_style(header_rows: int = 1, total_row: bool = False) -> TableStyle:
+    commands = [
+        ('BACKGROUND', (0, 0), (-1, header_rows - 1), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, header_rows - 1), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, header_rows - 1), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (-1, header_rows - 1), 12),
+        ('BACKGROUND', (0, header_rows), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]
+    if total_row:
+        commands.append(('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'))
+    return TableStyle(commands)
+
+def thumbnail(image_path: str, cache_dir: str) -> Optional[Tuple[str, int, int]]:
+    """
+    Downscaled JPEG copy of a problem photo, cached on disk under cache_dir so
+    every process and later runs reuse it. Keyed by path + mtime + size, so a
+    replaced image gets a fresh thumbnail; every use refreshes the file's mtime,
+    which the storage GC expires it by. Returns (path, width, height) or None.
+    """
+    try:
+        stat = os.stat(image_path)
+    except OSError:
+        return None
+    key = hashlib.sha1(f"{os.path.abspath(image_path)}:{stat.st_mtime_ns}:{stat.st_size}".encode("utf-8")).hexdigest()
+    thumb_path = os.path.join(cache_dir, f"{key}.jpg")
+
+    with _thumb_lock:
+        cached = _thumb_sizes.get(key)
+    if cached:
+        try:
+            os.utime(thumb_path) # recently used: kept by StorageGC.expire_thumbnails
+            return thumb_path, *cached
+        except FileNotFoundError:
+            # Expired meanwhile: built again below
+            with _thumb_lock:
+                _thumb_sizes.pop(key, None)
+
+    try:
+        if os.path.exists(thumb_path):
+            os.utime(thumb_path)
+            with PIL.Image.open(thumb_path) as img:
+                size = img.size
+        else:
+            with PIL.Image.open(image_path) as img:
+                img = PIL.ImageOps.exif_transpose(img)
+                img.thumbnail((THUMBNAIL_MAX_SIDE, THUMBNAIL_MAX_SIDE))
+                img = img.convert("RGB")
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp_path = f"{thumb_path}.{os.getpid()}.tmp"
+                img.save(tmp_path, "JPEG", quality=80, optimize=True)
+                os.replace(tmp_path, thumb_path)
+                size = img.size
+    except Exception as e:
+        logger.warning(f"Failed to build thumbnail for {image_path}: {e}")
+        return None
+
+    with _thumb_lock:
+        _thumb_sizes[key] = size
+    return thumb_path, *size
+
+def _image_flowable(image_path: str, cache_dir: str):
+    thumb = thumbnail(image_path, cache_dir)
+    if not thumb:
+        return None
+    path, width, height = thumb
+    draw_width = THUMBNAIL_WIDTH
+    draw_height = draw_width * height / width
+    if draw_height > THUMBNAIL_MAX_HEIGHT:
+        draw_width = draw_width * THUMBNAIL_MAX_HEIGHT / draw_height
+        draw_height = THUMBNAIL_MAX_HEIGHT
+    im = Image(path, width=draw_width, height=draw_height)
+    im.hAlign = 'LEFT'
+    return im
+
+def _latex_flowable(latex: str):
+    """The problem text rendered through the shared LaTeX cache, sized to fit the page."""
+    rendered = latex_cache.render(latex, dpi=LATEX_DPI)
+    if not rendered:
+        return None
+    try:
+        with PIL.Image.open(rendered[0]) as img:
+            width, height = img.size
+    except Exception as e:
+        logger.warning(f"Failed to read rendered LaTeX {rendered[0]}: {e}")
+        return None
+    # Pixels at LATEX_DPI to points, scaled down to fit the text column
+    draw_width = width * 72 / LATEX_DPI
+    draw_height = height * 72 / LATEX_DPI
+    scale = min(1.0, LATEX_MAX_WIDTH / draw_width, LATEX_MAX_HEIGHT / draw_height)
+    im = Image(rendered[0], width=draw_width * scale, height=draw_height * scale)
+    im.hAlign = 'LEFT'
+    return im
+
+@traced("report.render_pdf")
+def render_student_report(path: str, payload: dict):
+    """
+    payload: start, end, uploaded, reviews, mastery ({"1": n, "2": n, "3": n, ...}),
+    thumb_dir, optional student, and problems: [{id, difficulty, image_path, latex_content}]
+    with image_path already resolved to a file on disk (or None).
+    """
+    sheet = styles()
+    mastery = payload["mastery"]
+    elements = []
+
+    # Header
+    elements.append(Paragraph("Weekly Learning Report", sheet['Title']))
+    if payload.get("student"):
+        elements.append(Paragraph(_escape(payload["student"]), sheet['Heading2']))
+    elements.append(Paragraph(f"{payload['start']} to {payload['end']}", sheet['Normal']))
+    elements.append(Spacer(1, 20))
+
+    # Stats Table
+    data = [
+        ["Metric", "Count"],
+        ["Problems Uploaded", str(payload["uploaded"])],
+        ["Reviews Completed", str(payload["reviews"])],
+        ["Mastered (Level 3)", str(mastery.get("3", 0))],
+        ["In Progress (Level 2)", str(mastery.get("2", 0))],
+        ["Needs Work (Level 1)", str(mastery.get("1", 0))],
+    ]
+    t = Table(data)
+    t.setStyle(_table_style())
+    elements.append(t)
+    elements.append(Spacer(1, 40))
+
+    # Review Problems
+    problems = payload.get("problems") or []
+    if problems:
+        elements.append(Paragraph("Recommended Review Problems", sheet['Heading2']))
+        for p in problems:
+            elements.append(Paragraph(f"Problem #{p['id']} (Difficulty: {p.get('difficulty') or '?'})", sheet['Heading3']))
+            if p.get("image_path"):
+                im = _image_flowable(p["image_path"], payload["thumb_dir"])
+                if im is not None:
+                    elements.append(im)
+                else:
+                    elements.append(Paragraph("[Image processing failed]", sheet['Normal']))
+
+            elements.append(Spacer(1, 10))
+            if p.get("latex_content"):
+                latex = _latex_flowable(p["latex_content"])
+                if latex is not None:
+                    elements.append(latex)
+                else:
+                    # Rendering failed; show the source
+                    elements.append(Paragraph(f"LaTeX: {_escape(p['latex_content'][:200])}...", sheet['Normal']))
+            elements.append(Spacer(1, 20))
+
+    SimpleDocTemplate(path, pagesize=A4).build(elements)
+
+@traced("report.render_cohort_summary")
+def render_cohort_summary(path: str, payload: dict):
+    """
+    Teacher overview for one class and week.
+    payload: class_name, start, end, students: [{name, uploaded, reviews, mastery}]
+    """
+    sheet = styles()
+    elements = [
+        Paragraph(f"Class Report: {_escape(payload['class_name'])}", sheet['Title']),
+        Paragraph(f"{payload['start']} to {payload['end']} - {len(payload['students'])} students", sheet['Normal']),
+        Spacer(1, 20),
+    ]
+
+    header = ["Student", "Uploaded", "Reviews", "Level 3", "Level 2", "Level 1", "No Data"]
+    rows = [header]
+    totals = [0] * (len(header) - 1)
+    for s in payload["students"]:
+        m = s["mastery"]
+        values = [s["uploaded"], s["reviews"], m.get("3", 0), m.get("2", 0), m.get("1", 0), m.get("No Data", 0)]
+        totals = [a + b for a, b in zip(totals, values)]
+        rows.append([Paragraph(_escape(s["name"]), sheet['Normal'])] + [str(v) for v in values])
+    rows.append(["Total"] + [str(v) for v in totals])
+
+    t = Table(rows, colWidths=[150] + [55] * (len(header) - 1), repeatRows=1)
+    t.setStyle(_table_style(total_row=True))
+    elements.append(t)
+
+    # Students with no activity this week are the ones a teacher wants to chase up
+    inactive = [s["name"] for s in payload["students"] if not s["uploaded"] and not s["reviews"]]
+    if inactive:
+        elements.append(Spacer(1, 30))
+        elements.append(Paragraph("No Activity This Week", sheet['Heading2']))
+        elements.append(Paragraph(_escape(", ".join(inactive)), sheet['Normal']))
+
+    SimpleDocTemplate(path, pagesize=A4).build(elements)
+
+def _escape(value: str) -> str:
+    # Paragraph parses a mini-markup; LaTeX like "a<b" would otherwise break the build
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
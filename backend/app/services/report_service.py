@@ -1,15 +1,17 @@
 import os
 from datetime import datetime, timedelta, date
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, and_, select
+from sqlalchemy.exc import IntegrityError
 from ..models import Problem, LearningRecord, WeeklyReport, ProblemStatus
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from .report_render import render_student_report
+from .artifact_store import artifact_store
 import json
+import hashlib
+from typing import List, Optional, Tuple
+
+REPORT_DIR = artifact_store.path("reports")
+THUMBNAIL_DIR = artifact_store.path("reports/thumbs")
 
 class ReportService:
     def __init__(self, db: Session):
@@ -38,144 +40,171 @@ class ReportService:
         except:
             pass
 
-    def generate_weekly_report(self, user_id: int, week_start: date = None) -> WeeklyReport:
+    def generate_weekly_report(self, user_id: int, week_start: date = None) -> Tuple[WeeklyReport, bool]:
+        """
+        Builds (or refreshes) the user's report for the week, one row per (user, week).
+        Returns (report, rebuilt); rebuilt is False when the stats are unchanged since
+        the last build and the existing PDF was reused.
+        """
+        existing, plan = self.plan_weekly_report(user_id, week_start)
+        if existing:
+            return existing, False
+
+        render_student_report(plan["file_path"], plan["render"])
+        return self.save_weekly_report(plan), True
+
+    def plan_weekly_report(self, user_id: int, week_start: date = None, student: str = None) -> Tuple[Optional[WeeklyReport], dict]:
+        """
+        Collects everything needed to render the user's report without rendering it.
+        Returns (existing, plan): existing is the current report if it can be reused
+        as-is. plan["render"] is a plain payload for report_render, so it can be
+        rendered in another process.
+        """
         if not week_start:
             today = date.today()
             week_start = today - timedelta(days=today.weekday()) # Monday
 
         end_date = week_start + timedelta(days=6)
         
-        # 1. Aggregate Stats
-        # Problems Created
-        problems_count = self.db.query(Problem).filter(
-            Problem.user_id == user_id,
-            Problem.created_at >= week_start, 
-            Problem.created_at <= end_date + timedelta(days=1)
-        ).count()
-        
-        # Learning Records interactions (Need to join with Problem or have user_id on Record)
-        # We added user_id to LearningRecord, so we can use it directly.
-        records = self.db.query(LearningRecord).filter(
-            LearningRecord.user_id == user_id,
-            LearningRecord.created_at >= week_start,
-            LearningRecord.created_at <= end_date + timedelta(days=1)
-        ).all()
-        
-        reviews_count = len(records)
+        # 1. Aggregate Stats (one round trip, constant memory regardless of history size)
+        summary, stats_hash = self._collect_stats(user_id, week_start, end_date)
+        # The stats hash in the name gives every distinct build its own file, so a
+        # cached download (by ETag) can never be served for a rebuilt report
+        filename = f"weekly_report_user{user_id}_{week_start.isoformat()}_{stats_hash[:12]}.pdf"
+        plan = {
+            "user_id": user_id,
+            "week_start": week_start,
+            "pdf_path": f"reports/{filename}",
+            "file_path": os.path.join(REPORT_DIR, filename),
+            "summary": summary,
+            "stats_hash": stats_hash,
+        }
+
+        # 2. Skip the rebuild if nothing changed since the last build
+        existing = self.db.query(WeeklyReport).filter(
+            WeeklyReport.user_id == user_id,
+            WeeklyReport.week_start == week_start
+        ).first()
+        if existing and existing.stats_hash == stats_hash and artifact_store.locate(existing.pdf_path):
+            return existing, plan
         
-        # Mastery Distribution
+        # 3. Pick 3 review problems from the weak (level 1/2) list
+        review_problems = self._pick_review_problems(user_id, 3)
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        plan["render"] = {
+            "start": week_start.isoformat(),
+            "end": end_date.isoformat(),
+            "student": student,
+            "uploaded": summary["uploaded"],
+            "reviews": summary["reviews"],
+            "mastery": {str(k): v for k, v in summary["mastery"].items()},
+            "thumb_dir": THUMBNAIL_DIR,
+            "problems": [
+                {
+                    "id": p.id,
+                    "difficulty": p.difficulty,
+                    "image_path": artifact_store.resolve(p.image_path),
+                    "latex_content": p.latex_content,
+                }
+                for p in review_problems
+            ],
+        }
+        return None, plan
+
+    def save_weekly_report(self, plan: dict) -> WeeklyReport:
+        """Upserts the (user, week) row once plan["file_path"] has been rendered."""
+        previous = self.db.query(WeeklyReport.pdf_path).filter(
+            WeeklyReport.user_id == plan["user_id"],
+            WeeklyReport.week_start == plan["week_start"]
+        ).scalar()
+        artifact_store.publish(plan["pdf_path"])
+        report = self._upsert_report(plan["user_id"], plan["week_start"], plan["pdf_path"], plan["summary"], plan["stats_hash"])
+        if previous and previous != plan["pdf_path"]:
+            artifact_store.delete(previous) # superseded build
+        return report
+
+    def _collect_stats(self, user_id: int, week_start: date, end_date: date) -> Tuple[dict, str]:
+        """
+        Computes the report summary with grouped aggregates instead of loading records:
+        one row per mastery level carrying the total, this week's activity and a
+        fingerprint (sum of problem ids, latest activity) of the records in that level.
+        Returns (summary, stats_hash).
+        """
+        week_end = end_date + timedelta(days=1)
+        in_week = and_(LearningRecord.created_at >= week_start, LearningRecord.created_at <= week_end)
+        problems_count = select(func.count(Problem.id)).where(
+            Problem.user_id == user_id,
+            Problem.created_at >= week_start,
+            Problem.created_at <= week_end
+        ).scalar_subquery()
+
+        rows = self.db.query(
+            LearningRecord.mastery_level,
+            func.count(LearningRecord.id),
+            func.count(LearningRecord.id).filter(in_week),
+            func.coalesce(func.sum(LearningRecord.problem_id), 0),
+            func.max(LearningRecord.created_at),
+            problems_count,
+        ).filter(
+            LearningRecord.user_id == user_id
+        ).group_by(LearningRecord.mastery_level).all()
+
+        uploaded = None
+        reviews_count = 0
         mastery_counts = {1: 0, 2: 0, 3: 0, "No Data": 0}
-        all_records = self.db.query(LearningRecord).filter(LearningRecord.user_id == user_id).all() # User snapshot
-        for r in all_records:
-            if r.mastery_level:
-                mastery_counts[r.mastery_level] = mastery_counts.get(r.mastery_level, 0) + 1
-            else:
-                mastery_counts["No Data"] += 1
-                
-        # Weak Knowledge Points (Level 1 or 2)
-        # This requires KnowledgePoints linked to Problems
-        # For now, I'll just count how many problems in Level 1/2
-        weak_problem_ids = [r.problem_id for r in all_records if r.mastery_level in [1, 2]]
-        
-        # Pick 3 review problems from weak list
-        review_problems = []
-        if weak_problem_ids:
-            import random
-            selected_ids = random.sample(weak_problem_ids, min(3, len(weak_problem_ids)))
-            review_problems = self.db.query(Problem).filter(Problem.id.in_(selected_ids)).all()
-            
-        # 2. Generate PDF
-        # Ensure user-specific filename to avoid collision? 
-        # Or just timestamp. User ID in filename is safer.
-        filename = f"weekly_report_user{user_id}_{week_start.isoformat()}.pdf"
-        output_dir = "backend/uploads/reports"
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            
-        file_path = os.path.join(output_dir, filename)
-        
-        self._create_pdf(file_path, week_start, end_date, problems_count, reviews_count, mastery_counts, review_problems)
-        
-        # 3. Save to DB
+        fingerprint = {}
+        for level, total, this_week, id_sum, last_activity, uploaded_count in rows:
+            uploaded = uploaded_count
+            reviews_count += this_week
+            key = level if level else "No Data"
+            mastery_counts[key] = mastery_counts.get(key, 0) + total
+            fingerprint[str(level)] = [total, int(id_sum), last_activity.isoformat() if last_activity else None]
+
+        if uploaded is None:
+            # No learning records at all: the grouped query returned no rows
+            uploaded = self.db.query(problems_count).scalar()
+
         summary = {
-            "uploaded": problems_count,
+            "uploaded": uploaded,
             "reviews": reviews_count,
             "mastery": mastery_counts
         }
-        
-        report = WeeklyReport(
-            user_id=user_id,
-            week_start=week_start,
-            pdf_path=f"reports/{filename}",
-            summary_json=summary
+        payload = {
+            "uploaded": uploaded,
+            "reviews": reviews_count,
+            "mastery": {str(k): v for k, v in mastery_counts.items()},
+            "records": fingerprint,
+        }
+        stats_hash = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+        return summary, stats_hash
+
+    def _pick_review_problems(self, user_id: int, count: int) -> List[Problem]:
+        """Random weak (level 1/2) problems, sampled in the database."""
+        weak_ids = select(LearningRecord.problem_id).where(
+            LearningRecord.user_id == user_id,
+            LearningRecord.mastery_level.in_([1, 2])
         )
-        self.db.add(report)
-        self.db.commit()
-        self.db.refresh(report)
-        return report
+        return self.db.query(Problem).filter(Problem.id.in_(weak_ids)).order_by(func.random()).limit(count).all()
 
-    def _create_pdf(self, path, start, end, uploaded, reviews, mastery, problems):
-        doc = SimpleDocTemplate(path, pagesize=A4)
-        styles = getSampleStyleSheet()
-        elements = []
-        
-        # Header
-        elements.append(Paragraph(f"Weekly Learning Report", styles['Title']))
-        elements.append(Paragraph(f"{start} to {end}", styles['Normal']))
-        elements.append(Spacer(1, 20))
-        
-        # Stats Table
-        data = [
-            ["Metric", "Count"],
-            ["Problems Uploaded", str(uploaded)],
-            ["Reviews Completed", str(reviews)],
-            ["Mastered (Level 3)", str(mastery.get(3, 0))],
-            ["In Progress (Level 2)", str(mastery.get(2, 0))],
-            ["Needs Work (Level 1)", str(mastery.get(1, 0))],
-        ]
-        
-        t = Table(data)
-        t.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(t)
-        elements.append(Spacer(1, 40))
-        
-        # Review Problems
-        if problems:
-            elements.append(Paragraph("Recommended Review Problems", styles['Heading2']))
-            for p in problems:
-                elements.append(Paragraph(f"Problem #{p.id} (Difficulty: {p.difficulty or '?'})", styles['Heading3']))
-                # If image exists, add it
-                if p.image_path:
-                    # p.image_path is likely just filename or relative path
-                    img_path = os.path.join("backend/uploads", p.image_path.split('/')[-1]) 
-                    
-                    if not os.path.exists(img_path) and "backend" not in p.image_path:
-                         img_path = os.path.join("backend/uploads", p.image_path)
-                        
-                    if os.path.exists(img_path):
-                        try:
-                            # Constrain width
-                            im = Image(img_path, width=200, height=150) # Approx aspect ratio
-                            im.hAlign = 'LEFT'
-                            elements.append(im)
-                        except:
-                            elements.append(Paragraph("[Image processing failed]", styles['Normal']))
-                
-                elements.append(Spacer(1, 10))
-                if p.latex_content:
-                    # ReportLab doesn't render Latex natively nicely without plugins
-                    # converting latex to text/image is hard here.
-                    # Just dumping text for now.
-                    elements.append(Paragraph(f"LaTeX: {p.latex_content[:200]}...", styles['Normal']))
-                
-                elements.append(Spacer(1, 20))
-        
-        doc.build(elements)
+    def _upsert_report(self, user_id: int, week_start: date, pdf_path: str, summary: dict, stats_hash: str) -> WeeklyReport:
+        for attempt in range(2):
+            report = self.db.query(WeeklyReport).filter(
+                WeeklyReport.user_id == user_id,
+                WeeklyReport.week_start == week_start
+            ).first()
+            if report is None:
+                report = WeeklyReport(user_id=user_id, week_start=week_start)
+                self.db.add(report)
+            report.pdf_path = pdf_path
+            report.summary_json = summary
+            report.stats_hash = stats_hash
+            report.created_at = datetime.utcnow()
+            try:
+                self.db.commit()
+                self.db.refresh(report)
+                return report
+            except IntegrityError:
+                # Another worker inserted the same (user, week) concurrently; update theirs
+                self.db.rollback()
+                if attempt == 1:
+                    raise
@@ -0,0 +1,224 @@
+"""
+Resumable (tus-like) uploads: the client creates an upload with its total
+size, sends the bytes in any number of PATCH requests at explicit offsets and
+finalizes once everything has arrived. After a dropped connection it asks for
+the current offset and re-sends only the missing bytes.
+
+Partial data lives under <artifact root>/resumable/ as <id>.part plus an
+<id>.json state file; the byte count of the .part file is the offset, so a
+crash mid-write never loses track of what was received. Nothing in there is
+analyzed until finalize. Uploads expire RESUMABLE_UPLOAD_TTL_HOURS (default
+24) after creation and are removed by purge_expired().
+
+PATCH and finalize of one upload are serialized across worker processes by
+an flock on its .part file (and an asyncio.Lock within a process). Partial
+data is never sent to the storage backend, so with several nodes
+(STORAGE_BACKEND=s3) an upload's requests must reach the same node.
+"""
+import os
+import json
+import time
+import asyncio
+import secrets
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict, field
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from .artifact_store import artifact_store
+from .upload_ingest import ingest_image, verify_image, UploadRejected, MAX_UPLOAD_BYTES
+from .log_sink import get_logger
+
+try:
+    import fcntl
+except ImportError: # Windows: a single development process
+    fcntl = None
+
+logger = get_logger("upload")
+
+RESUMABLE_DIR = "resumable"
+LOCK_POLL_SECONDS = 0.05
+_ID_CHARS = set("0123456789abcdef")
+
+def upload_ttl_seconds() -> float:
+    return float(os.getenv("RESUMABLE_UPLOAD_TTL_HOURS", "24")) * 3600
+
+@dataclass
+class ResumableUpload:
+    id: str
+    user_id: int
+    size: int
+    filename: Optional[str]
+    created_at: float
+    expires_at: float
+    result: Optional[dict] = field(default=None) # response of a finished finalize, replayed on retries
+
+class ResumableUploadStore:
+    def __init__(self):
+        self._locks: Dict[str, List] = {} # upload id -> [asyncio.Lock, requests using it]
+
+    @property
+    def directory(self) -> str:
+        path = artifact_store.path(RESUMABLE_DIR)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _paths(self, upload_id: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, upload_id)
+        return base + ".part", base + ".json"
+
+    @asynccontextmanager
+    async def lock(self, upload_id: str, wait: bool = True) -> AsyncIterator[None]:
+        """
+        Serializes PATCH and finalize of one upload, across worker processes too.
+        Without `wait` it raises UploadRejected (409) if another request holds it.
+        The upload may have been finalized or removed meanwhile: re-read it inside.
+        """
+        entry = self._locks.get(upload_id)
+        if entry is None:
+            entry = self._locks[upload_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            if not wait and entry[0].locked():
+                raise UploadRejected("Another request is writing to this upload", 409)
+            async with entry[0]:
+                fd = await self._flock(upload_id, wait)
+                try:
+                    yield
+                finally:
+                    if fd is not None:
+                        os.close(fd) # drops the flock
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._locks.pop(upload_id, None)
+
+    async def _flock(self, upload_id: str, wait: bool) -> Optional[int]:
+        """Descriptor holding an exclusive flock on the upload's .part file, or None if there is none any more."""
+        if fcntl is None:
+            return None
+        part_path, _ = self._paths(upload_id)
+        try:
+            fd = os.open(part_path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None # finalized or removed; nothing left to write to
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                if not wait:
+                    os.close(fd)
+                    raise UploadRejected("Another request is writing to this upload", 409)
+                # Polled so a long finalize elsewhere does not tie up a threadpool thread
+                await asyncio.sleep(LOCK_POLL_SECONDS)
+            except BaseException:
+                os.close(fd)
+                raise
+
+    def create(self, user_id: int, size: int, filename: Optional[str] = None) -> ResumableUpload:
+        if size > MAX_UPLOAD_BYTES:
+            raise UploadRejected(f"Upload exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit", 413)
+        now = time.time()
+        upload = ResumableUpload(
+            id=secrets.token_hex(16), user_id=user_id, size=size,
+            filename=(filename or "")[:255] or None, created_at=now, expires_at=now + upload_ttl_seconds()
+        )
+        part_path, _ = self._paths(upload.id)
+        open(part_path, "wb").close()
+        self._save(upload)
+        return upload
+
+    def get(self, upload_id: str, user_id: int) -> Optional[ResumableUpload]:
+        """The user's upload, or None if unknown, someone else's or expired."""
+        if len(upload_id) != 32 or not set(upload_id) <= _ID_CHARS:
+            return None
+        _, state_path = self._paths(upload_id)
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                upload = ResumableUpload(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        if upload.user_id != user_id:
+            return None
+        if upload.expires_at < time.time():
+            self.delete(upload_id)
+            return None
+        return upload
+
+    def offset(self, upload: ResumableUpload) -> int:
+        part_path, _ = self._paths(upload.id)
+        try:
+            return os.path.getsize(part_path)
+        except OSError:
+            return upload.size if upload.result else 0
+
+    def append(self, upload: ResumableUpload, data: bytes) -> int:
+        """Blocking: appends a chunk and returns the new offset. Call with the upload's lock held."""
+        part_path, _ = self._paths(upload.id)
+        # Never recreates a .part file removed by finalize or expiry
+        with os.fdopen(os.open(part_path, os.O_WRONLY | os.O_APPEND), "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            return f.tell()
+
+    def store(self, upload: ResumableUpload, verify: Callable[[str], str] = verify_image) -> Tuple[str, bool]:
+        """
+        Blocking: copies the finished bytes into the artifact store through the
+        normal image checks. The partial file is kept until set_result(), so a
+        finalize that fails later (e.g. the model is rate limited) can be retried.
+        """
+        part_path, _ = self._paths(upload.id)
+        with open(part_path, "rb") as source:
+            return ingest_image(source, verify=verify)
+
+    def set_result(self, upload: ResumableUpload, result: dict):
+        upload.result = result
+        self._save(upload)
+        part_path, _ = self._paths(upload.id)
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+
+    def delete(self, upload_id: str):
+        for path in self._paths(upload_id):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def purge_expired(self) -> int:
+        """Removes expired uploads (finished or not); returns how many."""
+        now = time.time()
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".part"):
+                # Data whose state file never got written
+                if not os.path.exists(entry.path[:-5] + ".json") and entry.stat().st_mtime + upload_ttl_seconds() < now:
+                    self.delete(entry.name[:-5])
+                    removed += 1
+                continue
+            if not entry.name.endswith(".json"):
+                continue
+            upload_id = entry.name[:-5]
+            try:
+                with open(entry.path, "r", encoding="utf-8") as f:
+                    expires_at = json.load(f)["expires_at"]
+            except (OSError, ValueError, KeyError):
+                # Unreadable state: fall back to its age
+                expires_at = entry.stat().st_mtime + upload_ttl_seconds()
+            if expires_at < now:
+                self.delete(upload_id)
+                removed += 1
+        if removed:
+            logger.info(f"Removed {removed} expired resumable uploads")
+        return removed
+
+    def _save(self, upload: ResumableUpload):
+        _, state_path = self._paths(upload.id)
+        tmp_path = state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(upload), f)
+        os.replace(tmp_path, state_path)
+
+resumable_uploads = ResumableUploadStore()
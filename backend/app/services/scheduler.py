@@ -0,0 +1,141 @@
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional
+from .log_sink import get_logger
+from .leader import leader
+
+logger = get_logger("scheduler")
+
+class _Job:
+    def __init__(self, name: str, fn: Callable, interval: Optional[int] = None, weekday: Optional[int] = None, hour: int = 0,
+                 leader_only: bool = True):
+        self.name = name
+        self.fn = fn
+        self.leader_only = leader_only
+        self.interval = interval
+        self.weekday = weekday
+        self.hour = hour
+        self.next_run = self._first_run()
+
+    def _first_run(self) -> datetime:
+        now = datetime.utcnow()
+        if self.interval is not None:
+            return now + timedelta(seconds=self.interval)
+        return self._next_weekly(now)
+
+    def _next_weekly(self, after: datetime) -> datetime:
+        # weekday None: every day at `hour`
+        days_ahead = (self.weekday - after.weekday()) % 7 if self.weekday is not None else 0
+        candidate = (after + timedelta(days=days_ahead)).replace(hour=self.hour, minute=0, second=0, microsecond=0)
+        if candidate <= after:
+            candidate += timedelta(days=7 if self.weekday is not None else 1)
+        return candidate
+
+    def last_due(self, now: datetime) -> datetime:
+        """The latest scheduled time at or before `now` (weekly and daily jobs)."""
+        return self._next_weekly(now - timedelta(days=7 if self.weekday is not None else 1))
+
+    def schedule_next(self):
+        now = datetime.utcnow()
+        if self.interval is not None:
+            self.next_run = now + timedelta(seconds=self.interval)
+        else:
+            self.next_run = self._next_weekly(now)
+
+class Scheduler:
+    """
+    Minimal in-process scheduler for periodic background jobs (UTC).
+    Jobs run on the scheduler thread and should hand heavy work to a pool.
+    It runs in every worker process; a job runs only in the elected leader
+    (services/leader) unless it is added with leader_only=False, for work on
+    node-local files.
+
+    Other workers leave a due job pending instead of skipping it, and the
+    leader records each weekly or daily run in scheduled_job_runs before it
+    starts it. A worker elected after the leader died therefore makes the runs
+    the old leader missed, but not the ones it made. A run counts once it has
+    started, so one cut short by the leader dying is not repeated. Interval
+    jobs are not recorded; a new leader runs them on election.
+    """
+
+    def __init__(self, tick_seconds: int = 30):
+        self.tick_seconds = tick_seconds
+        self.jobs: List[_Job] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_interval_job(self, name: str, fn: Callable, seconds: int, leader_only: bool = True):
+        self.jobs.append(_Job(name, fn, interval=seconds, leader_only=leader_only))
+
+    def add_daily_job(self, name: str, fn: Callable, hour: int = 0, leader_only: bool = True):
+        self.jobs.append(_Job(name, fn, hour=hour, leader_only=leader_only))
+
+    def add_weekly_job(self, name: str, fn: Callable, weekday: int, hour: int = 0, leader_only: bool = True):
+        """weekday: 0 = Monday ... 6 = Sunday"""
+        self.jobs.append(_Job(name, fn, weekday=weekday, hour=hour, leader_only=leader_only))
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+        self._thread.start()
+        logger.info(f"Scheduler started with jobs: {', '.join(j.name for j in self.jobs)}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = datetime.utcnow()
+            for job in self.jobs:
+                if job.next_run <= now:
+                    if job.leader_only and not leader.is_leader():
+                        continue # stays due, in case this worker takes over before the leader has run it
+                    job.schedule_next()
+                    if job.leader_only and job.interval is None and not self._claim(job, job.last_due(now)):
+                        logger.info(f"Scheduled job {job.name} already ran in the previous leader")
+                        continue
+                    try:
+                        logger.info(f"Running scheduled job: {job.name}")
+                        job.fn()
+                    except Exception as e:
+                        logger.exception(f"Scheduled job {job.name} failed: {e}")
+            self._stop.wait(self.tick_seconds)
+
+    def _claim(self, job: _Job, due: datetime) -> bool:
+        """Records the run of `job` scheduled for `due`; False if it was recorded already."""
+        from sqlalchemy import or_
+        from sqlalchemy.exc import IntegrityError
+        from ..database import SessionLocal
+        from ..models import ScheduledJobRun
+
+        values = {"last_run": due, "claimed_by": f"{socket.gethostname()}:{os.getpid()}", "updated_at": datetime.utcnow()}
+        db = SessionLocal()
+        try:
+            # Conditional, so two processes that both think they lead cannot both claim it
+            claimed = db.query(ScheduledJobRun).filter(
+                ScheduledJobRun.name == job.name, or_(ScheduledJobRun.last_run.is_(None), ScheduledJobRun.last_run < due)
+            ).update(values, synchronize_session=False)
+            if not claimed and db.get(ScheduledJobRun, job.name) is None:
+                db.add(ScheduledJobRun(name=job.name, **values))
+                claimed = 1
+            db.commit()
+            return bool(claimed)
+        except IntegrityError:
+            db.rollback()
+            return False
+        except Exception as e:
+            # Better to risk running it twice than not at all
+            db.rollback()
+            logger.warning(f"Could not record the run of {job.name} ({e}); running it anyway")
+            return True
+        finally:
+            db.close()
+
+scheduler = Scheduler()
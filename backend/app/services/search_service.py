@@ -0,0 +1,144 @@
+import re
+import html
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Must stay in sync with mathrob_search_normalize() in add_problem_search_index.py:
+# the trigger normalizes stored documents in SQL, this module normalizes queries in Python.
+_LATEX_COMMAND = re.compile(r"\\([a-z]+)")
+_NON_WORD = re.compile(r"[^0-9a-z\u4e00-\u9fff]+")
+_CJK_RUN = re.compile(r"[\u4e00-\u9fff]+")
+
+def _cjk_bigrams(run: str) -> List[str]:
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+def normalize_search_text(value: Optional[str]) -> str:
+    """
+    Turns LaTeX / mixed Chinese text into space separated search tokens.
+    - LaTeX commands become plain words (\\frac{1}{2} -> "frac 1 2")
+    - punctuation, braces and math operators are dropped
+    - runs of CJK characters are expanded into overlapping bigrams
+      (函数的性质 -> "函数 数的 的性 性质"), since the 'simple' parser cannot segment Chinese
+    """
+    if not value:
+        return ""
+    txt = value.lower()
+    txt = _LATEX_COMMAND.sub(r" \1 ", txt)
+    txt = _NON_WORD.sub(" ", txt)
+
+    grams = []
+    for run in _CJK_RUN.findall(txt):
+        grams.extend(_cjk_bigrams(run))
+    txt = _CJK_RUN.sub(" ", txt)
+    return " ".join((txt + " " + " ".join(grams)).split())
+
+def build_tsquery(query: str) -> Tuple[str, List[str]]:
+    """
+    Builds a to_tsquery('simple', ...) expression requiring every token.
+    The last latin token is a prefix match so results show up while typing.
+    Returns (tsquery, tokens); tsquery is empty if the query has no usable tokens.
+    """
+    tokens = normalize_search_text(query).split()
+    if not tokens:
+        return "", []
+    # Deduplicate while keeping order
+    tokens = list(dict.fromkeys(tokens))
+    terms = list(tokens)
+    for i in range(len(terms) - 1, -1, -1):
+        if not _CJK_RUN.match(terms[i]):
+            terms[i] = terms[i] + ":*"
+            break
+    return " & ".join(terms), tokens
+
+def highlight(value: Optional[str], tokens: List[str], context: int = 60) -> Optional[str]:
+    """
+    Returns an HTML-escaped snippet of `value` around the first match with every
+    token occurrence wrapped in <mark>. Done on the raw LaTeX (not the normalized
+    document) so the snippet is readable.
+    """
+    if not value:
+        return None
+    if not tokens:
+        return html.escape(value[:context * 2])
+
+    pattern = re.compile("|".join(re.escape(t) for t in sorted(tokens, key=len, reverse=True)), re.IGNORECASE)
+    first = pattern.search(value)
+    start = max(0, first.start() - context) if first else 0
+    end = min(len(value), (first.end() if first else 0) + context * 2)
+    snippet = value[start:end]
+
+    parts = []
+    pos = 0
+    for m in pattern.finditer(snippet):
+        parts.append(html.escape(snippet[pos:m.start()]))
+        parts.append(f"<mark>{html.escape(m.group())}</mark>")
+        pos = m.end()
+    parts.append(html.escape(snippet[pos:]))
+
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(value) else ""
+    return prefix + "".join(parts) + suffix
+
+# Ranked search over the trigger-maintained search_vector / search_document columns.
+# Full-text matches use the GIN(search_vector) index, fuzzy matches (typos, partial
+# formulas) use the GIN(search_document gin_trgm_ops) index through the <% operator.
+_SEARCH_SQL = """
+SELECT * FROM (
+    SELECT p.id, p.image_path, p.latex_content, p.difficulty, p.knowledge_path, p.created_at,
+           (ts_rank_cd(p.search_vector, to_tsquery('simple', :tsquery))
+            + word_similarity(:normalized, p.search_document)) AS rank
+    FROM problems p
+    WHERE p.user_id = :user_id
+      AND (p.search_vector @@ to_tsquery('simple', :tsquery) OR :normalized <% p.search_document)
+) hits
+{cursor_filter}
+ORDER BY rank DESC, id DESC
+LIMIT :limit
+"""
+
+class SearchService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def search_problems(
+        self,
+        user_id: int,
+        query: str,
+        limit: int = 20,
+        after: Optional[Tuple[float, int]] = None,
+    ) -> Tuple[List[dict], Optional[Tuple[float, int]]]:
+        """
+        Returns (hits, next_key). `after` / `next_key` are the (rank, id) of the last
+        hit of a page, used for keyset pagination.
+        """
+        tsquery, tokens = build_tsquery(query)
+        if not tsquery:
+            return [], None
+
+        params = {
+            "user_id": user_id,
+            "tsquery": tsquery,
+            "normalized": " ".join(tokens),
+            "limit": limit,
+        }
+        cursor_filter = ""
+        if after is not None:
+            cursor_filter = "WHERE (rank, id) < (:after_rank, :after_id)"
+            params["after_rank"], params["after_id"] = after
+
+        rows = self.db.execute(text(_SEARCH_SQL.format(cursor_filter=cursor_filter)), params).mappings().all()
+
+        hits = []
+        for row in rows:
+            hit = dict(row)
+            hit["highlight"] = highlight(row["latex_content"], tokens)
+            hits.append(hit)
+
+        next_key = None
+        if len(rows) == limit:
+            next_key = (float(rows[-1]["rank"]), rows[-1]["id"])
+        return hits, next_key
@@ -0,0 +1,306 @@
+"""
+Durable storage behind ArtifactStore, chosen with STORAGE_BACKEND:
+
+- "local" (default): the artifact root itself. Every API node must share it
+  (one host, or a network filesystem).
+- "s3": an S3-compatible bucket (AWS S3, MinIO, Ceph RGW, R2) through boto3,
+  so API nodes share nothing but the bucket and the database. The artifact
+  root becomes a node-local working copy: uploads are verified there before
+  they are sent to the bucket, and files the backend needs on disk (AI
+  analysis, PDF rendering, report thumbnails) are fetched into it on first
+  use. Downloads are answered with a redirect to a presigned URL, so the bytes
+  never pass through the API process.
+
+    S3_BUCKET                   bucket name (required)
+    S3_PREFIX                   key prefix inside the bucket (default none)
+    S3_ENDPOINT_URL             for MinIO and other non-AWS endpoints
+    S3_PUBLIC_ENDPOINT_URL      endpoint presigned URLs are made for, when
+                                browsers reach the bucket under another name
+    S3_REGION                   region (default from the AWS configuration)
+    S3_ADDRESSING_STYLE         "auto", "path" (MinIO) or "virtual"
+    S3_PRESIGN_EXPIRES          lifetime of presigned URLs in seconds (default 3600)
+    S3_MULTIPART_CHUNK_MB       part size; larger files are uploaded in parallel
+                                parts (default 8)
+    S3_MULTIPART_CONCURRENCY    parts in flight per file (default 4)
+
+Credentials come from the usual AWS sources (AWS_ACCESS_KEY_ID /
+AWS_SECRET_ACCESS_KEY, a profile, or an instance role).
+"""
+import os
+import shutil
+import tempfile
+import mimetypes
+from abc import ABC, abstractmethod
+from typing import Iterable, Iterator, List, Optional, Tuple
+from .log_sink import get_logger
+
+logger = get_logger("storage")
+
+MB = 1024 * 1024
+
+class StorageBackend(ABC):
+    """Stores files by store-relative name ("blobs/ab/cd/<sha256>.jpg")."""
+    name = ""
+    # True when the files live somewhere other than the artifact root
+    remote = False
+    # Lifetime of presigned URLs in seconds
+    presign_expires = 0
+
+    @abstractmethod
+    def put(self, local_path: str, name: str):
+        """Stores the file at `local_path` under `name`, replacing what was there."""
+
+    @abstractmethod
+    def fetch(self, name: str, local_path: str) -> bool:
+        """Copies `name` to `local_path`; False if it does not exist."""
+
+    @abstractmethod
+    def stat(self, name: str) -> Optional[Tuple[int, float]]:
+        """(size, modification time) of `name`, or None if it does not exist."""
+
+    def exists(self, name: str) -> bool:
+        return self.stat(name) is not None
+
+    @abstractmethod
+    def touch(self, name: str):
+        """Sets the modification time of `name` to now."""
+
+    @abstractmethod
+    def delete(self, name: str):
+        """Removes `name`; no error if it does not exist."""
+
+    @abstractmethod
+    def move(self, name: str, new_name: str):
+        """Renames `name` to `new_name`, replacing what was there."""
+
+    @abstractmethod
+    def iter_files(self, prefix: str = "", skip: Iterable[str] = ()) -> Iterator[Tuple[str, int, float]]:
+        """(name, size, modification time) of every file under `prefix`, except under the `skip` directories."""
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str):
+        """Removes everything under the directory `prefix`."""
+
+    @abstractmethod
+    def subdirectories(self, prefix: str) -> List[str]:
+        """Names of the directories directly under `prefix`."""
+
+    def presigned_url(self, name: str, media_type: Optional[str] = None, filename: Optional[str] = None,
+                      cache_control: Optional[str] = None) -> Optional[str]:
+        """A URL clients can download `name` from directly, or None if the backend has none."""
+        return None
+
+def _skipped(name: str, skip: Iterable[str]) -> bool:
+    return any(name == d or name.startswith(d + "/") for d in skip)
+
+class LocalBackend(StorageBackend):
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def put(self, local_path: str, name: str):
+        target = self._path(name)
+        if os.path.abspath(local_path) == os.path.abspath(target):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(local_path, target)
+
+    def fetch(self, name: str, local_path: str) -> bool:
+        source = self._path(name)
+        if os.path.abspath(local_path) == os.path.abspath(source):
+            return os.path.isfile(source)
+        try:
+            shutil.copyfile(source, local_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def stat(self, name: str) -> Optional[Tuple[int, float]]:
+        try:
+            st = os.stat(self._path(name))
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime
+
+    def touch(self, name: str):
+        os.utime(self._path(name))
+
+    def delete(self, name: str):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def move(self, name: str, new_name: str):
+        target = self._path(new_name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(self._path(name), target)
+
+    def iter_files(self, prefix: str = "", skip: Iterable[str] = ()) -> Iterator[Tuple[str, int, float]]:
+        skip = set(skip)
+        stack = [prefix.strip("/")]
+        while stack:
+            relative_dir = stack.pop()
+            try:
+                with os.scandir(self._path(relative_dir)) as entries:
+                    for entry in entries:
+                        name = f"{relative_dir}/{entry.name}" if relative_dir else entry.name
+                        if entry.is_dir(follow_symlinks=False):
+                            if name not in skip:
+                                stack.append(name)
+                        elif entry.is_file(follow_symlinks=False):
+                            try:
+                                st = entry.stat(follow_symlinks=False)
+                            except OSError:
+                                continue
+                            yield name, st.st_size, st.st_mtime
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"Could not list {relative_dir or '/'}: {e}")
+
+    def delete_prefix(self, prefix: str):
+        shutil.rmtree(self._path(prefix), ignore_errors=True)
+
+    def subdirectories(self, prefix: str) -> List[str]:
+        try:
+            with os.scandir(self._path(prefix)) as entries:
+                return [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except FileNotFoundError:
+            return []
+
+class S3Backend(StorageBackend):
+    name = "s3"
+    remote = True
+
+    def __init__(self):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+        from botocore.exceptions import ClientError
+
+        self.bucket = os.getenv("S3_BUCKET")
+        if not self.bucket:
+            raise ValueError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        self.prefix = os.getenv("S3_PREFIX", "").strip("/")
+        self.presign_expires = int(os.getenv("S3_PRESIGN_EXPIRES", "3600"))
+        self.ClientError = ClientError
+        chunk = int(os.getenv("S3_MULTIPART_CHUNK_MB", "8")) * MB
+        concurrency = int(os.getenv("S3_MULTIPART_CONCURRENCY", "4"))
+        self.transfer = TransferConfig(multipart_threshold=chunk, multipart_chunksize=chunk, max_concurrency=concurrency)
+
+        config = Config(
+            signature_version="s3v4",
+            s3={"addressing_style": os.getenv("S3_ADDRESSING_STYLE", "auto")},
+            retries={"max_attempts": 5, "mode": "standard"},
+            # Threadpool requests plus the parts of multipart transfers
+            max_pool_connections=max(10, concurrency * 8),
+        )
+        region = os.getenv("S3_REGION") or None
+        endpoint = os.getenv("S3_ENDPOINT_URL") or None
+        self.client = boto3.client("s3", endpoint_url=endpoint, region_name=region, config=config)
+        public_endpoint = os.getenv("S3_PUBLIC_ENDPOINT_URL")
+        # Signing is local: this client never opens a connection
+        self.signer = boto3.client("s3", endpoint_url=public_endpoint, region_name=region, config=config) if public_endpoint else self.client
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def _name(self, key: str) -> str:
+        return key[len(self.prefix) + 1:] if self.prefix else key
+
+    def _missing(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def put(self, local_path: str, name: str):
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        # Multipart with parallel parts above the chunk size
+        self.client.upload_file(local_path, self.bucket, self._key(name), ExtraArgs={"ContentType": media_type}, Config=self.transfer)
+
+    def fetch(self, name: str, local_path: str) -> bool:
+        directory = os.path.dirname(local_path)
+        os.makedirs(directory, exist_ok=True)
+        # Readers never see a partial download
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, self._key(name), tmp_path, Config=self.transfer)
+            os.replace(tmp_path, local_path)
+            return True
+        except self.ClientError as e:
+            if self._missing(e):
+                return False
+            raise
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stat(self, name: str) -> Optional[Tuple[int, float]]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except self.ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+        return head["ContentLength"], head["LastModified"].timestamp()
+
+    def touch(self, name: str):
+        key = self._key(name)
+        # Copying an object onto itself with new metadata is the only way to bump LastModified
+        self.client.copy_object(
+            Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": key},
+            MetadataDirective="REPLACE", ContentType=mimetypes.guess_type(name)[0] or "application/octet-stream",
+        )
+
+    def delete(self, name: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def move(self, name: str, new_name: str):
+        self.client.copy({"Bucket": self.bucket, "Key": self._key(name)}, self.bucket, self._key(new_name), Config=self.transfer)
+        self.delete(name)
+
+    def iter_files(self, prefix: str = "", skip: Iterable[str] = ()) -> Iterator[Tuple[str, int, float]]:
+        skip = set(skip)
+        list_prefix = self._key(prefix.strip("/") + "/") if prefix else (self.prefix + "/" if self.prefix else "")
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=list_prefix):
+            for obj in page.get("Contents", []):
+                name = self._name(obj["Key"])
+                if not _skipped(name, skip):
+                    yield name, obj["Size"], obj["LastModified"].timestamp()
+
+    def delete_prefix(self, prefix: str):
+        keys = [self._key(name) for name, _, _ in self.iter_files(prefix)]
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": [{"Key": k} for k in keys[start:start + 1000]], "Quiet": True})
+
+    def subdirectories(self, prefix: str) -> List[str]:
+        list_prefix = self._key(prefix.strip("/") + "/")
+        names = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=list_prefix, Delimiter="/"):
+            names.extend(p["Prefix"][len(list_prefix):].rstrip("/") for p in page.get("CommonPrefixes", []))
+        return names
+
+    def presigned_url(self, name: str, media_type: Optional[str] = None, filename: Optional[str] = None,
+                      cache_control: Optional[str] = None) -> Optional[str]:
+        params = {"Bucket": self.bucket, "Key": self._key(name)}
+        if media_type:
+            params["ResponseContentType"] = media_type
+        if filename:
+            params["ResponseContentDisposition"] = f'attachment; filename="{filename}"'
+        if cache_control:
+            params["ResponseCacheControl"] = cache_control
+        return self.signer.generate_presigned_url("get_object", Params=params, ExpiresIn=self.presign_expires)
+
+def create_backend(root: str, name: Optional[str] = None) -> StorageBackend:
+    name = (name or os.getenv("STORAGE_BACKEND", "local")).lower()
+    if name == "local":
+        return LocalBackend(root)
+    if name == "s3":
+        return S3Backend()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {name} (expected local or s3)")
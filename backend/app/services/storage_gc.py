@@ -0,0 +1,407 @@
+"""
+Garbage collection of the artifact store.
+
+collect_released (daily) collects the blobs whose reference count
+(services/blob_refs) dropped to 0 longer than the grace period ago. It
+neither scans the referencing tables nor lists the store: each candidate is
+looked up in the indexed path columns and its modification time checked.
+
+run (weekly, STORAGE_GC_FULL_WEEKDAY, default Sunday) is a full mark and
+sweep. It also finds files no row ever counted (an upload that failed before
+its row was committed, counts skewed by bulk statements) and expires class
+summaries. Mark streams every stored path the database still references (problem and
+solution photos, source documents and their regions, weekly report PDFs) into
+a set of store-relative names. Sweep walks the tree (os.scandir, or a bucket
+listing) and collects files that are not in the set and were not modified
+within the grace period (STORAGE_GC_GRACE_HOURS, default 24), which covers
+uploads whose row is not committed yet; ArtifactStore touches an existing
+blob when it is uploaded again for the same reason.
+
+Collected files are moved to .quarantine/<date>/ (STORAGE_GC_MODE=quarantine,
+the default; emptied after STORAGE_GC_QUARANTINE_DAYS) or deleted
+(STORAGE_GC_MODE=delete). Listed files and file operations are rate
+limited (STORAGE_GC_SCAN_RATE, STORAGE_GC_DELETE_RATE per second) so a run
+over millions of files does not saturate shared storage, and a run that would
+collect more than STORAGE_GC_MAX_FRACTION of the files stops without touching
+anything (a wrong ARTIFACT_ROOT or DATABASE_URL looks exactly like that).
+
+Class summary PDFs are only found by file name
+(reports/class_report_<class>_<week>.pdf): each class keeps its newest one and
+those of the last STORAGE_GC_CLASS_REPORT_WEEKS weeks (default 12); older
+ones are collected and can be generated again from the database.
+
+Directories with their own expiry (resumable uploads, the LaTeX render cache,
+report thumbnails) are not walked. Report thumbnails are a node-local cache:
+expire_thumbnails() removes those unused for STORAGE_GC_THUMBNAIL_DAYS
+(default 14) on every node.
+
+The sweep goes through the storage backend, so with STORAGE_BACKEND=s3 it
+lists and collects bucket objects. Each node then drops its own working
+copies that were not used within the grace period (evict_working_copies, a
+job of its own since the collection runs on the leader only); they are
+fetched again when needed.
+"""
+import os
+import re
+import time
+import threading
+from dataclasses import dataclass, asdict, field
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from sqlalchemy import select, delete
+from ..database import SessionLocal
+from ..models import BlobRef, SourceDocument, WeeklyReport
+from .artifact_store import artifact_store, BLOB_DIR
+from .storage_backends import LocalBackend
+from .blob_refs import BLOB_COLUMNS, region_images
+from .resumable_uploads import RESUMABLE_DIR
+from .log_sink import get_logger
+
+logger = get_logger("storage")
+
+QUARANTINE_DIR = ".quarantine"
+REPORT_THUMBNAIL_DIR = "reports/thumbs"
+SKIP_DIRS = {RESUMABLE_DIR, "latex_cache", REPORT_THUMBNAIL_DIR, QUARANTINE_DIR}
+# No row references class summaries: they are downloaded by class and week (report_jobs.cohort_summary_filename)
+CLASS_REPORT_NAME = re.compile(r"reports/class_report_(.+)_(\d{4}-\d{2}-\d{2})\.pdf")
+STREAM_BATCH = 10000
+
+@dataclass
+class GCStats:
+    mode: str
+    dry_run: bool
+    full: bool = True # mark and sweep; False: released blobs only
+    started_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+    referenced: int = 0 # names marked
+    scanned: int = 0 # files seen
+    recent: int = 0 # unreferenced but within the grace period
+    collected: int = 0
+    collected_bytes: int = 0
+    errors: int = 0
+    aborted: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+class _Throttle:
+    """Spaces calls to at most `rate` per second (0: unlimited)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_at = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_at > now:
+            time.sleep(self.next_at - now)
+        self.next_at = max(now, self.next_at) + self.interval
+
+class StorageGC:
+    def __init__(self):
+        self.mode = os.getenv("STORAGE_GC_MODE", "quarantine") # quarantine, delete, off
+        self.grace = timedelta(hours=float(os.getenv("STORAGE_GC_GRACE_HOURS", "24")))
+        self.scan_rate = float(os.getenv("STORAGE_GC_SCAN_RATE", "5000"))
+        self.delete_rate = float(os.getenv("STORAGE_GC_DELETE_RATE", "100"))
+        self.quarantine_days = int(os.getenv("STORAGE_GC_QUARANTINE_DAYS", "7"))
+        self.max_fraction = float(os.getenv("STORAGE_GC_MAX_FRACTION", "0.5"))
+        self.class_report_weeks = int(os.getenv("STORAGE_GC_CLASS_REPORT_WEEKS", "12"))
+        self.thumbnail_days = float(os.getenv("STORAGE_GC_THUMBNAIL_DAYS", "14"))
+        self.last_run: Optional[GCStats] = None
+        self._running = threading.Lock()
+        self._stop = threading.Event()
+
+    def mark(self) -> Set[str]:
+        """Store-relative names of every file the database references."""
+        referenced: Set[str] = set()
+
+        def add(stored: Optional[str]):
+            if stored:
+                referenced.update(artifact_store.candidate_names(stored))
+
+        db = SessionLocal()
+        try:
+            columns = [getattr(model, attribute) for model, attribute in BLOB_COLUMNS] + [WeeklyReport.pdf_path]
+            for column in columns:
+                # Server-side cursor: millions of rows are never loaded at once
+                for (stored,) in db.execute(select(column).where(column.isnot(None)).execution_options(yield_per=STREAM_BATCH)):
+                    add(stored)
+            # Regions that have no problem yet are kept for the retry
+            for (regions,) in db.execute(select(SourceDocument.regions).where(SourceDocument.regions.isnot(None)).execution_options(yield_per=1000)):
+                for name in region_images(regions):
+                    add(name)
+        finally:
+            db.close()
+        return referenced
+
+    def _walk(self, throttle: _Throttle) -> Iterator[Tuple[str, int, float]]:
+        """(store-relative name, size, mtime) for every stored file outside SKIP_DIRS."""
+        for item in artifact_store.backend.iter_files(skip=SKIP_DIRS):
+            if self._stop.is_set():
+                return
+            throttle.wait()
+            yield item
+
+    def run(self, dry_run: bool = False, mode: Optional[str] = None, force: bool = False) -> GCStats:
+        """One mark-and-sweep pass; returns its statistics. Concurrent calls raise RuntimeError."""
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("Storage GC is already running")
+        self._stop.clear()
+        # "off" only disables the scheduled run
+        stats = GCStats(mode=mode or (self.mode if self.mode != "off" else "quarantine"), dry_run=dry_run)
+        try:
+            referenced = self.mark()
+            stats.referenced = len(referenced)
+            cutoff = time.time() - self.grace.total_seconds()
+
+            candidates: List[Tuple[str, int]] = []
+            class_reports: Dict[str, List[Tuple[str, str, int, float]]] = {}
+            for name, size, mtime in self._walk(_Throttle(self.scan_rate)):
+                stats.scanned += 1
+                if name in referenced:
+                    continue
+                match = CLASS_REPORT_NAME.fullmatch(name)
+                if match:
+                    class_reports.setdefault(match.group(1), []).append((match.group(2), name, size, mtime))
+                    continue
+                if mtime > cutoff:
+                    stats.recent += 1
+                    continue
+                candidates.append((name, size))
+            for name, size, mtime in self._expired_class_reports(class_reports):
+                if mtime > cutoff:
+                    stats.recent += 1 # regenerated recently
+                    continue
+                candidates.append((name, size))
+
+            if self._stop.is_set():
+                stats.aborted = "stopped"
+            elif not force and stats.scanned >= 100 and len(candidates) > stats.scanned * self.max_fraction:
+                stats.aborted = (f"{len(candidates)} of {stats.scanned} files are unreferenced; "
+                                 f"check ARTIFACT_ROOT and DATABASE_URL, or run with force")
+            elif dry_run:
+                stats.collected = len(candidates)
+                stats.collected_bytes = sum(size for _, size in candidates)
+            else:
+                self._collect(candidates, stats, cutoff)
+                self.purge_quarantine()
+
+            if stats.aborted:
+                logger.error(f"Storage GC aborted: {stats.aborted}")
+            else:
+                logger.info(f"Storage GC{' (dry run)' if dry_run else ''}: {stats.scanned} files scanned, {stats.referenced} referenced names, "
+                            f"{stats.collected} collected ({stats.collected_bytes / 1024 / 1024:.1f} MB), {stats.recent} within grace period, {stats.errors} errors")
+            return stats
+        finally:
+            stats.finished_at = datetime.utcnow()
+            self.last_run = stats
+            self._running.release()
+
+    def collect_released(self, dry_run: bool = False, mode: Optional[str] = None) -> GCStats:
+        """
+        Collects blobs whose reference count has been 0 for the grace period;
+        returns the statistics. Concurrent calls (with run too) raise RuntimeError.
+        """
+        if not self._running.acquire(blocking=False):
+            raise RuntimeError("Storage GC is already running")
+        self._stop.clear()
+        stats = GCStats(mode=mode or (self.mode if self.mode != "off" else "quarantine"), dry_run=dry_run, full=False)
+        try:
+            released_before = datetime.utcnow() - self.grace
+            db = SessionLocal()
+            try:
+                names = [name for (name,) in db.execute(
+                    select(BlobRef.name).where(BlobRef.refcount <= 0, BlobRef.updated_at < released_before)
+                )]
+                # A count left too low by a bulk statement must not cost a referenced blob
+                referenced: Set[str] = set()
+                for start in range(0, len(names), 1000):
+                    batch = names[start:start + 1000]
+                    for model, attribute in BLOB_COLUMNS:
+                        column = getattr(model, attribute)
+                        referenced.update(name for (name,) in db.execute(select(column).where(column.in_(batch)).distinct()))
+            finally:
+                db.close()
+            stats.referenced = len(referenced)
+            if referenced:
+                logger.warning(f"{len(referenced)} blobs with a reference count of 0 are still referenced; run rebuild_blob_refs")
+
+            backend = artifact_store.backend
+            cutoff = time.time() - self.grace.total_seconds()
+            throttle = _Throttle(self.scan_rate)
+            candidates: List[Tuple[str, int]] = []
+            missing: List[str] = []
+            for name in names:
+                if self._stop.is_set():
+                    break
+                if name in referenced or not name.startswith(BLOB_DIR + "/"):
+                    continue
+                throttle.wait()
+                current = backend.stat(name)
+                if current is None:
+                    missing.append(name)
+                    continue
+                stats.scanned += 1
+                if current[1] > cutoff:
+                    stats.recent += 1 # uploaded again
+                    continue
+                candidates.append((name, current[0]))
+
+            if self._stop.is_set():
+                stats.aborted = "stopped"
+            elif dry_run:
+                stats.collected = len(candidates)
+                stats.collected_bytes = sum(size for _, size in candidates)
+            else:
+                self._collect(candidates, stats, cutoff)
+                self._drop_counts(missing)
+
+            if stats.aborted:
+                logger.error(f"Storage GC aborted: {stats.aborted}")
+            else:
+                logger.info(f"Storage GC of released blobs{' (dry run)' if dry_run else ''}: {len(names)} released, "
+                            f"{stats.collected} collected ({stats.collected_bytes / 1024 / 1024:.1f} MB), {stats.recent} within grace period, {stats.errors} errors")
+            return stats
+        finally:
+            stats.finished_at = datetime.utcnow()
+            self.last_run = stats
+            self._running.release()
+
+    def _expired_class_reports(self, class_reports: Dict[str, List[Tuple[str, str, int, float]]]) -> Iterator[Tuple[str, int, float]]:
+        """(name, size, mtime) of class summaries past retention: all but each class's newest, older than class_report_weeks."""
+        oldest_week = (date.today() - timedelta(weeks=self.class_report_weeks)).isoformat()
+        for reports in class_reports.values():
+            reports.sort(reverse=True) # ISO weeks: newest first
+            for week, name, size, mtime in reports[1:]:
+                if week < oldest_week:
+                    yield name, size, mtime
+
+    def _collect(self, candidates: List[Tuple[str, int]], stats: GCStats, cutoff: float):
+        backend = artifact_store.backend
+        quarantine = f"{QUARANTINE_DIR}/{datetime.utcnow().strftime('%Y%m%d')}"
+        throttle = _Throttle(self.delete_rate)
+        collected_names = []
+        for name, size in candidates:
+            if self._stop.is_set():
+                stats.aborted = "stopped"
+                break
+            throttle.wait()
+            try:
+                # Re-uploaded since the walk: referenced again (or about to be)
+                current = backend.stat(name)
+                if current is None:
+                    continue
+                if current[1] > cutoff:
+                    stats.recent += 1
+                    continue
+                if stats.mode == "delete":
+                    backend.delete(name)
+                else:
+                    backend.move(name, f"{quarantine}/{name}")
+                artifact_store.evict(name)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                stats.errors += 1
+                logger.warning(f"Storage GC could not collect {name}: {e}")
+                continue
+            stats.collected += 1
+            stats.collected_bytes += size
+            collected_names.append(name)
+
+        self._drop_counts(collected_names)
+
+    def _drop_counts(self, names: List[str]):
+        """Deletes the zero counts of blobs that are gone."""
+        db = SessionLocal()
+        try:
+            for start in range(0, len(names), 1000):
+                db.execute(delete(BlobRef).where(BlobRef.name.in_(names[start:start + 1000]), BlobRef.refcount <= 0))
+            db.commit()
+        finally:
+            db.close()
+
+    def purge_quarantine(self) -> int:
+        """Removes quarantine days older than STORAGE_GC_QUARANTINE_DAYS; returns how many."""
+        backend = artifact_store.backend
+        oldest = (datetime.utcnow() - timedelta(days=self.quarantine_days)).strftime("%Y%m%d")
+        removed = 0
+        for day in backend.subdirectories(QUARANTINE_DIR):
+            if day < oldest:
+                backend.delete_prefix(f"{QUARANTINE_DIR}/{day}")
+                removed += 1
+        return removed
+
+    def evict_working_copies(self, cutoff: Optional[float] = None) -> int:
+        """
+        With a remote backend: removes this node's copies of stored files not
+        written or fetched within the grace period (or since `cutoff`); returns how many.
+        """
+        if cutoff is None:
+            cutoff = time.time() - self.grace.total_seconds()
+        throttle = _Throttle(self.scan_rate)
+        evicted = 0
+        for name, _, mtime in LocalBackend(artifact_store.root).iter_files(skip=SKIP_DIRS):
+            if self._stop.is_set():
+                break
+            if mtime > cutoff:
+                continue
+            throttle.wait()
+            artifact_store.evict(name)
+            evicted += 1
+        logger.info(f"Dropped {evicted} working copies of stored files")
+        return evicted
+
+    def expire_thumbnails(self) -> int:
+        """
+        Removes this node's report thumbnails not used for STORAGE_GC_THUMBNAIL_DAYS
+        (report_render.thumbnail touches them on every use); returns how many.
+        They are never sent to the storage backend, so every node runs this.
+        """
+        cutoff = time.time() - self.thumbnail_days * 86400
+        throttle = _Throttle(self.scan_rate)
+        local = LocalBackend(artifact_store.root)
+        removed = 0
+        for name, _, mtime in local.iter_files(REPORT_THUMBNAIL_DIR):
+            if self._stop.is_set():
+                break
+            if mtime > cutoff:
+                continue
+            throttle.wait()
+            local.delete(name)
+            removed += 1
+        if removed:
+            logger.info(f"Removed {removed} report thumbnails unused for {self.thumbnail_days:g} days")
+        return removed
+
+    def running(self) -> bool:
+        return self._running.locked()
+
+    def run_in_background(self, dry_run: bool = False, full: bool = True) -> bool:
+        """
+        Starts a run (full: mark and sweep, else collect_released) on its own
+        thread, since scheduler jobs must not block; False if one is running.
+        """
+        if self._running.locked():
+            return False
+
+        def target():
+            try:
+                if full:
+                    self.run(dry_run=dry_run)
+                else:
+                    self.collect_released(dry_run=dry_run)
+            except RuntimeError:
+                pass # started elsewhere in the meantime
+            except Exception as e:
+                logger.error(f"Storage GC failed: {e}")
+
+        threading.Thread(target=target, name="storage-gc", daemon=True).start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+storage_gc = StorageGC()
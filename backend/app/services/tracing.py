@@ -0,0 +1,275 @@
+"""
+Request tracing with an OpenTelemetry-shaped API and a local exporter.
+
+    tracer = get_tracer(__name__)
+    with tracer.start_as_current_span("ai.call", attributes={"model": name}) as span:
+        span.set_attribute("outcome", "success")
+
+Spans nest through contextvars, so they follow a request across awaits and
+into run_in_threadpool. Finished spans are written as JSON lines (trace_id,
+span_id, parent_id, name, start/end in unix nanoseconds, attributes, status,
+events) to stdout or TRACE_FILE, which OTLP/JSON converters and trace viewers
+can read. Should the opentelemetry SDK be adopted later, call sites stay the same.
+
+Disabled unless TRACE_EXPORTER is "stdout" or "file". TRACE_SAMPLE_RATE (0-1,
+default 1) decides per trace whether it is recorded; unrecorded spans cost a
+contextvar lookup.
+"""
+import os
+import sys
+import asyncio
+import json
+import time
+import random
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from .log_sink import get_logger
+
+logger = get_logger("tracing")
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+def _default_trace_file() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), "../../traces.jsonl"))
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[dict] = []
+        self.status = "UNSET"
+        self.status_description: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def is_recording(self) -> bool:
+        return self.end_ns is None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes or {}})
+
+    def record_exception(self, exception: BaseException):
+        self.add_event("exception", {"exception.type": type(exception).__name__, "exception.message": str(exception)})
+
+    def set_status(self, status: str, description: Optional[str] = None):
+        """status: "OK" or "ERROR" (StatusCode names in OpenTelemetry)."""
+        self.status = status
+        self.status_description = description
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": {"code": self.status, "description": self.status_description},
+            "events": self.events,
+        }
+
+class _NonRecordingSpan:
+    """Returned for spans that are not recorded (tracing off, trace not sampled, no traced parent)."""
+    trace_id = None
+    span_id = None
+
+    def is_recording(self) -> bool:
+        return False
+
+    def set_attribute(self, key, value): pass
+    def set_attributes(self, attributes): pass
+    def add_event(self, name, attributes=None): pass
+    def record_exception(self, exception): pass
+    def set_status(self, status, description=None): pass
+    def end(self): pass
+
+NON_RECORDING_SPAN = _NonRecordingSpan()
+
+class SpanExporter:
+    """Writes finished spans as JSON lines. Appends are line-sized, so worker processes can share a file."""
+
+    def __init__(self):
+        self.target = os.getenv("TRACE_EXPORTER", "").lower()
+        self.path = os.getenv("TRACE_FILE") or _default_trace_file()
+        self._lock = threading.Lock()
+        self._file = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.target in ("stdout", "file")
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str, ensure_ascii=False) + "\n"
+        try:
+            with self._lock:
+                if self.target == "stdout":
+                    sys.stdout.write(line)
+                    return
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8", buffering=1)
+                self._file.write(line)
+        except OSError as e:
+            logger.warning(f"Failed to export span {span.name}: {e}")
+
+exporter = SpanExporter()
+
+class Tracer:
+    def __init__(self, name: str):
+        self.name = name
+
+    @contextmanager
+    def start_as_current_span(self, name: str, attributes: Optional[Dict[str, Any]] = None, root: bool = False, trace_id: Optional[str] = None, parent_id: Optional[str] = None) -> Iterator[Any]:
+        """
+        Starts a span as a child of the current one and makes it current.
+        Exceptions are recorded on the span and re-raised. With root=True a new
+        trace is started (optionally continuing a remote trace_id/parent_id).
+        """
+        span = self._start(name, attributes, root, trace_id, parent_id)
+        if span is NON_RECORDING_SPAN:
+            yield span
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            span.set_status("ERROR", str(e))
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def _start(self, name, attributes, root, trace_id, parent_id):
+        if not exporter.enabled:
+            return NON_RECORDING_SPAN
+        parent = None if root else _current_span.get()
+        if parent is None:
+            if not root:
+                return NON_RECORDING_SPAN # spans only exist inside a traced request or job
+            if random.random() >= float(os.getenv("TRACE_SAMPLE_RATE", "1")):
+                return NON_RECORDING_SPAN
+            span = Span(name, trace_id or f"{random.getrandbits(128):032x}", parent_id, attributes)
+        else:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+        span.set_attribute("instrumentation.scope", self.name)
+        return span
+
+def get_tracer(name: str) -> Tracer:
+    return Tracer(name)
+
+def get_current_span():
+    return _current_span.get() or NON_RECORDING_SPAN
+
+def traced(name: str, root: bool = False):
+    """Decorator running a sync or async function inside a span."""
+    tracer = get_tracer("app")
+
+    def decorator(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.start_as_current_span(name, root=root):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name, root=root):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def instrument_sqlalchemy(engine):
+    """Adds a db.query span around every statement run inside a traced request."""
+    from sqlalchemy import event
+
+    tracer = get_tracer("sqlalchemy")
+    stack_key = "tracing_spans"
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if not get_current_span().is_recording():
+            return
+        manager = tracer.start_as_current_span("db.query", attributes={
+            "db.system": engine.dialect.name,
+            "db.statement": statement[:500],
+            "db.executemany": executemany,
+        })
+        manager.__enter__()
+        conn.info.setdefault(stack_key, []).append(manager)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get(stack_key)
+        if stack:
+            stack.pop().__exit__(None, None, None)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        stack = exception_context.connection.info.get(stack_key) if exception_context.connection is not None else None
+        if stack:
+            error = exception_context.original_exception
+            stack.pop().__exit__(type(error), error, error.__traceback__)
+
+def _parse_traceparent(header: Optional[str]):
+    # W3C trace context: 00-<trace_id>-<parent_id>-<flags>
+    parts = (header or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+class TracingMiddleware:
+    """
+    ASGI middleware starting one root span per HTTP request. An incoming W3C
+    traceparent header continues the caller's trace; the trace id is returned
+    in X-Trace-Id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.tracer = get_tracer("http")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not exporter.enabled:
+            await self.app(scope, receive, send)
+            return
+        from .metrics import route_template
+
+        headers = dict(scope.get("headers") or [])
+        trace_id, parent_id = _parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        method = scope.get("method", "")
+        with self.tracer.start_as_current_span(f"{method} {scope.get('path', '')}", attributes={"http.method": method, "http.target": scope.get("path", "")}, root=True, trace_id=trace_id, parent_id=parent_id) as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start" and span.is_recording():
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.set_status("ERROR")
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-trace-id", span.trace_id.encode("ascii"))]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+            if span.is_recording():
+                route = route_template(scope)
+                span.set_attribute("http.route", route)
+                span.name = f"{method} {route}"
@@ -0,0 +1,178 @@
+"""
+Validated ingestion of uploaded photos (problems and solutions).
+
+Uploads are streamed into the artifact store in CHUNK_SIZE pieces off the
+event loop, so memory per upload stays bounded whatever the file size. On top
+of that this module:
+
+- caps the size (MAX_UPLOAD_MB, default 20): oversized multipart bodies are
+  refused by UploadLimitMiddleware before they are read, and the copy into the
+  store stops as soon as the cap is passed;
+- sniffs the format from the file's magic bytes and verifies it with Pillow
+  before the file is renamed into place; the stored extension comes from the
+  detected format, never from the client's filename.
+"""
+import os
+from typing import BinaryIO, Callable, Optional, Tuple
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+from .artifact_store import artifact_store
+from .log_sink import get_logger
+
+logger = get_logger("upload")
+
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+MAX_UPLOAD_PIXELS = int(os.getenv("MAX_UPLOAD_PIXELS", "60000000")) # ~ a 60 MP phone photo
+# Multipart framing and the other form fields on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Pillow format -> stored extension
+IMAGE_FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif", "BMP": "bmp"}
+
+class UploadRejected(Exception):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+def sniff_image(head: bytes) -> Optional[str]:
+    """Pillow format name for the leading bytes of a file, or None if it is not a supported image."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    if head.startswith(b"BM"):
+        return "BMP"
+    return None
+
+def verify_image(path: str) -> str:
+    """Checks that `path` holds a sane image of a supported format; returns the extension to store it under."""
+    with open(path, "rb") as f:
+        head = f.read(16)
+    sniffed = sniff_image(head)
+    if not sniffed:
+        if head[4:12] in (b"ftypheic", b"ftypheix", b"ftypmif1"):
+            raise UploadRejected("HEIC photos are not supported; please upload JPEG or PNG", 415)
+        raise UploadRejected("Unsupported file type; please upload a JPEG, PNG or WebP image", 415)
+    try:
+        with Image.open(path) as image:
+            if image.format != sniffed:
+                raise UploadRejected("File content does not match its image format", 415)
+            width, height = image.size
+            if width * height > MAX_UPLOAD_PIXELS:
+                raise UploadRejected(f"Image too large ({width}x{height} pixels)", 413)
+            # Structural check without decoding the pixel data
+            image.verify()
+    except UploadRejected:
+        raise
+    except Image.DecompressionBombError:
+        raise UploadRejected("Image too large", 413)
+    except Exception as e:
+        logger.info(f"Image verification failed: {e}")
+        raise UploadRejected("Corrupt or truncated image", 415)
+    return IMAGE_FORMATS[sniffed]
+
+class _LimitedReader:
+    """Reads through to `source`, raising UploadRejected once more than `limit` bytes were read."""
+
+    def __init__(self, source: BinaryIO, limit: int):
+        self.source = source
+        self.limit = limit
+        self.total = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.source.read(size)
+        self.total += len(chunk)
+        if self.total > self.limit:
+            raise UploadRejected(f"File exceeds the {self.limit // (1024 * 1024)} MB upload limit", 413)
+        return chunk
+
+def ingest_image(source: BinaryIO, subdir: str = "", max_bytes: Optional[int] = None,
+                 verify: Callable[[str], str] = verify_image) -> Tuple[str, bool]:
+    """
+    Blocking: streams `source` into the artifact store, enforcing the size cap and
+    verifying the file (an image, unless `verify` says otherwise) before it
+    becomes visible. Returns (name, created) like ArtifactStore.save_upload;
+    raises UploadRejected.
+    """
+    limit = max_bytes or MAX_UPLOAD_BYTES
+    try:
+        return artifact_store.save_upload(_LimitedReader(source, limit), subdir=subdir, verify=verify)
+    except UploadRejected as e:
+        logger.warning(f"Upload rejected ({e.status_code}): {e}")
+        raise
+
+async def save_image_upload(file: UploadFile, subdir: str = "", verify: Callable[[str], str] = verify_image) -> Tuple[str, bool]:
+    """ingest_image for a request's UploadFile, run in the threadpool."""
+    return await run_in_threadpool(ingest_image, file.file, subdir, None, verify)
+
+class UploadLimitMiddleware:
+    """
+    Answers 413 for multipart requests whose body exceeds the upload cap, before
+    the form parser spools it to disk: up front when Content-Length says so,
+    otherwise as soon as the streamed body passes the limit.
+    """
+
+    def __init__(self, app, max_body: Optional[int] = None):
+        self.app = app
+        self.max_body = max_body or MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._is_multipart(scope):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        try:
+            declared = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            declared = 0
+        if declared > self.max_body:
+            await self._reject(send)
+            return
+
+        state = {"received": 0, "exceeded": False, "started": False}
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > self.max_body:
+                    state["exceeded"] = True
+                    raise UploadRejected("Request body too large", 413)
+            return message
+
+        async def guarded_send(message):
+            # The form parser turns our exception into a 400; answer 413 instead
+            if state["exceeded"] and not state["started"]:
+                return
+            if message["type"] == "http.response.start":
+                state["started"] = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadRejected:
+            if not state["exceeded"]:
+                raise
+        if state["exceeded"] and not state["started"]:
+            await self._reject(send)
+
+    def _is_multipart(self, scope) -> bool:
+        if scope.get("method") not in ("POST", "PUT", "PATCH"):
+            return False
+        headers = dict(scope.get("headers") or [])
+        return headers.get(b"content-type", b"").lower().startswith(b"multipart/form-data")
+
+    async def _reject(self, send):
+        body = f'{{"detail":"Upload exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit"}}'.encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
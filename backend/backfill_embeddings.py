@@ -0,0 +1,47 @@
+"""
+Embeds existing problems and practice problems into problem_embeddings.
+Run from the backend directory:
+
+    python backfill_embeddings.py [--batch-size 50] [--force]
+"""
+import argparse
+import asyncio
+from app.database import SessionLocal
+from app.models import Problem, PracticeProblem, ProblemEmbedding
+from app.services.ai_service import get_ai_service
+from app.services.embedding_service import embedding_model_name, index_embeddings
+
+async def backfill(batch_size: int, force: bool):
+    ai_service = get_ai_service()
+    for source_type, model in (("problem", Problem), ("practice", PracticeProblem)):
+        last_id = 0
+        total = 0
+        while True:
+            db = SessionLocal()
+            try:
+                query = db.query(model.id).filter(model.id > last_id)
+                if not force:
+                    embedded = db.query(ProblemEmbedding.source_id).filter(
+                        ProblemEmbedding.source_type == source_type,
+                        ProblemEmbedding.model == embedding_model_name()
+                    )
+                    query = query.filter(~model.id.in_(embedded))
+                ids = [row[0] for row in query.order_by(model.id.asc()).limit(batch_size).all()]
+            finally:
+                db.close()
+            if not ids:
+                break
+
+            await index_embeddings(ai_service, [(source_type, i) for i in ids], force=force)
+            last_id = ids[-1]
+            total += len(ids)
+            print(f"{source_type}: processed {total} rows (up to id {last_id})")
+
+    print("Backfill complete.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill problem embeddings")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--force", action="store_true", help="Re-embed rows that already have an embedding")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.batch_size, args.force))
@@ -0,0 +1,70 @@
+"""
+Computes image / LaTeX hashes for existing problems and fills problem_fingerprints.
+Run from the backend directory:
+
+    python backfill_fingerprints.py [--batch-size 500] [--link] [--rehash]
+
+--link     also mark rows that duplicate an older problem (duplicate_of_id)
+--rehash   recompute hashes for rows that already have them
+"""
+import argparse
+from app.database import SessionLocal
+from app.models import Problem
+from app.services.dedup_service import DedupService, image_hash, latex_simhash, canonical_id
+from app.services.artifact_store import artifact_store
+
+def backfill(batch_size: int, link: bool, rehash: bool):
+    db = SessionLocal()
+    dedup = DedupService(db)
+    last_id = 0
+    processed = linked = missing = 0
+    try:
+        while True:
+            # Oldest first, so a duplicate always links to the earliest copy
+            query = db.query(Problem).filter(Problem.id > last_id)
+            if not rehash:
+                query = query.filter(Problem.latex_simhash == None)
+            batch = query.order_by(Problem.id.asc()).limit(batch_size).all()
+            if not batch:
+                break
+
+            for problem in batch:
+                last_id = problem.id
+                problem.latex_simhash = latex_simhash(problem.latex_content)
+                if problem.latex_simhash is None:
+                    # Failed or empty analysis: keep it out of the index
+                    problem.image_hash = None
+                    dedup.index_problem(problem)
+                    continue
+
+                path = artifact_store.resolve(problem.image_path)
+                if path:
+                    problem.image_hash = image_hash(path)
+                else:
+                    missing += 1
+
+                if link and not problem.duplicate_of_id:
+                    duplicate = dedup.find_duplicate(problem.image_hash, problem.latex_simhash, exclude_id=problem.id)
+                    if duplicate and duplicate.id < problem.id:
+                        problem.duplicate_of_id = canonical_id(duplicate)
+                        linked += 1
+
+                dedup.index_problem(problem)
+                # Later rows in the batch must see this one as a candidate
+                db.flush()
+                processed += 1
+
+            db.commit()
+            print(f"Processed up to id {last_id} ({processed} indexed, {linked} linked, {missing} images missing)")
+    finally:
+        db.close()
+
+    print("Backfill complete.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill near-duplicate fingerprints for existing problems")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--link", action="store_true", help="Set duplicate_of_id on rows matching an older problem")
+    parser.add_argument("--rehash", action="store_true", help="Recompute hashes for already indexed rows")
+    args = parser.parse_args()
+    backfill(args.batch_size, args.link, args.rehash)
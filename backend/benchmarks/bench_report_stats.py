@@ -0,0 +1,117 @@
+"""
+Benchmarks weekly-report statistics against growing learning histories and
+reports wall time and peak Python memory (tracemalloc) per history size.
+
+    cd backend
+    python benchmarks/bench_report_stats.py                 # throwaway SQLite database
+    python benchmarks/bench_report_stats.py --sizes 1000 20000 100000
+    DATABASE_URL=postgresql://... python benchmarks/bench_report_stats.py --keep-data
+
+The "legacy" column replays the previous approach (load every LearningRecord and
+count in Python) for comparison; the SQL aggregate path should stay flat.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+from app.database import Base, engine, SessionLocal
+from app.models import User, Problem, LearningRecord
+from app.services.report_service import ReportService
+
+def seed_user(db, username: str, size: int) -> int:
+    user = User(username=username, hashed_password="x", name=username)
+    db.add(user)
+    db.commit()
+
+    now = datetime.utcnow()
+    problems = [
+        {"user_id": user.id, "image_path": "bench.jpg", "latex_content": "x", "created_at": now - timedelta(hours=i)}
+        for i in range(size)
+    ]
+    db.bulk_insert_mappings(Problem, problems)
+    db.commit()
+    problem_ids = [row[0] for row in db.query(Problem.id).filter(Problem.user_id == user.id).all()]
+
+    records = [
+        {
+            "user_id": user.id,
+            "problem_id": pid,
+            "mastery_level": (i % 4) or None,
+            "status": "wrong",
+            "created_at": now - timedelta(hours=i),
+        }
+        for i, pid in enumerate(problem_ids)
+    ]
+    db.bulk_insert_mappings(LearningRecord, records)
+    db.commit()
+    return user.id
+
+def legacy_stats(db, user_id: int):
+    all_records = db.query(LearningRecord).filter(LearningRecord.user_id == user_id).all()
+    counts = {1: 0, 2: 0, 3: 0, "No Data": 0}
+    for r in all_records:
+        if r.mastery_level:
+            counts[r.mastery_level] = counts.get(r.mastery_level, 0) + 1
+        else:
+            counts["No Data"] += 1
+    weak = [r.problem_id for r in all_records if r.mastery_level in [1, 2]]
+    return counts, weak
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--keep-data", action="store_true", help="Don't delete the seeded users afterwards")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+    week_start = date.today() - timedelta(days=date.today().weekday())
+    end_date = week_start + timedelta(days=6)
+
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+    print(f"{'records':>10} | {'sql ms':>8} | {'sql peak KiB':>12} | {'legacy ms':>9} | {'legacy peak KiB':>15}")
+    print("-" * 68)
+
+    seeded = []
+    db = SessionLocal()
+    try:
+        for size in args.sizes:
+            user_id = seed_user(db, f"bench_{size}_{int(time.time())}", size)
+            seeded.append(user_id)
+            db.expunge_all()
+
+            service = ReportService(db)
+            sql_ms, sql_kib = measure(lambda: (service._collect_stats(user_id, week_start, end_date),
+                                               service._pick_review_problems(user_id, 3)))
+            db.expunge_all()
+            legacy_ms, legacy_kib = measure(lambda: legacy_stats(db, user_id))
+            db.expunge_all()
+            print(f"{size:>10} | {sql_ms:>8.1f} | {sql_kib:>12.1f} | {legacy_ms:>9.1f} | {legacy_kib:>15.1f}")
+    finally:
+        if not args.keep_data:
+            for user_id in seeded:
+                db.query(LearningRecord).filter(LearningRecord.user_id == user_id).delete()
+                db.query(Problem).filter(Problem.user_id == user_id).delete()
+                db.query(User).filter(User.id == user_id).delete()
+            db.commit()
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmarks worker start-up: how long a fresh process takes to import the app
+(python -X importtime) and to answer its first request (lifespan included),
+which is what every uvicorn/gunicorn worker and every autoscaled replica pays
+before it can serve traffic.
+
+    cd backend
+    python benchmarks/bench_startup.py                  # 5 runs each, throwaway SQLite database
+    python benchmarks/bench_startup.py --runs 10 --top 15
+
+The "eager" column replays the previous start-up, which imported and
+configured the Gemini SDK (three times) and pdfium while importing the app;
+the "lazy" column is the app as it is. "first model use" is what the first
+request that needs the model client pays instead.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, os, sys, time
+started = time.perf_counter()
+if os.environ.get("BENCH_EAGER"):
+    import google.generativeai as genai
+    import pypdfium2
+    for _ in range(3):
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY") or "unset")
+import app.main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.database import Base, engine
+Base.metadata.create_all(engine)
+with TestClient(app.main.app) as client:
+    client.get("/")
+    ready = time.perf_counter()
+    from app.services.ai_service import get_ai_service
+    get_ai_service().provider
+    provider = time.perf_counter()
+print("BENCH " + json.dumps({"import": imported - started, "ready": ready - started, "provider": provider - ready}))
+"""
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def run_child(eager: bool, importtime: bool = False):
+    """(timings, stderr) of one fresh process; with importtime it only imports the app."""
+    workdir = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        ARTIFACT_ROOT=os.path.join(workdir, "artifacts"),
+        AI_PROVIDER="gemini",
+        LEADER_RETRY_SECONDS="0.1",
+        STORAGE_GC_MODE="off",
+    )
+    env.pop("BENCH_EAGER", None)
+    if eager:
+        env["BENCH_EAGER"] = "1"
+    if importtime:
+        args = [sys.executable, "-X", "importtime", "-c", "import app.main; print('BENCH {}')"]
+    else:
+        args = [sys.executable, "-c", CHILD]
+    result = subprocess.run(args, cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    line = next((l for l in result.stdout.splitlines() if l.startswith("BENCH ")), None)
+    if not line:
+        raise RuntimeError(f"Benchmark process failed:\n{result.stderr[-2000:]}")
+    return json.loads(line[len("BENCH "):]), result.stderr
+
+def slowest_imports(stderr: str, top: int):
+    """Top-level imports (and app.main's direct imports) by cumulative microseconds."""
+    rows = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match and len(match.group(3)) <= 3:
+            rows.append((int(match.group(2)), match.group(3) + match.group(4)))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker import and start-up time")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per variant")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    results = {}
+    for variant in ("eager", "lazy"):
+        runs = [run_child(variant == "eager")[0] for _ in range(args.runs)]
+        results[variant] = {key: statistics.median(r[key] for r in runs) for key in ("import", "ready", "provider")}
+
+    print(f"{'median of ' + str(args.runs):<20} {'eager':>10} {'lazy':>10}")
+    for key, label in (("import", "import app"), ("ready", "first response"), ("provider", "first model use")):
+        print(f"{label:<20} {results['eager'][key] * 1000:>8.0f}ms {results['lazy'][key] * 1000:>8.0f}ms")
+
+    _, stderr = run_child(False, importtime=True)
+    print("\nSlowest imports now (python -X importtime, cumulative):")
+    for micros, name in slowest_imports(stderr, args.top):
+        print(f"{micros / 1000:>8.1f}ms  {name}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+End-to-end load test of the main student endpoints against a seeded database,
+with the offline model provider standing in for Gemini. Reports throughput and
+p50/p95/p99 latency per endpoint.
+
+    cd backend
+    python benchmarks/load_test.py                          # in-process app, throwaway SQLite database
+    python benchmarks/load_test.py --users 200 --problems 300 --concurrency 50 --requests 500
+    FAKE_AI_LATENCY_MS=1500,6000 FAKE_AI_429_RATE=0.05 FAKE_AI_MALFORMED_RATE=0.2 python benchmarks/load_test.py
+    DATABASE_URL=postgresql://... python benchmarks/load_test.py --keep-data
+
+With --url the requests go to a running server instead (start it with
+AI_PROVIDER=fake and the same DATABASE_URL; the seeding still happens here).
+Upload and submit_solution send a freshly drawn image each time so near-
+duplicate detection does not short-circuit the model call.
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+os.environ.setdefault("AI_PROVIDER", "fake")
+os.environ.setdefault("ARTIFACT_ROOT", tempfile.mkdtemp())
+# Per-request INFO logs would interleave with the results table
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import httpx
+from PIL import Image, ImageDraw
+
+from app.database import Base, engine, SessionLocal
+from app.models import User, Problem, ProblemFingerprint, ProblemEmbedding, LearningRecord, PracticeProblem, SolutionAttempt, WeeklyReport
+from app.services.auth_service import auth_service
+from app.services.blob_refs import rebuild_blob_refs
+from app.services.model_providers import FAKE_RESPONSES
+
+ENDPOINTS = ["upload", "daily_review", "reviews_today", "similar", "submit_solution", "report_generate"]
+
+def seed(db, users: int, problems_per_user: int, tag: str):
+    """Students with a problem history; about a tenth of each history is due for review."""
+    vision = FAKE_RESPONSES["vision"]
+    now = datetime.utcnow()
+    user_ids = []
+    for i in range(users):
+        user = User(username=f"load_{tag}_{i}", hashed_password="x", name=f"Load {i}", class_name=f"load_{tag}")
+        db.add(user)
+        db.flush()
+        user_ids.append(user.id)
+    db.commit()
+
+    for user_id in user_ids:
+        problems = [
+            {
+                "user_id": user_id,
+                "image_path": "bench.jpg",
+                "latex_content": vision["latex_content"],
+                "ai_analysis": vision["ai_analysis"],
+                "difficulty": vision["difficulty"],
+                "knowledge_path": vision["knowledge_path"],
+                "created_at": now - timedelta(hours=j * 7),
+            }
+            for j in range(problems_per_user)
+        ]
+        db.bulk_insert_mappings(Problem, problems)
+        db.commit()
+        problem_ids = [row[0] for row in db.query(Problem.id).filter(Problem.user_id == user_id).all()]
+        records = [
+            {
+                "user_id": user_id,
+                "problem_id": pid,
+                "status": "wrong",
+                "mastery_level": (j % 3) + 1,
+                "interval": j % 30,
+                "review_date": now + timedelta(days=(j % 10) - 1),
+                "created_at": now - timedelta(hours=j * 7),
+            }
+            for j, pid in enumerate(problem_ids)
+        ]
+        db.bulk_insert_mappings(LearningRecord, records)
+        db.commit()
+
+    problems = {}
+    for user_id, problem_id in db.query(Problem.user_id, Problem.id).filter(Problem.user_id.in_(user_ids)).all():
+        problems.setdefault(user_id, []).append(problem_id)
+    return user_ids, problems
+
+def cleanup(db, user_ids):
+    problem_ids = [row[0] for row in db.query(Problem.id).filter(Problem.user_id.in_(user_ids)).all()]
+    practice_ids = [row[0] for row in db.query(PracticeProblem.id).filter(PracticeProblem.source_problem_id.in_(problem_ids)).all()]
+    db.query(ProblemEmbedding).filter(ProblemEmbedding.source_type == "problem", ProblemEmbedding.source_id.in_(problem_ids)).delete(synchronize_session=False)
+    db.query(ProblemEmbedding).filter(ProblemEmbedding.source_type == "practice", ProblemEmbedding.source_id.in_(practice_ids)).delete(synchronize_session=False)
+    for model, column in [(ProblemFingerprint, ProblemFingerprint.problem_id), (SolutionAttempt, SolutionAttempt.problem_id),
+                          (PracticeProblem, PracticeProblem.source_problem_id)]:
+        db.query(model).filter(column.in_(problem_ids)).delete(synchronize_session=False)
+    db.query(WeeklyReport).filter(WeeklyReport.user_id.in_(user_ids)).delete(synchronize_session=False)
+    # Uploads may point at each other (duplicate_of_id / source_problem_id)
+    db.query(Problem).filter(Problem.id.in_(problem_ids)).update({Problem.duplicate_of_id: None, Problem.source_problem_id: None}, synchronize_session=False)
+    db.query(LearningRecord).filter(LearningRecord.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.query(Problem).filter(Problem.user_id.in_(user_ids)).delete(synchronize_session=False)
+    db.query(User).filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+    db.commit()
+    # The bulk deletes bypass the reference-count events
+    rebuild_blob_refs(db)
+
+def photo(rng: random.Random) -> bytes:
+    """A phone-photo-sized JPEG with random strokes, distinct per call."""
+    image = Image.new("RGB", (1200, 900), (245, 245, 240))
+    draw = ImageDraw.Draw(image)
+    for _ in range(60):
+        x, y = rng.randrange(1200), rng.randrange(900)
+        draw.line((x, y, x + rng.randrange(-200, 200), y + rng.randrange(-40, 40)), fill=(rng.randrange(80), rng.randrange(80), rng.randrange(80)), width=3)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+def request_for(endpoint: str, problem_id: int, rng: random.Random):
+    if endpoint == "upload":
+        return "POST", "/api/upload", {"files": {"file": ("photo.jpg", photo(rng), "image/jpeg")}}
+    if endpoint == "daily_review":
+        return "GET", "/api/daily-review", {}
+    if endpoint == "reviews_today":
+        return "GET", "/api/reviews/today", {}
+    if endpoint == "similar":
+        return "POST", f"/api/problems/{problem_id}/similar", {}
+    if endpoint == "submit_solution":
+        return "POST", f"/api/problems/{problem_id}/submit_solution", {"files": {"file": ("answer.jpg", photo(rng), "image/jpeg")}}
+    return "POST", "/api/reports/generate", {}
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * p / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+async def run_endpoint(client, endpoint: str, tokens, problems, total: int, concurrency: int, seed_value: int):
+    rng = random.Random(seed_value)
+    # Drawn up front so image generation is not part of the timed section
+    plan = []
+    for _ in range(total):
+        user_id = rng.choice(list(tokens))
+        plan.append((tokens[user_id], request_for(endpoint, rng.choice(problems[user_id]), rng)))
+
+    latencies = []
+    statuses = Counter()
+    queue = iter(plan)
+
+    async def worker():
+        for token, (method, path, kwargs) in queue:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+                statuses[response.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+async def run(args, tokens, problems):
+    timeout = httpx.Timeout(args.timeout)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=timeout)
+        lifespan = None
+    else:
+        from app.main import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=timeout)
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+
+    print(f"{'endpoint':<16} | {'reqs':>5} | {'req/s':>7} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | statuses")
+    print("-" * 90)
+    try:
+        async with client:
+            for i, endpoint in enumerate(args.endpoints):
+                latencies, statuses, elapsed = await run_endpoint(client, endpoint, tokens, problems, args.requests, args.concurrency, args.seed + i)
+                codes = " ".join(f"{code}x{count}" for code, count in sorted(statuses.items(), key=lambda item: str(item[0])))
+                print(f"{endpoint:<16} | {len(latencies):>5} | {len(latencies) / elapsed:>7.1f} | "
+                      f"{percentile(latencies, 50):>8.1f} | {percentile(latencies, 95):>8.1f} | {percentile(latencies, 99):>8.1f} | {codes}")
+    finally:
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--problems", type=int, default=200, help="Problems (with learning records) per user")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+    parser.add_argument("--url", help="Base URL of a running server; default drives the app in-process")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-data", action="store_true", help="Don't delete the seeded users afterwards")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+    print(f"Provider: {os.environ['AI_PROVIDER']}  latency: {os.getenv('FAKE_AI_LATENCY_MS', '800,2500')} ms  "
+          f"429: {os.getenv('FAKE_AI_429_RATE', '0')}  503: {os.getenv('FAKE_AI_503_RATE', '0')}  malformed: {os.getenv('FAKE_AI_MALFORMED_RATE', '0')}")
+
+    db = SessionLocal()
+    started = time.perf_counter()
+    user_ids, problems = seed(db, args.users, args.problems, str(int(time.time())))
+    print(f"Seeded {len(user_ids)} users x {args.problems} problems in {time.perf_counter() - started:.1f}s\n")
+    tokens = {
+        user.id: auth_service.create_access_token({"sub": user.username}, timedelta(hours=2))
+        for user in db.query(User).filter(User.id.in_(user_ids)).all()
+    }
+    try:
+        asyncio.run(run(args, tokens, problems))
+    finally:
+        if not args.keep_data:
+            cleanup(db, user_ids)
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,514 @@
+"""
+Bulk-generates a realistic MathRob dataset with PostgreSQL COPY, for
+benchmarking queries, indexes and the scheduler at production-like volume.
+
+    cd backend
+    DATABASE_URL=postgresql://... python benchmarks/seed_data.py --scale 1          # ~1k users, ~200k problems
+    DATABASE_URL=postgresql://... python benchmarks/seed_data.py --scale 10 --seed 7 --bulk
+
+Scale 1 is 1,000 students (classes of ~40) with a lognormal number of problems
+each (median ~150), one SM-2 LearningRecord per problem, solution attempts with
+teacher-style feedback_json, generated PracticeProblems and 50,000 SystemLog
+rows with incident bursts. Everything scales linearly and the same --seed
+always produces the same rows (the history ends at --until, midnight UTC
+today by default). Seeded users are named "<prefix><id>" with
+password "password".
+
+Rows are appended after the current maximum ids (sequences are advanced
+afterwards), so existing data is left alone. Remove a seeded set with
+--delete-prefix. Generation runs at several hundred thousand rows/s; with the
+indexes in place PostgreSQL is the bottleneck, so on a dedicated benchmark
+database use --bulk to rebuild them once per table instead.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import numpy as np
+from sqlalchemy import text
+from app.database import Base, engine
+from app import models # registers the tables for create_all
+
+DAY = 86400
+
+KNOWLEDGE_PATHS = [
+    "SH_MATH.01.01", "SH_MATH.01.02", "SH_MATH.01.03", "SH_MATH.02.01", "SH_MATH.02.02",
+    "SH_MATH.03.01", "SH_MATH.03.02", "SH_MATH.03.03", "SH_MATH.03.04", "SH_MATH.04.01",
+    "SH_MATH.04.02", "SH_MATH.04.03", "SH_MATH.04.04", "SH_MATH.04.05", "SH_MATH.05.01",
+    "SH_MATH.05.02", "SH_MATH.05.03", "SH_MATH.05.04", "SH_MATH.06.01", "SH_MATH.06.02",
+    "SH_MATH.06.03", "SH_MATH.07.01", "SH_MATH.07.02", "SH_MATH.07.03", "SH_MATH.07.04",
+    "SH_MATH.07.05", "SH_MATH.08.01", "SH_MATH.08.02", "SH_MATH.08.03", "SH_MATH.09.01",
+    "SH_MATH.09.02", "SH_MATH.09.03", "SH_MATH.09.04", "SH_MATH.10.01", "SH_MATH.10.02",
+    "SH_MATH.10.03",
+]
+# Share of homework per chapter: functions, trig, conics and derivatives come up
+# far more often than sets and logic or vectors and complex numbers
+CHAPTER_WEIGHTS = {
+    "SH_MATH.01": 3,  # 集合与逻辑
+    "SH_MATH.02": 6,  # 不等式
+    "SH_MATH.03": 20, # 函数
+    "SH_MATH.04": 16, # 三角函数
+    "SH_MATH.05": 11, # 数列与数学归纳法
+    "SH_MATH.06": 5,  # 平面向量与复数
+    "SH_MATH.07": 15, # 解析几何
+    "SH_MATH.08": 8,  # 立体几何
+    "SH_MATH.09": 7,  # 概率与统计
+    "SH_MATH.10": 9,  # 导数及其应用
+}
+# Split evenly between the sections of a chapter
+PATH_WEIGHTS = [
+    CHAPTER_WEIGHTS[path[:10]] / sum(p[:10] == path[:10] for p in KNOWLEDGE_PATHS) for path in KNOWLEDGE_PATHS
+]
+
+LATEX_TEMPLATES = [
+    "已知函数 $f(x)=x^{{{a}}}-{b}x+{c}$，求 $f(x)$ 在区间 $[{c},{d}]$ 上的最大值与最小值。",
+    "解不等式 $\\frac{{x-{a}}}{{x+{b}}} \\geq {c}$。",
+    "在 $\\triangle ABC$ 中，$a={a}$，$b={b}$，$C=\\frac{{\\pi}}{{{c}}}$，求 $c$ 及 $\\triangle ABC$ 的面积。",
+    "已知等差数列 $\\{{a_n\\}}$ 中，$a_{a}={b}$，$S_{c}={d}$，求通项公式 $a_n$。",
+    "已知椭圆 $\\frac{{x^2}}{{{a}}}+\\frac{{y^2}}{{{b}}}=1$，过点 $({c},0)$ 的直线与椭圆交于 $A,B$ 两点，求 $|AB|$ 的最大值。",
+    "已知向量 $\\vec{{a}}=({a},{b})$，$\\vec{{b}}=({c},{d})$，求 $\\vec{{a}}\\cdot\\vec{{b}}$ 及夹角的余弦值。",
+    "从 ${a}$ 名男生和 ${b}$ 名女生中选出 ${c}$ 人参加比赛，至少有 1 名女生的选法有多少种？",
+    "设 $f(x)=\\ln x-{a}x^2+{b}x$，讨论 $f(x)$ 的单调性，并求 $f(x)$ 的极值。",
+    "已知正四棱锥的底面边长为 ${a}$，侧棱长为 ${b}$，求其体积与表面积。",
+    "已知 $\\sin\\alpha=\\frac{{{a}}}{{{b}}}$，$\\alpha\\in(\\frac{{\\pi}}{{2}},\\pi)$，求 $\\tan(\\alpha+\\frac{{\\pi}}{{{c}}})$。",
+]
+
+AI_MODELS = ["gemini-2.0-flash-lite", "gemini-2.0-flash", "gemini-1.5-pro"]
+MODEL_WEIGHTS = [70, 25, 5]
+
+LOG_MESSAGES = {
+    "ERROR": [
+        ("vision", "All models failed for vision. Last error: 503 The service is currently unavailable."),
+        ("vision", "Rate Limit Exceeded (429): Resource has been exhausted (e.g. check quota)."),
+        ("teaching", "Failed to parse teaching JSON after repair"),
+        ("utility", "All models failed for utility. Last error: 504 Deadline Exceeded"),
+        ("report", "Weekly report failed for user"),
+    ],
+    "WARNING": [
+        ("vision", "主模型调用失败，正在切换至备选模型 (if available)。Error: 429 Resource has been exhausted"),
+        ("utility", "主模型调用失败，正在切换至备选模型 (if available)。Error: 503 The service is currently unavailable."),
+        ("teaching", "Recovered malformed JSON with backslash repair"),
+        ("upload", "AI returned non-existent knowledge path, resolved to parent"),
+        ("watcher", "Skipping unreadable file in upload directory"),
+    ],
+    "INFO": [
+        ("report", "Weekly reports generated"),
+        ("scheduler", "Job finished: system_log_retention"),
+        ("usage", "AI usage flushed"),
+    ],
+}
+LEVEL_WEIGHTS = {"ERROR": 15, "WARNING": 70, "INFO": 15}
+
+AI_CATEGORIES = ("vision", "teaching", "utility")
+CHUNK_ROWS = 50000
+
+def csv_quote(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+def timestamps(ts: np.ndarray) -> list:
+    """Epoch seconds -> 'YYYY-MM-DDTHH:MM:SS' strings, vectorized."""
+    return np.datetime_as_string(ts.astype("int64").astype("datetime64[s]")).tolist()
+
+def weighted_choice(rng: np.random.Generator, weights, size: int) -> np.ndarray:
+    p = np.asarray(weights, dtype=float)
+    return rng.choice(len(p), size=size, p=p / p.sum())
+
+def activity_times(rng: np.random.Generator, begin: np.ndarray, end: float) -> np.ndarray:
+    """Timestamps in [begin, end), weighted towards weekday evenings like real homework uploads."""
+    out = np.empty(len(begin))
+    todo = np.arange(len(begin))
+    while todo.size:
+        ts = rng.uniform(begin[todo], end)
+        local = ts + 8 * 3600 # Shanghai local time
+        hour = (local // 3600) % 24
+        weekday = (local // DAY + 3) % 7 # 1970-01-01 was a Thursday
+        weight = np.where(weekday < 5, 1.0, 0.6) * np.select([(hour >= 17), (hour >= 7)], [1.0, 0.35], 0.05)
+        accepted = rng.random(todo.size) < weight
+        out[todo[accepted]] = ts[accepted]
+        todo = todo[~accepted]
+    return out
+
+def group_starts(counts: np.ndarray) -> np.ndarray:
+    """For rows repeated per parent by `counts`, the index of the first row of each row's parent."""
+    return np.repeat(np.cumsum(counts) - counts, counts)
+
+class CopyStream:
+    """File-like object for cursor.copy_expert over an iterator of (row count, CSV text) chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = ""
+        self.pos = 0
+        self.count = 0
+
+    def read(self, size: int = -1) -> str:
+        if size < 0:
+            size = 1 << 20
+        while len(self.buffer) - self.pos < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.count += chunk[0]
+            self.buffer = self.buffer[self.pos:] + chunk[1]
+            self.pos = 0
+        data = self.buffer[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+def chunked(total: int, render):
+    """Calls render(slice) for each CHUNK_ROWS slice of the rows; render returns CSV lines."""
+    for start in range(0, total, CHUNK_ROWS):
+        part = slice(start, min(start + CHUNK_ROWS, total))
+        lines = render(part)
+        yield len(lines), "".join(lines)
+
+class Seeder:
+    """
+    Generates each table column-wise with numpy, ordered by created_at with ids
+    assigned in that order, as they would be in production.
+    """
+
+    def __init__(self, conn, seed: int, scale: float, days: int, prefix: str, until: date, bulk: bool = False):
+        self.conn = conn
+        self.bulk = bulk
+        self.seed = seed
+        self.scale = scale
+        self.prefix = prefix
+        self.end = datetime.combine(until, datetime.min.time(), tzinfo=timezone.utc).timestamp()
+        self.start = self.end - days * DAY
+        self.results = []
+
+    def rng(self, table: str) -> np.random.Generator:
+        # One stream per table, so skipping a table leaves the others unchanged
+        return np.random.default_rng([self.seed, TABLES.index(table)])
+
+    def next_id(self, table: str) -> int:
+        with self.conn.cursor() as cur:
+            cur.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+            return cur.fetchone()[0]
+
+    def copy(self, table: str, columns, chunks):
+        stream = CopyStream(chunks)
+        started = time.perf_counter()
+        with self.conn.cursor() as cur:
+            if self.bulk:
+                # Building secondary indexes once afterwards is much cheaper than maintaining them row by row
+                cur.execute(
+                    "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s"
+                    " AND indexname NOT IN (SELECT conname FROM pg_constraint)", (table,)
+                )
+                deferred = cur.fetchall()
+                for name, _ in deferred:
+                    cur.execute(f"DROP INDEX {name}")
+                # session_replication_role = replica skips the foreign key checks, but also
+                # user triggers such as problems_search_update; keep those firing
+                cur.execute("SELECT tgname FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal AND tgenabled = 'O'", (table,))
+                triggers = [row[0] for row in cur.fetchall()]
+                for name in triggers:
+                    cur.execute(f'ALTER TABLE {table} ENABLE ALWAYS TRIGGER "{name}"')
+            cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", stream, size=1 << 20)
+            # Explicit ids were used; keep the serial sequence ahead of them
+            cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))")
+            loaded = time.perf_counter()
+            if self.bulk:
+                for name in triggers:
+                    cur.execute(f'ALTER TABLE {table} ENABLE TRIGGER "{name}"')
+                for _, definition in deferred:
+                    cur.execute(definition)
+        self.conn.commit()
+        elapsed = time.perf_counter() - started
+        self.results.append((table, stream.count, loaded - started, elapsed))
+        print(f"{table:<20} | {stream.count:>10,} | {elapsed:>7.1f} | {stream.count / (loaded - started):>11,.0f} | {elapsed - (loaded - started):>8.1f}")
+
+    def latex_pool(self, rng: np.random.Generator, size: int = 4096) -> list:
+        """Rendered problem statements; templates with varying numbers, like a real class's homework."""
+        templates = rng.integers(len(LATEX_TEMPLATES), size=size)
+        numbers = np.column_stack([rng.integers(2, 10, size), rng.integers(2, 21, size), rng.integers(1, 7, size), rng.integers(7, 31, size)]).tolist()
+        return [csv_quote(LATEX_TEMPLATES[t].format(a=a, b=b, c=c, d=d)) for t, (a, b, c, d) in zip(templates.tolist(), numbers)]
+
+    def users(self):
+        import bcrypt
+        rng = self.rng("users")
+        count = max(1, int(1000 * self.scale))
+        password = bcrypt.hashpw(b"password", bcrypt.gensalt(rounds=4)).decode()
+        first = self.next_id("users")
+        self.user_ids = np.arange(first, first + count)
+        # Per-student activity: a few heavy users, a long tail of light ones
+        self.user_activity = rng.lognormal(0, 0.9, count)
+        self.user_joined = self.start - rng.uniform(0, 60, count) * DAY
+        joined = timestamps(self.user_joined)
+
+        def render(part):
+            return [
+                f"{user_id},{self.prefix}{user_id},{password},学生{user_id},f,{self.prefix}class_{i // 40 + 1},{joined[i]}\n"
+                for i, user_id in zip(range(part.start, part.stop), self.user_ids[part].tolist())
+            ]
+        self.copy("users", ["id", "username", "hashed_password", "name", "is_admin", "class_name", "created_at"], chunked(count, render))
+
+    def problems(self):
+        rng = self.rng("problems")
+        first = self.next_id("problems")
+        counts = (150 * self.user_activity).astype(int)
+        users = np.repeat(self.user_ids, counts)
+        created = activity_times(rng, np.repeat(np.maximum(self.start, self.user_joined), counts), self.end)
+        order = np.argsort(created, kind="stable")
+        n = len(order)
+
+        # Kept for the tables that hang off problems
+        self.first_problem = first
+        self.problem_user = users[order]
+        self.problem_time = created[order]
+        self.problem_path = weighted_choice(rng, PATH_WEIGHTS, n)
+        self.problem_difficulty = np.clip(np.rint(rng.normal(2.8, 1.0, n)), 1, 5).astype(int)
+
+        analyses = [csv_quote(json.dumps({
+            "topic": [path],
+            "solution": f"解：由题意，先化简再讨论。结论见答案（{path}）。",
+            "thinking_process": "先明确条件，再分类讨论。",
+            "knowledge_points": [path],
+        }, ensure_ascii=False)) for path in KNOWLEDGE_PATHS]
+        latex = self.latex_pool(rng)
+        latex_idx = rng.integers(len(latex), size=n)
+        model_idx = weighted_choice(rng, MODEL_WEIGHTS, n)
+        image_keys = rng.integers(0, 2 ** 63, size=(n, 2), dtype=np.int64)
+        stamps = timestamps(self.problem_time)
+
+        def render(part):
+            return [
+                f"{first + i},{user},{k1:016x}{k2:016x}.jpg,{latex[li]},{analyses[path]},{difficulty},{KNOWLEDGE_PATHS[path]},{AI_MODELS[mi]},{stamps[i]}\n"
+                for i, user, (k1, k2), li, path, difficulty, mi in zip(
+                    range(part.start, part.stop), self.problem_user[part].tolist(), image_keys[part].tolist(), latex_idx[part].tolist(),
+                    self.problem_path[part].tolist(), self.problem_difficulty[part].tolist(), model_idx[part].tolist())
+            ]
+        self.copy("problems", ["id", "user_id", "image_path", "latex_content", "ai_analysis", "difficulty", "knowledge_path", "ai_model", "created_at"], chunked(n, render))
+
+    def learning_records(self):
+        """One SM-2 record per problem, in the state the review endpoints would have left it."""
+        rng = self.rng("learning_records")
+        first = self.next_id("learning_records")
+        n = len(self.problem_user)
+        difficulty = self.problem_difficulty
+        # Harder problems get fewer successful repetitions
+        repetitions = np.minimum(rng.exponential(1 / (0.25 + 0.08 * difficulty)).astype(int), 12)
+        ease = np.clip(rng.normal(2.5 - 0.05 * difficulty, 0.2), 1.3, 2.8)
+        interval = np.select([repetitions == 0, repetitions == 1, repetitions == 2], [0, 1, 6], 6 * ease ** np.maximum(repetitions - 2, 0))
+        interval = np.minimum(interval, 365).astype(int)
+        last_review = self.problem_time + rng.random(n) * (self.end - self.problem_time)
+        review = timestamps(last_review + interval * DAY)
+        mastery = np.select([repetitions >= 3, repetitions >= 1], [3, 2], 1)
+        mastery[rng.random(n) < 0.08] = 0 # never rated
+        created = timestamps(self.problem_time)
+        mastery_text = ["", "1", "2", "3"]
+        status_text = ["wrong", "wrong", "wrong", "correct"]
+
+        def render(part):
+            return [
+                f"{first + i},{user},{self.first_problem + i},{status_text[m]},{mastery_text[m]},{e:.2f},{iv},{rep},{review[i]},{created[i]}\n"
+                for i, user, m, e, iv, rep in zip(
+                    range(part.start, part.stop), self.problem_user[part].tolist(), mastery[part].tolist(),
+                    ease[part].tolist(), interval[part].tolist(), repetitions[part].tolist())
+            ]
+        self.copy("learning_records", ["id", "user_id", "problem_id", "status", "mastery_level", "ease_factor", "interval", "repetitions", "review_date", "created_at"], chunked(n, render))
+
+    def solution_attempts(self):
+        rng = self.rng("solution_attempts")
+        first = self.next_id("solution_attempts")
+        feedback = []
+        for score in range(0, 101, 5):
+            gaps = [] if score >= 85 else ["未说明取等条件"] if score >= 60 else ["未说明取等条件", "分类讨论不完整"]
+            errors = [] if score >= 70 else ["第二步化简时符号错误"]
+            feedback.append(csv_quote(json.dumps({
+                "score": score,
+                "logic_gaps": gaps,
+                "calculation_errors": errors,
+                "suggestions": "思路正确，注意书写规范。" if score >= 80 else "建议先写出定义域，再逐步化简并检验结果。",
+            }, ensure_ascii=False)))
+
+        # Most problems are never retried; some get several attempts with improving scores
+        problems = len(self.problem_user)
+        counts = np.where(rng.random(problems) < 0.7, 0, 1 + rng.exponential(1 / 0.9, problems).astype(int))
+        parent = np.repeat(np.arange(problems), counts)
+        starts = group_starts(counts)
+        attempt_no = np.arange(len(parent)) - starts
+        # Days between attempts; each attempt follows the previous one
+        gaps = rng.exponential(3 * DAY, len(parent))
+        elapsed = np.cumsum(gaps)
+        elapsed = elapsed - elapsed[starts] + gaps[starts]
+        created = np.minimum(self.problem_time[parent] + elapsed, self.end - 60)
+        score = np.minimum(20, np.repeat(rng.integers(4, 15, problems), counts) + attempt_no * rng.integers(0, 4, len(parent)))
+
+        order = np.argsort(created, kind="stable")
+        parent, created, score = parent[order], created[order], score[order]
+        image_keys = rng.integers(0, 2 ** 63, size=(len(parent), 2), dtype=np.int64)
+        stamps = timestamps(created)
+
+        def render(part):
+            return [
+                f"{first + i},{self.problem_user[p]},{self.first_problem + p},{k1:016x}{k2:016x}.jpg,{feedback[s]},{stamps[i]}\n"
+                for i, p, s, (k1, k2) in zip(range(part.start, part.stop), parent[part].tolist(), score[part].tolist(), image_keys[part].tolist())
+            ]
+        self.copy("solution_attempts", ["id", "user_id", "problem_id", "image_path", "feedback_json", "created_at"], chunked(len(parent), render))
+
+    def practice_problems(self):
+        rng = self.rng("practice_problems")
+        first = self.next_id("practice_problems")
+        problems = len(self.problem_user)
+        # A quarter of problems get 2-3 variations, from the bank or generated
+        counts = np.where(rng.random(problems) < 0.25, rng.integers(2, 4, problems), 0)
+        bank = rng.random(problems) < 0.4
+        parent = np.repeat(np.arange(problems), counts)
+        created = np.minimum(np.repeat(self.problem_time + rng.exponential(2 * DAY, problems), counts), self.end - 60)
+        order = np.argsort(created, kind="stable")
+        parent, created = parent[order], created[order]
+        n = len(parent)
+
+        analyses = [[csv_quote(json.dumps({
+            "topic": ["Problem Bank" if from_bank else "Generated Practice"],
+            "solution": "解：同原题方法。",
+            "thinking_process": "类比原题，注意参数变化。",
+            "answer": str(answer),
+            "knowledge_points": [path],
+        }, ensure_ascii=False)) for answer in range(1, 9) for from_bank in (False, True)] for path in KNOWLEDGE_PATHS]
+        latex = self.latex_pool(rng)
+        latex_idx = rng.integers(len(latex), size=n)
+        analysis_idx = rng.integers(8, size=n) * 2 + bank[parent]
+        model = np.where(bank[parent], len(AI_MODELS), weighted_choice(rng, MODEL_WEIGHTS, n))
+        models = AI_MODELS + ["Problem Bank"]
+        stamps = timestamps(created)
+
+        def render(part):
+            return [
+                f"{first + i},{self.problem_user[p]},{self.first_problem + p},{latex[li]},{self.problem_difficulty[p]},"
+                f"{KNOWLEDGE_PATHS[self.problem_path[p]]},{models[m]},{analyses[self.problem_path[p]][ai]},{stamps[i]}\n"
+                for i, p, li, ai, m in zip(range(part.start, part.stop), parent[part].tolist(), latex_idx[part].tolist(),
+                                           analysis_idx[part].tolist(), model[part].tolist())
+            ]
+        self.copy("practice_problems", ["id", "user_id", "source_problem_id", "latex_content", "difficulty", "knowledge_path", "ai_model", "ai_analysis", "created_at"], chunked(n, render))
+
+    def system_logs(self):
+        rng = self.rng("system_logs")
+        first = self.next_id("system_logs")
+        n = int(50000 * self.scale)
+        levels = list(LEVEL_WEIGHTS)
+        entries = [(level, category, message) for level in levels for category, message in LOG_MESSAGES[level]]
+        level_offset = np.cumsum([0] + [len(LOG_MESSAGES[level]) for level in levels[:-1]])
+        level_size = np.array([len(LOG_MESSAGES[level]) for level in levels])
+
+        # A handful of hour-long incidents (errors and fallbacks) account for a third of the volume
+        incidents = rng.uniform(self.start, self.end - 3600, max(1, int(8 * min(self.scale, 4))))
+        in_incident = rng.random(n) < 0.33
+        created = np.where(in_incident, incidents[rng.integers(len(incidents), size=n)] + rng.uniform(0, 3600, n), rng.uniform(self.start, self.end, n))
+        level = np.where(in_incident, np.where(rng.random(n) < 0.6, 0, 1), weighted_choice(rng, list(LEVEL_WEIGHTS.values()), n))
+        entry = level_offset[level] + (rng.random(n) * level_size[level]).astype(int)
+        model = weighted_choice(rng, MODEL_WEIGHTS, n)
+        order = np.argsort(created, kind="stable")
+        created, entry, model = created[order], entry[order], model[order]
+        stamps = timestamps(created)
+
+        rendered = []
+        for level_name, category, message in entries:
+            ai = category in AI_CATEGORIES
+            rendered.append([
+                f"{level_name},{category},{AI_MODELS[m] if ai else ''},{csv_quote(message)},"
+                + (csv_quote(json.dumps({"logger": f"mathrob.{category}", "primary": AI_MODELS[m]})) if ai else "")
+                for m in range(len(AI_MODELS))
+            ])
+
+        def render(part):
+            return [
+                f"{first + i},{rendered[e][m]},{stamps[i]}\n"
+                for i, e, m in zip(range(part.start, part.stop), entry[part].tolist(), model[part].tolist())
+            ]
+        self.copy("system_logs", ["id", "level", "category", "model", "message", "details", "created_at"], chunked(n, render))
+
+
+TABLES = ["users", "problems", "learning_records", "solution_attempts", "practice_problems", "system_logs"]
+
+# Referencing columns without an index; each deleted parent row would otherwise
+# make PostgreSQL's foreign key check scan the whole child table
+DELETE_HELPER_INDEXES = [
+    ("learning_records", "problem_id"), ("solution_attempts", "problem_id"), ("solution_attempts", "user_id"),
+    ("practice_problems", "source_problem_id"), ("practice_problems", "user_id"),
+    ("problems", "duplicate_of_id"), ("problems", "source_problem_id"), ("weekly_reports", "user_id"),
+]
+
+def delete_prefix(conn, prefix: str):
+    """Removes seeded users (and everything hanging off them) by username prefix."""
+    with conn.cursor() as cur:
+        for table, column in DELETE_HELPER_INDEXES:
+            cur.execute(f"CREATE INDEX tmp_seed_{table}_{column} ON {table} ({column})")
+        cur.execute("CREATE TEMP TABLE seeded_users AS SELECT id FROM users WHERE username LIKE %s", (prefix.replace("_", "\\_") + "%",))
+        for table in ("solution_attempts", "practice_problems", "learning_records", "weekly_reports", "problems"):
+            cur.execute(f"DELETE FROM {table} WHERE user_id IN (SELECT id FROM seeded_users)")
+            print(f"{table}: deleted {cur.rowcount:,}")
+        cur.execute("DELETE FROM users WHERE id IN (SELECT id FROM seeded_users)")
+        print(f"users: deleted {cur.rowcount:,}")
+        for table, column in DELETE_HELPER_INDEXES:
+            cur.execute(f"DROP INDEX tmp_seed_{table}_{column}")
+    conn.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scale", type=float, default=1.0, help="1.0 = 1,000 users / ~200k problems")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--days", type=int, default=180, help="Length of the simulated history")
+    parser.add_argument("--until", type=date.fromisoformat, default=datetime.utcnow().date(), help="End of the simulated history (UTC date)")
+    parser.add_argument("--prefix", default="seed_", help="Username prefix of generated users")
+    parser.add_argument("--skip", nargs="+", choices=TABLES[2:], default=[], help="Tables not to generate")
+    parser.add_argument("--bulk", action="store_true",
+                        help="Dedicated benchmark database only: rebuild secondary indexes after each table and skip FK checks (superuser)")
+    parser.add_argument("--delete-prefix", action="store_true", help="Delete the users with --prefix and their data, then exit")
+    args = parser.parse_args()
+
+    if engine.dialect.name != "postgresql":
+        print(f"PostgreSQL is required (COPY); DATABASE_URL points at {engine.dialect.name}")
+        sys.exit(1)
+    print(f"Database: {engine.url.render_as_string(hide_password=True)}")
+
+    conn = engine.raw_connection()
+    try:
+        if args.delete_prefix:
+            delete_prefix(conn, args.prefix)
+            return
+
+        Base.metadata.create_all(engine)
+        print(f"Scale {args.scale}, seed {args.seed}, {args.days} days of history until {args.until}\n")
+        print(f"{'table':<20} | {'rows':>10} | {'seconds':>7} | {'COPY rows/s':>11} | {'index s':>8}")
+        print("-" * 70)
+        with conn.cursor() as cur:
+            # Losing the last commits on a crash is fine for generated data
+            cur.execute("SET synchronous_commit = off")
+            if args.bulk:
+                cur.execute("SET maintenance_work_mem = '512MB'")
+                # Skips foreign key triggers (ids are generated consistently); needs superuser.
+                # Other triggers are switched to ENABLE ALWAYS around each COPY (see Seeder.copy)
+                cur.execute("SET session_replication_role = replica")
+        seeder = Seeder(conn, args.seed, args.scale, args.days, args.prefix, args.until, bulk=args.bulk)
+        for table in TABLES:
+            if table not in args.skip:
+                getattr(seeder, table)()
+
+        total_rows = sum(r[1] for r in seeder.results)
+        load_seconds = sum(r[2] for r in seeder.results)
+        total_seconds = sum(r[3] for r in seeder.results)
+        print("-" * 70)
+        print(f"{'total':<20} | {total_rows:>10,} | {total_seconds:>7.1f} | {total_rows / load_seconds:>11,.0f} | {total_seconds - load_seconds:>8.1f}")
+
+        # Fresh planner statistics, as after autovacuum has caught up in production
+        started = time.perf_counter()
+        with engine.connect() as analyze:
+            analyze.execution_options(isolation_level="AUTOCOMMIT")
+            for table in TABLES:
+                analyze.execute(text(f"ANALYZE {table}"))
+        print(f"\nANALYZE: {time.perf_counter() - started:.1f}s")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Copies the local artifact store into the configured storage backend, for
+switching an existing installation to STORAGE_BACKEND=s3. Run from the
+backend directory with the S3 settings in the environment:
+
+    STORAGE_BACKEND=s3 S3_BUCKET=... python copy_artifacts_to_backend.py [--dry-run] [--workers 8]
+
+Uploads, source documents and report PDFs are copied; files with their own
+expiry (resumable uploads, render caches, quarantine) are not. Objects that
+already exist with the same size are skipped, so the copy can be re-run (for
+example once more right before the switch) and only sends what is new.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from app.services.artifact_store import artifact_store
+from app.services.storage_backends import LocalBackend
+from app.services.storage_gc import SKIP_DIRS
+
+def copy(dry_run: bool, workers: int):
+    backend = artifact_store.backend
+    if not backend.remote:
+        raise SystemExit("STORAGE_BACKEND is local: nothing to copy to")
+    # The listing is of the local root regardless of the configured backend
+    files = [(name, size) for name, size, _ in LocalBackend(artifact_store.root).iter_files(skip=SKIP_DIRS)
+             if not name.endswith(".part")]
+    print(f"{len(files)} local files, {sum(size for _, size in files) / 1024 / 1024:.1f} MB")
+
+    def copy_one(item) -> str:
+        name, size = item
+        existing = backend.stat(name)
+        if existing and existing[0] == size:
+            return "skipped"
+        if not dry_run:
+            backend.put(artifact_store.path(name), name)
+        return "copied"
+
+    counts = {"copied": 0, "skipped": 0, "failed": 0}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(copy_one, item) for item in files]
+        for i, future in enumerate(futures, 1):
+            try:
+                counts[future.result()] += 1
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"Failed: {files[i - 1][0]}: {e}")
+            if i % 5000 == 0:
+                print(f"{i}/{len(files)}")
+    print(f"{counts['copied']} {'to copy' if dry_run else 'copied'}, {counts['skipped']} already present, {counts['failed']} failed")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy the local artifact store into the configured storage backend")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be copied")
+    parser.add_argument("--workers", type=int, default=8, help="Files uploaded in parallel")
+    args = parser.parse_args()
+    copy(args.dry_run, args.workers)
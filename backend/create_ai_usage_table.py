@@ -0,0 +1,42 @@
+from sqlalchemy import create_engine, text
+import os
+from dotenv import load_dotenv
+
+if os.path.exists("backend/.env"):
+    load_dotenv("backend/.env")
+else:
+    load_dotenv()
+
+db_url = os.getenv("DATABASE_URL")
+if not db_url:
+    print("DATABASE_URL not found in .env")
+    exit(1)
+
+print(f"Connecting to database...")
+engine = create_engine(db_url)
+
+create_table_sql = """
+CREATE TABLE IF NOT EXISTS ai_usage_hourly (
+    id SERIAL PRIMARY KEY,
+    hour TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    user_id INTEGER NOT NULL DEFAULT 0,
+    category VARCHAR(20) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    calls INTEGER NOT NULL DEFAULT 0,
+    failures INTEGER NOT NULL DEFAULT 0,
+    images INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens BIGINT NOT NULL DEFAULT 0,
+    candidate_tokens BIGINT NOT NULL DEFAULT 0,
+    latency_ms BIGINT NOT NULL DEFAULT 0,
+    CONSTRAINT uq_ai_usage_hourly_bucket UNIQUE (hour, user_id, category, model)
+);
+CREATE INDEX IF NOT EXISTS ix_ai_usage_hourly_id ON ai_usage_hourly (id);
+CREATE INDEX IF NOT EXISTS ix_ai_usage_hourly_user_hour ON ai_usage_hourly (user_id, hour);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS ai_daily_token_quota INTEGER;
+"""
+
+with engine.connect() as conn:
+    conn.execution_options(isolation_level="AUTOCOMMIT")
+    print("Creating ai_usage_hourly table...")
+    conn.execute(text(create_table_sql))
+    print("Table created (if not exists).")
@@ -0,0 +1,38 @@
+from sqlalchemy import create_engine, text
+import os
+from dotenv import load_dotenv
+
+if os.path.exists("backend/.env"):
+    load_dotenv("backend/.env")
+else:
+    load_dotenv()
+    
+db_url = os.getenv("DATABASE_URL")
+if not db_url:
+    print("DATABASE_URL not found in .env")
+    exit(1)
+
+print(f"Connecting to database...")
+engine = create_engine(db_url)
+
+create_table_sql = """
+CREATE TABLE IF NOT EXISTS problem_embeddings (
+    id SERIAL PRIMARY KEY,
+    source_type VARCHAR(10) NOT NULL,
+    source_id INTEGER NOT NULL,
+    knowledge_path VARCHAR,
+    model VARCHAR NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BYTEA NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT (now() at time zone 'utc'),
+    CONSTRAINT uq_problem_embeddings_source UNIQUE (source_type, source_id)
+);
+CREATE INDEX IF NOT EXISTS ix_problem_embeddings_id ON problem_embeddings (id);
+CREATE INDEX IF NOT EXISTS ix_problem_embeddings_path_id ON problem_embeddings (knowledge_path, id);
+"""
+
+with engine.connect() as conn:
+    conn.execution_options(isolation_level="AUTOCOMMIT")
+    print("Creating problem_embeddings table...")
+    conn.execute(text(create_table_sql))
+    print("Table created (if not exists).")
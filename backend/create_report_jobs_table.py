@@ -0,0 +1,49 @@
+from sqlalchemy import create_engine, text
+import os
+from dotenv import load_dotenv
+
+if os.path.exists("backend/.env"):
+    load_dotenv("backend/.env")
+else:
+    load_dotenv()
+    
+db_url = os.getenv("DATABASE_URL")
+if not db_url:
+    print("DATABASE_URL not found in .env")
+    exit(1)
+
+print(f"Connecting to database...")
+engine = create_engine(db_url)
+
+statements = [
+    """
+    CREATE TABLE IF NOT EXISTS report_jobs (
+        id VARCHAR(32) PRIMARY KEY,
+        kind VARCHAR(20) NOT NULL,
+        user_id INTEGER,
+        class_name VARCHAR,
+        week_start DATE NOT NULL,
+        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+        total INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        skipped INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        report_ids JSON,
+        summary_path VARCHAR,
+        errors JSON,
+        created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT (now() at time zone 'utc'),
+        updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT (now() at time zone 'utc'),
+        finished_at TIMESTAMP WITHOUT TIME ZONE
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_report_jobs_user_week ON report_jobs (user_id, week_start)",
+    "CREATE INDEX IF NOT EXISTS ix_report_jobs_updated_at ON report_jobs (updated_at)",
+]
+
+with engine.connect() as conn:
+    conn.execution_options(isolation_level="AUTOCOMMIT")
+    print("Creating report_jobs table...")
+    for i, stmt in enumerate(statements, 1):
+        print(f"Executing step {i}...")
+        conn.execute(text(stmt))
+    print("Migration complete.")
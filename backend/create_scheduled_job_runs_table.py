@@ -0,0 +1,35 @@
+from sqlalchemy import create_engine, text
+import os
+from dotenv import load_dotenv
+
+if os.path.exists("backend/.env"):
+    load_dotenv("backend/.env")
+else:
+    load_dotenv()
+    
+db_url = os.getenv("DATABASE_URL")
+if not db_url:
+    print("DATABASE_URL not found in .env")
+    exit(1)
+
+print(f"Connecting to database...")
+engine = create_engine(db_url)
+
+statements = [
+    """
+    CREATE TABLE IF NOT EXISTS scheduled_job_runs (
+        name VARCHAR(64) PRIMARY KEY,
+        last_run TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        claimed_by VARCHAR,
+        updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT (now() at time zone 'utc')
+    )
+    """,
+]
+
+with engine.connect() as conn:
+    conn.execution_options(isolation_level="AUTOCOMMIT")
+    print("Creating scheduled_job_runs table...")
+    for i, stmt in enumerate(statements, 1):
+        print(f"Executing step {i}...")
+        conn.execute(text(stmt))
+    print("Migration complete.")
@@ -0,0 +1,47 @@
+from sqlalchemy import create_engine, text
+import os
+from dotenv import load_dotenv
+
+if os.path.exists("backend/.env"):
+    load_dotenv("backend/.env")
+else:
+    load_dotenv()
+    
+db_url = os.getenv("DATABASE_URL")
+if not db_url:
+    print("DATABASE_URL not found in .env")
+    exit(1)
+
+print(f"Connecting to database...")
+engine = create_engine(db_url)
+
+statements = [
+    """
+    CREATE TABLE IF NOT EXISTS source_documents (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        content_hash VARCHAR(64) NOT NULL,
+        file_path VARCHAR NOT NULL,
+        filename VARCHAR(255),
+        page_count INTEGER NOT NULL DEFAULT 0,
+        status VARCHAR(20) NOT NULL DEFAULT 'processing',
+        regions JSON,
+        created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT (now() at time zone 'utc'),
+        updated_at TIMESTAMP WITHOUT TIME ZONE DEFAULT (now() at time zone 'utc'),
+        CONSTRAINT uq_source_documents_user_hash UNIQUE (user_id, content_hash)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_source_documents_id ON source_documents (id)",
+    "CREATE INDEX IF NOT EXISTS ix_source_documents_content_hash ON source_documents (content_hash)",
+    "ALTER TABLE problems ADD COLUMN IF NOT EXISTS source_document_id INTEGER REFERENCES source_documents(id)",
+    "ALTER TABLE problems ADD COLUMN IF NOT EXISTS source_page INTEGER",
+    "CREATE INDEX IF NOT EXISTS ix_problems_source_document_id ON problems (source_document_id)",
+]
+
+with engine.connect() as conn:
+    conn.execution_options(isolation_level="AUTOCOMMIT")
+    print("Creating source_documents table...")
+    for i, stmt in enumerate(statements, 1):
+        print(f"Executing step {i}...")
+        conn.execute(text(stmt))
+    print("Migration complete.")
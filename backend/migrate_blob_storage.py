@@ -0,0 +1,147 @@
+"""
+Moves existing uploads into sharded content-addressed blob storage and
+rewrites the stored paths in bulk. Run from the backend directory:
+
+    python migrate_blob_storage.py [--dry-run] [--keep-old] [--workers 8]
+
+Every image_path / file_path that is not already a blob name (uuid4 names,
+solution_<id>_<ts>_<filename>, flat <sha256>.<ext> names, "./backend/uploads/..."
+paths) is resolved in the artifact store, hashed and hard-linked (or copied)
+to blobs/ab/cd/<sha256>.<ext>; identical files end up as one blob. The
+database is then rewritten with one UPDATE ... FROM per table against a
+temporary old -> new mapping, blob_refs is recounted, and only after the
+commit are the old files removed (unless --keep-old). Rows whose file is
+missing are left as they are. Safe to re-run. With STORAGE_BACKEND=s3 the
+blobs are also uploaded to the bucket.
+"""
+import argparse
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+from sqlalchemy import text
+from app.database import SessionLocal, engine
+from app.models import BlobRef, SourceDocument
+from app.services.artifact_store import artifact_store, blob_name, safe_extension, BLOB_DIR, CHUNK_SIZE
+from app.services.upload_ingest import sniff_image, IMAGE_FORMATS
+from app.services.blob_refs import BLOB_COLUMNS, rebuild_blob_refs
+
+BATCH_SIZE = 1000
+
+def _hash_file(path: str) -> Tuple[str, str]:
+    """(sha256 hex, extension from the content, else from the name)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        head = f.read(CHUNK_SIZE)
+        digest.update(head)
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    sniffed = sniff_image(head[:16])
+    if sniffed:
+        ext = IMAGE_FORMATS[sniffed]
+    elif head.startswith(b"%PDF-"):
+        ext = "pdf"
+    else:
+        ext = safe_extension(path, default="bin")
+    return digest.hexdigest(), ext
+
+def _place(source: str, name: str):
+    target = artifact_store.path(name)
+    if os.path.exists(target):
+        return
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        # Different filesystem, or links not supported
+        tmp = target + ".part"
+        shutil.copy2(source, tmp)
+        os.replace(tmp, target)
+    if artifact_store.backend.remote:
+        artifact_store.publish(name)
+
+def migrate(dry_run: bool, keep_old: bool, workers: int):
+    if not dry_run:
+        BlobRef.__table__.create(engine, checkfirst=True)
+    db = SessionLocal()
+    try:
+        # 1. Every stored path that is not a blob yet
+        paths = set()
+        for model, attribute in BLOB_COLUMNS:
+            column = getattr(model, attribute)
+            paths.update(row[0] for row in db.query(column).filter(column.isnot(None)).distinct())
+        documents = db.query(SourceDocument).filter(SourceDocument.regions.isnot(None)).all()
+        for document in documents:
+            paths.update(r["image_path"] for r in document.regions if r.get("image_path"))
+        pending = sorted(p for p in paths if not p.startswith(BLOB_DIR + "/"))
+        print(f"{len(paths)} distinct stored paths, {len(pending)} to migrate")
+
+        # 2. Hash (in parallel: mostly I/O) and place the blobs
+        def resolve_and_hash(old: str) -> Tuple[str, Optional[str], Optional[Tuple[str, str]]]:
+            source = artifact_store.resolve(old)
+            return old, source, _hash_file(source) if source else None
+
+        mapping: Dict[str, str] = {}
+        sources: Dict[str, str] = {}
+        missing = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for i, (old, source, hashed) in enumerate(pool.map(resolve_and_hash, pending), 1):
+                if not hashed:
+                    missing += 1
+                    continue
+                name = blob_name(*hashed)
+                if not dry_run:
+                    _place(source, name)
+                mapping[old] = name
+                sources[old] = source
+                if i % 5000 == 0:
+                    print(f"Hashed {i}/{len(pending)}")
+        print(f"{len(mapping)} files -> {len(set(mapping.values()))} blobs ({missing} missing, left unchanged)")
+        if dry_run or not mapping:
+            print("Dry run, nothing changed." if dry_run else "Nothing to rewrite.")
+            return
+
+        # 3. Rewrite all paths in one transaction: load the mapping, then one UPDATE per column
+        db.execute(text("CREATE TEMPORARY TABLE blob_path_map (old_path VARCHAR PRIMARY KEY, new_path VARCHAR NOT NULL)"))
+        items = [{"old": old, "new": new} for old, new in mapping.items()]
+        for start in range(0, len(items), BATCH_SIZE):
+            db.execute(text("INSERT INTO blob_path_map (old_path, new_path) VALUES (:old, :new)"), items[start:start + BATCH_SIZE])
+        for model, attribute in BLOB_COLUMNS:
+            table = model.__tablename__
+            result = db.execute(text(
+                f"UPDATE {table} SET {attribute} = m.new_path FROM blob_path_map m WHERE {table}.{attribute} = m.old_path"
+            ))
+            print(f"{table}.{attribute}: {result.rowcount} rows rewritten")
+        for document in documents:
+            document.regions = [
+                {**r, "image_path": mapping.get(r.get("image_path"), r.get("image_path"))} for r in document.regions
+            ]
+        db.execute(text("DROP TABLE blob_path_map"))
+        db.commit()
+
+        # 4. Recount references now that the paths are final
+        rebuild_blob_refs(db)
+    finally:
+        db.close()
+
+    if not keep_old:
+        removed = 0
+        for old, source in sources.items():
+            if os.path.abspath(source) != artifact_store.path(mapping[old]) and os.path.exists(source):
+                os.remove(source)
+                removed += 1
+        print(f"Removed {removed} old files")
+
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move uploads into sharded content-addressed blob storage")
+    parser.add_argument("--dry-run", action="store_true", help="Hash and report only; no files or rows are changed")
+    parser.add_argument("--keep-old", action="store_true", help="Leave the original files in place")
+    parser.add_argument("--workers", type=int, default=8, help="Files hashed in parallel")
+    args = parser.parse_args()
+    migrate(args.dry_run, args.keep_old, args.workers)
@@ -0,0 +1,38 @@
+"""
+Runs the artifact store garbage collector once (see app/services/storage_gc.py).
+Run from the backend directory:
+
+    python run_storage_gc.py --dry-run
+    python run_storage_gc.py [--mode quarantine|delete] [--grace-hours 24] [--scan-rate 5000] [--delete-rate 100] [--force]
+    python run_storage_gc.py --released [--dry-run]
+
+--force      collect even when most files look unreferenced (e.g. after deleting many users)
+--released   only blobs whose reference count dropped to 0, without a mark and sweep
+"""
+import argparse
+import json
+from app.services.storage_gc import storage_gc
+from datetime import timedelta
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect unreferenced files in the artifact store")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be collected")
+    parser.add_argument("--mode", choices=["quarantine", "delete"], help="Default: STORAGE_GC_MODE (quarantine)")
+    parser.add_argument("--grace-hours", type=float, help="Keep unreferenced files younger than this")
+    parser.add_argument("--scan-rate", type=float, help="Files listed per second (0: unlimited)")
+    parser.add_argument("--delete-rate", type=float, help="Files collected per second (0: unlimited)")
+    parser.add_argument("--force", action="store_true", help="Skip the STORAGE_GC_MAX_FRACTION safety check")
+    parser.add_argument("--released", action="store_true", help="Only collect blobs whose reference count dropped to 0")
+    args = parser.parse_args()
+
+    if args.grace_hours is not None:
+        storage_gc.grace = timedelta(hours=args.grace_hours)
+    if args.scan_rate is not None:
+        storage_gc.scan_rate = args.scan_rate
+    if args.delete_rate is not None:
+        storage_gc.delete_rate = args.delete_rate
+    if args.released:
+        stats = storage_gc.collect_released(dry_run=args.dry_run, mode=args.mode)
+    else:
+        stats = storage_gc.run(dry_run=args.dry_run, mode=args.mode, force=args.force)
+    print(json.dumps(stats.to_dict(), indent=2, default=str))
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing app modules connects to the database and creates the module-level
+# stores: never let that reach a real database or backend/uploads
+_scratch = tempfile.mkdtemp(prefix="mathrob-test-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'test.db')}"
+os.environ["ARTIFACT_ROOT"] = os.path.join(_scratch, "artifacts")
+os.environ["STORAGE_BACKEND"] = "local"
@@ -0,0 +1,30 @@
+"""Which names the unauthenticated /static route may serve."""
+import pytest
+
+from app.services.artifact_store import blob_name, is_public_name
+
+DIGEST = "ab" * 32
+
+@pytest.mark.parametrize("name", [
+    blob_name(DIGEST, "jpg"),
+    f"{DIGEST}.png",
+    "3f2b8c1e-0d4a-4c1b-9a57-2f6e1d0c9b8a.jpg",
+])
+def test_uploads_are_public(name):
+    assert is_public_name(name)
+
+@pytest.mark.parametrize("name", [
+    "reports/class_report_7A_2026-10-12.pdf",
+    "reports/weekly_report_1_2026-10-12.pdf",
+    f"reports/thumbs/{DIGEST}.png",
+    f"latex_cache/{DIGEST}.png",
+    "resumable/0123456789abcdef.part",
+    "resumable/0123456789abcdef.json",
+    f"blobs/cd/ef/{DIGEST}.jpg", # shard does not match the hash
+    f"blobs/ab/ab/{DIGEST}.jpg/../../../reports/x.pdf",
+    "../backend/.env",
+    ".env",
+    "",
+])
+def test_other_files_are_not(name):
+    assert not is_public_name(name)
@@ -0,0 +1,19 @@
+"""PDF rendering of reports with text that reportlab would read as markup."""
+import pytest
+
+from app.services.report_render import render_student_report
+
+@pytest.mark.parametrize("student", ["A<b>B", "Li </para>", "Tom & Jerry"])
+def test_student_name_is_escaped(student, tmp_path):
+    path = tmp_path / "report.pdf"
+    render_student_report(str(path), {
+        "student": student,
+        "start": "2026-10-12",
+        "end": "2026-10-18",
+        "uploaded": 0,
+        "reviews": 0,
+        "mastery": {},
+        "thumb_dir": str(tmp_path / "thumbs"),
+        "problems": [],
+    })
+    assert path.read_bytes().startswith(b"%PDF")
@@ -0,0 +1,121 @@
+"""S3Backend and ArtifactStore against an in-process S3 (moto server)."""
+import os
+import socket
+import time
+import urllib.request
+import pytest
+
+pytest.importorskip("boto3")
+moto_server = pytest.importorskip("moto.server")
+
+from app.services.artifact_store import ArtifactStore
+from app.services.storage_backends import S3Backend, StorageBackend
+
+BUCKET = "mathrob-test"
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    port = _free_port()
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    yield f"http://127.0.0.1:{port}"
+    server.stop()
+
+@pytest.fixture
+def backend(s3_endpoint, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("S3_REGION", "us-east-1")
+    monkeypatch.setenv("S3_ENDPOINT_URL", s3_endpoint)
+    monkeypatch.setenv("S3_BUCKET", BUCKET)
+    monkeypatch.setenv("S3_PREFIX", "store")
+    monkeypatch.setenv("S3_ADDRESSING_STYLE", "path")
+    backend = S3Backend()
+    backend.client.create_bucket(Bucket=BUCKET)
+    yield backend
+    backend.delete_prefix("")
+    backend.client.delete_bucket(Bucket=BUCKET)
+
+def _write(path: str, data: bytes) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        StorageBackend()
+
+    class Partial(StorageBackend):
+        def put(self, local_path, name):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
+
+def test_put_fetch_stat(backend, tmp_path):
+    source = _write(str(tmp_path / "source.jpg"), b"photo bytes")
+    before = time.time()
+    backend.put(source, "blobs/ab/cd/abcd.jpg")
+
+    size, modified = backend.stat("blobs/ab/cd/abcd.jpg")
+    assert size == len(b"photo bytes")
+    assert modified >= before - 5
+    assert backend.exists("blobs/ab/cd/abcd.jpg")
+    assert backend.stat("blobs/ab/cd/missing.jpg") is None
+
+    target = tmp_path / "copy" / "abcd.jpg"
+    assert backend.fetch("blobs/ab/cd/abcd.jpg", str(target))
+    assert target.read_bytes() == b"photo bytes"
+    assert not backend.fetch("blobs/ab/cd/missing.jpg", str(tmp_path / "missing.jpg"))
+    assert not (tmp_path / "missing.jpg").exists()
+    # No partial downloads left behind
+    assert os.listdir(tmp_path / "copy") == ["abcd.jpg"]
+
+def test_iter_files(backend, tmp_path):
+    source = _write(str(tmp_path / "source"), b"12345")
+    for name in ("blobs/aa/bb/one.jpg", "blobs/cc/dd/two.png", "reports/r1.pdf", "render_cache/x.png"):
+        backend.put(source, name)
+
+    assert sorted(name for name, _, _ in backend.iter_files("blobs")) == ["blobs/aa/bb/one.jpg", "blobs/cc/dd/two.png"]
+    everything = {name: size for name, size, _ in backend.iter_files(skip=["render_cache"])}
+    assert everything == {"blobs/aa/bb/one.jpg": 5, "blobs/cc/dd/two.png": 5, "reports/r1.pdf": 5}
+    assert sorted(backend.subdirectories("blobs")) == ["aa", "cc"]
+
+    backend.delete_prefix("blobs")
+    assert list(backend.iter_files("blobs")) == []
+    assert [name for name, _, _ in backend.iter_files()] == ["render_cache/x.png", "reports/r1.pdf"]
+
+def test_presigned_url(backend, tmp_path):
+    source = _write(str(tmp_path / "report.pdf"), b"%PDF-1.4 report")
+    backend.put(source, "reports/r1.pdf")
+
+    url = backend.presigned_url("reports/r1.pdf", media_type="application/pdf", filename="report.pdf")
+    assert url.startswith(os.environ["S3_ENDPOINT_URL"] + f"/{BUCKET}/store/reports/r1.pdf?")
+    with urllib.request.urlopen(url) as response:
+        assert response.read() == b"%PDF-1.4 report"
+        assert response.headers["Content-Type"] == "application/pdf"
+        assert 'filename="report.pdf"' in response.headers["Content-Disposition"]
+
+def test_resolve_fetches_evicted_working_copy(backend, tmp_path):
+    store = ArtifactStore(root=str(tmp_path / "node"), backend=backend)
+    _write(store.path("reports/r1.pdf"), b"%PDF-1.4 report")
+    store.publish("reports/r1.pdf")
+
+    store.evict("reports/r1.pdf")
+    assert not os.path.exists(store.path("reports/r1.pdf"))
+
+    resolved = store.resolve("reports/r1.pdf")
+    assert resolved == store.path("reports/r1.pdf")
+    with open(resolved, "rb") as f:
+        assert f.read() == b"%PDF-1.4 report"
+
+    # Another node's store finds it too, under the legacy stored path
+    other = ArtifactStore(root=str(tmp_path / "other"), backend=backend)
+    assert other.resolve("./backend/uploads/reports/r1.pdf") == other.path("reports/r1.pdf")
+    assert other.resolve("reports/missing.pdf") is None
@@ -0,0 +1,96 @@
+"""Reference counts (services/blob_refs) and the storage GC pass that collects released blobs."""
+import os
+import time
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import update
+
+from app.database import Base, SessionLocal, engine
+from app.models import BlobRef, Problem, SourceDocument, User
+from app.services.artifact_store import artifact_store, blob_name
+from app.services.blob_refs import rebuild_blob_refs, track_blob_references
+from app.services.storage_gc import storage_gc
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(engine)
+    track_blob_references()
+    session = SessionLocal()
+    yield session
+    session.close()
+    Base.metadata.drop_all(engine)
+
+def _blob(char: str, age_days: float = 3) -> str:
+    name = blob_name(char * 64, "jpg")
+    path = artifact_store.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"0123456789")
+    mtime = time.time() - age_days * 86400
+    os.utime(path, (mtime, mtime))
+    return name
+
+def _counts(db):
+    return {ref.name: ref.refcount for ref in db.query(BlobRef)}
+
+def _release_all(db):
+    """Pretends every count changed before the grace period."""
+    db.execute(update(BlobRef).values(updated_at=datetime.utcnow() - storage_gc.grace - timedelta(hours=1)))
+    db.commit()
+
+def test_counts_follow_rows_and_regions(db):
+    photo, region = _blob("a"), _blob("b")
+    user = User(username="student", hashed_password="x")
+    db.add(user)
+    db.commit()
+    problem = Problem(image_path=photo)
+    document = SourceDocument(user_id=user.id, content_hash="c" * 64, file_path=_blob("c"), regions=[{"image_path": region}])
+    db.add_all([problem, document])
+    db.commit()
+    assert _counts(db) == {photo: 1, region: 1, document.file_path: 1}
+
+    # Reassigned after the commit expired it: the old value still has to be released
+    document.regions = [{"image_path": photo}, {"image_path": None}]
+    problem.image_path = region
+    db.commit()
+    assert _counts(db) == {photo: 1, region: 1, document.file_path: 1}
+
+    db.delete(document)
+    db.commit()
+    assert _counts(db) == {photo: 0, region: 1, document.file_path: 0}
+    assert rebuild_blob_refs(db) == 1
+    assert _counts(db) == {region: 1}
+
+def test_collect_released(db):
+    released, recent, miscounted, kept = _blob("a"), _blob("b"), _blob("c"), _blob("d")
+    problems = [Problem(image_path=name) for name in (released, recent, miscounted, kept)]
+    db.add_all(problems)
+    db.commit()
+    db.delete(problems[0])
+    db.delete(problems[1])
+    db.commit()
+    # As a bulk statement would leave it
+    db.execute(update(BlobRef).where(BlobRef.name == miscounted).values(refcount=0))
+    db.commit()
+    _release_all(db)
+    os.utime(artifact_store.path(recent)) # uploaded again since
+
+    stats = storage_gc.collect_released(mode="delete")
+    assert (stats.collected, stats.recent, stats.referenced, stats.full) == (1, 1, 1, False)
+    assert not os.path.exists(artifact_store.path(released))
+    for name in (recent, miscounted, kept):
+        assert os.path.exists(artifact_store.path(name))
+    assert released not in _counts(db)
+
+def test_collect_released_dry_run(db):
+    name = _blob("e")
+    problem = Problem(image_path=name)
+    db.add(problem)
+    db.commit()
+    db.delete(problem)
+    db.commit()
+    _release_all(db)
+
+    stats = storage_gc.collect_released(dry_run=True)
+    assert (stats.collected, stats.collected_bytes) == (1, 10)
+    assert os.path.exists(artifact_store.path(name))
@@ -45,6 +45,18 @@ export default function ReportsPage() {
                 method: 'POST'
             });
             if (res.ok) {
+                // Generation runs in the background; poll the job until it finishes
+                const job = await res.json();
+                let status = job.status;
+                while (status === 'pending' || status === 'running') {
+                    await new Promise((resolve) => setTimeout(resolve, 1000));
+                    const jobRes = await fetchWithAuth(`/api/reports/jobs/${job.id}`);
+                    if (!jobRes.ok) break;
+                    status = (await jobRes.json()).status;
+                }
+                if (status === 'failed') {
+                    alert("Failed to generate report");
+                }
                 await fetchReports(); // Refresh list
             } else {
                 alert("Failed to generate report");
@@ -11,6 +11,8 @@ interface User {
     username: string;
     name: string;
     is_admin: boolean;
+    class_name: string | null;
+    ai_daily_token_quota: number | null;
 }
 
 export default function UsersPage() {
@@ -26,7 +28,9 @@ export default function UsersPage() {
         username: '',
         name: '',
         password: '',
-        is_admin: false
+        is_admin: false,
+        class_name: '',
+        ai_daily_token_quota: ''
     });
 
     useEffect(() => {
@@ -68,6 +72,8 @@ export default function UsersPage() {
             if (editingUser && !body.password) {
                 delete body.password;
             }
+            // Empty quota: use the server default
+            body.ai_daily_token_quota = formData.ai_daily_token_quota === '' ? null : Number(formData.ai_daily_token_quota);
 
             const res = await fetchWithAuth(url, {
                 method,
@@ -112,7 +118,9 @@ export default function UsersPage() {
             username: user.username,
             name: user.name || '',
             password: '',
-            is_admin: user.is_admin
+            is_admin: user.is_admin,
+            class_name: user.class_name || '',
+            ai_daily_token_quota: user.ai_daily_token_quota == null ? '' : String(user.ai_daily_token_quota)
         });
         setIsModalOpen(true);
     };
@@ -123,7 +131,9 @@ export default function UsersPage() {
             username: '',
             name: '',
             password: '',
-            is_admin: false
+            is_admin: false,
+            class_name: '',
+            ai_daily_token_quota: ''
         });
     };
 
@@ -148,6 +158,7 @@ export default function UsersPage() {
                         <tr>
                             <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Username</th>
                             <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Name</th>
+                            <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Class</th>
                             <th className="px-6 py-3 text-left text-xs font-medium text-gray-500 uppercase tracking-wider">Role</th>
                             <th className="px-6 py-3 text-right text-xs font-medium text-gray-500 uppercase tracking-wider">Actions</th>
                         </tr>
@@ -157,6 +168,7 @@ export default function UsersPage() {
                             <tr key={user.id}>
                                 <td className="px-6 py-4 whitespace-nowrap text-sm font-medium text-gray-900">{user.username}</td>
                                 <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-500">{user.name}</td>
+                                <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-500">{user.class_name}</td>
                                 <td className="px-6 py-4 whitespace-nowrap text-sm text-gray-500">
                                     <span className={`px-2 inline-flex text-xs leading-5 font-semibold rounded-full ${user.is_admin ? 'bg-green-100 text-green-800' : 'bg-gray-100 text-gray-800'
                                         }`}>
@@ -208,6 +220,27 @@ export default function UsersPage() {
                                     onChange={e => setFormData({ ...formData, name: e.target.value })}
                                 />
                             </div>
+                            <div>
+                                <label className="block text-sm font-medium text-gray-700">Class</label>
+                                <input
+                                    type="text"
+                                    placeholder="e.g. 7A"
+                                    className="mt-1 block w-full rounded-md border border-gray-300 px-3 py-2 shadow-sm focus:border-indigo-500 focus:outline-none focus:ring-indigo-500"
+                                    value={formData.class_name}
+                                    onChange={e => setFormData({ ...formData, class_name: e.target.value })}
+                                />
+                            </div>
+                            <div>
+                                <label className="block text-sm font-medium text-gray-700">Daily AI Token Quota</label>
+                                <input
+                                    type="number"
+                                    min="0"
+                                    placeholder="Default (0 = unlimited)"
+                                    className="mt-1 block w-full rounded-md border border-gray-300 px-3 py-2 shadow-sm focus:border-indigo-500 focus:outline-none focus:ring-indigo-500"
+                                    value={formData.ai_daily_token_quota}
+                                    onChange={e => setFormData({ ...formData, ai_daily_token_quota: e.target.value })}
+                                />
+                            </div>
                             <div>
                                 <label className="block text-sm font-medium text-gray-700">
                                     Password {editingUser && '(Leave empty to keep unchanged)'}